@@ -1,9 +1,27 @@
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, jsonify, Response
 import os
 from dotenv import load_dotenv
 import re
 import requests
 from datetime import datetime
+import csv
+import hashlib
+import io
+import json
+import numpy as np
+from fanout import Fanout, run_all
+from deadline import Deadline, DeadlineExceeded, OPTIONAL_BUDGET
+from upstream import http_get, http_post, upstream_stats, TOMTOM_BASE_URL, OPENWEATHER_BASE_URL
+from geocache import GeocodeCache
+from route_cache import RouteCache, snap_coords
+from poi_index import POIIndex, PartialCell
+from weather_cache import WeatherCache
+from multistop import PairDistanceCache, build_matrix, solve_trips, trip_legs
+from polyline import route_points, simplify, encode, compact_route, POLYLINE_PRECISION
+from costing import (
+    FUEL_PRICES, FUEL_CONSUMPTION, VEHICLE_CAPACITY, COMBINATIONS, COST_PER_KM, validate_vehicle_fuel_combination, calculate_costs,
+    iter_json_shipments, iter_csv_shipments, parse_shipment, allowed_mask, price_shipments
+)
 
 app = Flask(__name__)
 
@@ -12,143 +30,134 @@ load_dotenv()
 
 
 
-# Constants
-FUEL_PRICES = {
-    "petrol": 100.80,
-    "diesel": 92.39,
-    "cng": 90.50
-}
+# Geocoding results persist locally; GEOCODE_PRELOAD_CSV seeds known depots at startup
+geocode_cache = GeocodeCache()
+if os.getenv('GEOCODE_PRELOAD_CSV'):
+    geocode_cache.preload_csv(os.getenv('GEOCODE_PRELOAD_CSV'))
 
-FUEL_CONSUMPTION = {
-    "truck": {"diesel": 0.35, "cng": 0.40,"petrol":0.30},
-    "van": {"diesel": 0.20, "petrol": 0.25, "cng": 0.25},
-    "car": {"petrol": 0.10, "diesel": 0.08, "cng": 0.12}
-}
+# Recent routes per lane, served stale while refreshing once their traffic data ages
+route_cache = RouteCache()
 
-MAINTENANCE_COST = {
-    "truck": 5.0,
-    "van": 3.0,
-    "car": 2.0
-}
+# All POI categories for a grid cell come from one nearby search and are kept for a day
+poi_index = POIIndex()
+POI_CELL_LIMIT = int(os.getenv('POI_CELL_LIMIT', '100'))
+# Full cells per POI lookup whose combined search is redone one category at a time
+POI_SPLIT_CELLS = int(os.getenv('POI_SPLIT_CELLS', '2'))
 
-def validate_vehicle_fuel_combination(vehicle, fuel):
-    if fuel not in FUEL_CONSUMPTION[vehicle]:
-        available_fuels = ", ".join(FUEL_CONSUMPTION[vehicle].keys())
-        raise ValueError(f"Invalid fuel for {vehicle}. Choose: {available_fuels}")
+# Stop-to-stop road distances for the multi-stop optimizer, kept across restarts
+pair_cache = PairDistanceCache()
 
-def calculate_costs(vehicle, fuel, distance):
-    fuel_consumption = FUEL_CONSUMPTION[vehicle][fuel]
-    fuel_price = FUEL_PRICES[fuel]
-    
-    fuel_cost_km = fuel_consumption * fuel_price
-    maintenance_km = MAINTENANCE_COST[vehicle]
-    
-    return {
-        "per_km": {
-            "fuel": round(fuel_cost_km, 2),
-            "maintenance": maintenance_km,
-            "total": round(fuel_cost_km + maintenance_km, 2)
-        },
-        "total": {
-            "fuel": round(fuel_cost_km * distance, 2),
-            "maintenance": round(maintenance_km * distance, 2),
-            "total": round((fuel_cost_km + maintenance_km) * distance, 2)
-        }
-    }
+# Current weather per grid cell; the busiest cells are refreshed in the background
+weather_cache = WeatherCache(lambda lat, lon: get_weather_data(lat, lon, os.getenv("WEATHER_API_KEY")))
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     form_data = request.form.to_dict() if request.method == 'POST' else {}
     return render_template('index.html', form_data=form_data)
 
-def get_tomtom_distance(start_coords, end_coords, api_key):
-    """Get route distance using TomTom API with proper coordinate formatting"""
+ROUTE_TYPES = [
+    {"type": "fastest", "color": "red", "params": {"routeType": "fastest", "travelMode": "truck"}},
+    {"type": "eco", "color": "green", "params": {"routeType": "eco", "travelMode": "truck"}},
+]
+
+def request_route(start_coords, end_coords, route_type, api_key):
+    """Request one route type between two 'lat,lon' points from TomTom"""
     formatted_coords = f"{start_coords.replace(' ', '')}:{end_coords.replace(' ', '')}"
-    url = f"https://api.tomtom.com/routing/1/calculateRoute/{formatted_coords}/json"
+    base_url = f"{TOMTOM_BASE_URL}/routing/1/calculateRoute/{formatted_coords}/json"
     params = {
         'key': api_key,
         'traffic': 'true',
-        'routeType': 'fastest',
-        'travelMode': 'truck',
-        'avoid': 'unpavedRoads'
+        'avoid': 'unpavedRoads',
+        **route_type['params']
     }
+    
     try:
-        response = requests.get(url, params=params)
+        response = http_get(base_url, params=params)
         response.raise_for_status()
         data = response.json()
+        
         if not data.get('routes'):
-            raise ValueError("No routes found between these coordinates")
-        route = data['routes'][0]
-        return route['summary']['lengthInMeters'] / 1000  # Convert to km
+            raise ValueError(f"No {route_type['type']} route found between these coordinates")
+        
+        return data['routes'][0]
     except requests.exceptions.HTTPError as e:
-        error_msg = f"TomTom API Error: {e.response.status_code} - {e.response.text}"
+        error_msg = f"TomTom API Error ({route_type['type']} route): {e.response.status_code} - {e.response.text}"
         raise Exception(error_msg)
     except KeyError:
-        raise Exception("Unexpected API response format")
+        raise Exception(f"Unexpected API response format for {route_type['type']} route")
+
+def get_cached_route(start_coords, end_coords, route_type, api_key):
+    """Return one route type from the route cache, requesting it on a miss"""
+    key = route_cache.key(
+        start_coords, end_coords, route_type['params']['routeType'], route_type['params']['travelMode']
+    )
+    return route_cache.get_or_fetch(key, lambda: request_route(start_coords, end_coords, route_type, api_key))
+
+def get_lane_distance(start, end, api_key):
+    """Road distance in km of the fastest truck route between two locations"""
+    start_coords = resolve_location(start, api_key)
+    end_coords = resolve_location(end, api_key)
+    route = get_cached_route(start_coords, end_coords, ROUTE_TYPES[0], api_key)
+    return route['summary']['lengthInMeters'] / 1000
+
+def get_distance_matrix(origins, destinations, api_key, travel_mode='truck'):
+    """
+    Route every origin to every destination with one TomTom Matrix Routing call.
 
-def get_tomtom_routes(start_coords, end_coords, api_key):
-    """Get multiple routes (fastest and eco) from TomTom API"""
-    formatted_coords = f"{start_coords.replace(' ', '')}:{end_coords.replace(' ', '')}"
-    base_url = f"https://api.tomtom.com/routing/1/calculateRoute/{formatted_coords}/json"
-    
-    route_types = [
-        {"type": "fastest", "color": "red", "params": {"routeType": "fastest", "travelMode": "truck"}},
-        {"type": "eco", "color": "green", "params": {"routeType": "eco", "travelMode": "truck"}},
-    ]
-    
-    routes = []
-    for route_type in route_types:
-        params = {
-            'key': api_key,
-            'traffic': 'true',
-            'avoid': 'unpavedRoads',
-            **route_type['params']
-        }
-        
-        try:
-            response = requests.get(base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if not data.get('routes'):
-                raise ValueError(f"No {route_type['type']} route found between these coordinates")
-            
-            route = data['routes'][0]
-            route['color'] = route_type['color']  # Add color to the route
-            routes.append(route)
-        except requests.exceptions.HTTPError as e:
-            error_msg = f"TomTom API Error ({route_type['type']} route): {e.response.status_code} - {e.response.text}"
-            raise Exception(error_msg)
-        except KeyError:
-            raise Exception(f"Unexpected API response format for {route_type['type']} route")
-    
-    return routes
+    Returns:
+        dict: {(origin_index, destination_index): {'km': ..., 'minutes': ...}}
+            for the cells TomTom could route
+    """
+    url = f"{TOMTOM_BASE_URL}/routing/matrix/2"
+    def point(coords):
+        lat, lon = (float(value) for value in coords.split(','))
+        return {'point': {'latitude': lat, 'longitude': lon}}
+    body = {
+        'origins': [point(coords) for coords in origins],
+        'destinations': [point(coords) for coords in destinations],
+        'options': {'travelMode': travel_mode, 'routeType': 'fastest', 'traffic': 'historical'}
+    }
+    try:
+        response = http_post(url, json=body, params={'key': api_key})
+        response.raise_for_status()
+        cells = {}
+        for cell in response.json().get('data', []):
+            summary = cell.get('routeSummary')
+            if summary:
+                cells[(cell['originIndex'], cell['destinationIndex'])] = {
+                    'km': summary['lengthInMeters'] / 1000,
+                    'minutes': summary['travelTimeInSeconds'] / 60
+                }
+        return cells
+    except requests.exceptions.HTTPError as e:
+        error_msg = f"TomTom Matrix API Error: {e.response.status_code} - {e.response.text}"
+        raise Exception(error_msg)
 
 def get_weather_data(lat, lon, api_key):
     """Fetch weather data using OpenWeatherMap API"""
-    url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
+    url = f"{OPENWEATHER_BASE_URL}/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
     try:
-        response = requests.get(url)
+        response = http_get(url)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.HTTPError as e:
         error_msg = f"Weather API Error: {e.response.status_code} - {e.response.text}"
         raise Exception(error_msg)
 
-def get_nearby_places(coords, category, api_key, radius=5000):
+def get_nearby_places(coords, category, api_key, radius=5000, limit=10):
     """Fetch nearby places (hotels, restaurants, fuel stations) using TomTom Places API"""
-    url = f"https://api.tomtom.com/search/2/nearbySearch/.json"
+    url = f"{TOMTOM_BASE_URL}/search/2/nearbySearch/.json"
     params = {
         'key': api_key,
         'lat': coords[0],
         'lon': coords[1],
         'radius': radius,
         'categorySet': category,
-        'limit': 10  # Limit the number of results
+        'limit': limit  # Limit the number of results
     }
     
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()
         data = response.json()
         return data.get('results', [])
@@ -156,122 +165,79 @@ def get_nearby_places(coords, category, api_key, radius=5000):
         error_msg = f"TomTom Places API Error: {e.response.status_code} - {e.response.text}"
         raise Exception(error_msg)
 
-def get_pois(lat, lon, category, api_key, radius=5000):
-    """Get points of interest using TomTom Search API"""
-    url = "https://api.tomtom.com/search/2/nearbySearch/.json"
-    params = {
-        'key': api_key,
-        'lat': lat,
-        'lon': lon,
-        'radius': radius,
-        'categorySet': category,
-        'limit': 5
-    }
-    
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data.get('results', [])
-    except Exception as e:
-        print(f"POI API Error: {str(e)}")
-        return []
-
-def get_route_pois(route_coords, api_key):
-    """Get POIs along a route with sampling"""
-    pois = {'hotel': [], 'restaurant': [], 'fuel': []}
-    
-    # Sample every 10th coordinate to reduce API calls
-    for i, coord in enumerate(route_coords[::10]):
-        lat, lon = coord
-        
-        # Get hotels
-        hotels = get_pois(lat, lon, '7314', api_key)
-        for hotel in hotels:
-            pois['hotel'].append({
-                'name': hotel['poi'].get('name'),
-                'lat': hotel['position']['lat'],
-                'lon': hotel['position']['lon']
-            })
-            
-        # Get restaurants
-        restaurants = get_pois(lat, lon, '7315', api_key)
-        for rest in restaurants:
-            pois['restaurant'].append({
-                'name': rest['poi'].get('name'),
-                'lat': rest['position']['lat'],
-                'lon': rest['position']['lon']
-            })
-            
-        # Get fuel stations
-        fuel_stations = get_pois(lat, lon, '7311', api_key)
-        for fuel in fuel_stations:
-            pois['fuel'].append({
-                'name': fuel['poi'].get('name'),
-                'lat': fuel['position']['lat'],
-                'lon': fuel['position']['lon']
-            })
-    
-    return pois
+def search_poi_cell(cell, categories, api_key):
+    """One nearby search for the given categories covering a grid cell"""
+    center, radius = poi_index.cell_center(cell), poi_index.cell_radius(cell)
+    return get_nearby_places(center, ','.join(categories), api_key, radius=radius, limit=POI_CELL_LIMIT)
 
-def get_pois_along_route(route, category, api_key, radius=5000, max_pois=15):
+def fetch_poi_cells(cells, categories, api_key, fanout=None, failures=None):
+    """
+    Fetch every category for each grid cell, one result list (or exception) per cell.
+
+    One nearby search covers all categories of a cell. When it comes back
+    full, a dense category (restaurants) may have crowded out the others,
+    so the cell is searched again one category at a time and the results
+    are merged. Only POI_SPLIT_CELLS cells per call are split this way;
+    other full cells are returned as a PartialCell from their combined
+    search, to be completed by a later request.
+    """
+    results = run_all([(search_poi_cell, (cell, categories, api_key)) for cell in cells], fanout, return_exceptions=True)
+
+    full = [i for i, result in enumerate(results)
+            if not isinstance(result, Exception) and len(result) >= POI_CELL_LIMIT and len(categories) > 1]
+    split = full[:POI_SPLIT_CELLS]
+    searches = run_all(
+        [(search_poi_cell, (cells[i], [category], api_key)) for i in split for category in categories],
+        fanout, return_exceptions=True
+    )
+    completed = set()
+    for n, i in enumerate(split):
+        per_category = searches[n * len(categories):(n + 1) * len(categories)]
+        if any(isinstance(result, Exception) for result in per_category):
+            continue
+        merged = {}
+        for category_results in per_category:
+            for result in category_results:
+                merged.setdefault(result.get('id') or id(result), result)
+        results[i] = list(merged.values())
+        completed.add(i)
+    for i in full:
+        if i not in completed:
+            results[i] = PartialCell(results[i])
+
+    if failures is not None:
+        failures.extend(cell for cell, result in zip(cells, results) if isinstance(result, Exception))
+    return results
+
+def get_route_pois_by_category(route, categories, api_key, radius=5000, max_pois=15, fanout=None, failures=None):
     """
-    Fetch POIs along the route using TomTom Places API with distributed sampling:
+    Get POIs along the route for several categories from the local POI index:
     33% at start, 33% at middle, and 34% at end of route
+
+    Cells that could not be fetched are left out of the answer and appended
+    to `failures` when a list is given.
     """
-    pois = []
-    waypoints = route['legs'][0]['points']
-    total_points = len(waypoints)
-    
-    # Calculate points per section
-    points_per_section = max_pois // 3
-    remaining_points = max_pois % 3  # Add remaining to end section
-    
-    # Define sections
-    start_section = waypoints[:total_points // 3]
-    mid_section = waypoints[total_points // 3:2 * total_points // 3]
-    end_section = waypoints[2 * total_points // 3:]
-    
-    # Function to sample points from a section
-    def sample_section(section, num_points):
-        if not section:
-            return []
-        
-        step = max(1, len(section) // num_points)
-        section_pois = []
-        
-        for i in range(0, len(section), step):
-            if len(section_pois) >= num_points:
-                break
-                
-            point = section[i]
-            coords = [point['latitude'], point['longitude']]
-            nearby_pois = get_nearby_places(coords, category, api_key, radius)
-            section_pois.extend(nearby_pois[:num_points])
-        
-        return section_pois[:num_points]
-    
-    # Sample POIs from each section
-    start_pois = sample_section(start_section, points_per_section)
-    mid_pois = sample_section(mid_section, points_per_section)
-    end_pois = sample_section(end_section, points_per_section + remaining_points)
-    
-    # Combine all POIs
-    pois.extend(start_pois)
-    pois.extend(mid_pois)
-    pois.extend(end_pois)
-    
-    return pois[:max_pois]
+    return poi_index.pois_along_route(
+        route['legs'][0]['points'],
+        categories,
+        lambda cells: fetch_poi_cells(cells, categories, api_key, fanout, failures),
+        radius_km=radius / 1000,
+        max_pois=max_pois
+    )
 
 def geocode_location(location_name, api_key):
     """Convert a location name (e.g., 'Delhi') to latitude and longitude using TomTom Geocoding API."""
-    url = f"https://api.tomtom.com/search/2/geocode/{location_name}.json"
+    cached = geocode_cache.get(location_name)
+    if cached:
+        return cached
+
+    url = f"{TOMTOM_BASE_URL}/search/2/geocode/{location_name}.json"
     params = {
         'key': api_key,
         'limit': 1  # Only return the top result
     }
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()
         data = response.json()
         if not data.get('results'):
@@ -279,101 +245,486 @@ def geocode_location(location_name, api_key):
         result = data['results'][0]
         lat = result['position']['lat']
         lon = result['position']['lon']
+        geocode_cache.set(location_name, f"{lat},{lon}")
         return f"{lat},{lon}"
     except requests.exceptions.HTTPError as e:
         error_msg = f"Geocoding API Error: {e.response.status_code} - {e.response.text}"
         raise Exception(error_msg)
     
 
+COORDINATES_PATTERN = re.compile(r'^-?\d+\.?\d*,-?\d+\.?\d*$')
+
+def resolve_location(location, api_key):
+    """Return 'lat,lon' for a location, geocoding it unless it already is coordinates"""
+    if COORDINATES_PATTERN.match(location):
+        return location
+    return geocode_location(location, api_key)
+
+def cached_location(location):
+    """Return 'lat,lon' for a location without any network call, or None if it is not geocoded yet"""
+    if COORDINATES_PATTERN.match(location):
+        return location
+    return geocode_cache.get(location)
+
+def optional_result(future, deadline, section, degraded):
+    """Result of an optional section's future, or None (marking it degraded) if it failed or ran out of time"""
+    try:
+        return deadline.result(future)
+    except Exception as e:
+        print(f"Skipping {section}: {str(e)}")
+        degraded.append(section)
+        return None
+
 def format_time(seconds):
     minutes = seconds // 60
     hours = minutes // 60
     minutes = minutes % 60
     return {'hours': hours, 'minutes': minutes}
 
-@app.route('/calculate', methods=['POST'])
-def calculate():
-    form_data = request.form.to_dict()
+@app.route('/upstream/stats', methods=['GET'])
+def get_upstream_stats():
+    return jsonify(upstream_stats())
+
+@app.route('/geocode/cache-stats', methods=['GET'])
+def get_geocode_cache_stats():
+    return jsonify(geocode_cache.stats())
+
+@app.route('/routes/cache-stats', methods=['GET'])
+def get_route_cache_stats():
+    return jsonify(route_cache.stats())
+
+@app.route('/pois/index-stats', methods=['GET'])
+def get_poi_index_stats():
+    return jsonify(poi_index.stats())
+
+@app.route('/weather/cache-stats', methods=['GET'])
+def get_weather_cache_stats():
+    return jsonify(weather_cache.stats())
+
+def price_batch(shipments, api_key=None, fanout=None):
+    """
+    Price a manifest of shipments for every vehicle/fuel combination.
+
+    Shipments without a distance_km are routed once per distinct start/end
+    lane. Invalid shipments, and shipments on a lane that could not be
+    geocoded or routed, are reported in 'errors' and left out of the matrix.
+    """
+    parsed, errors = [], []
+    for row, shipment in enumerate(shipments, start=1):
+        try:
+            parsed.append((row,) + parse_shipment(shipment))
+        except ValueError as e:
+            errors.append({'row': row, 'id': shipment.get('id') if isinstance(shipment, dict) else None, 'error': str(e)})
+
+    lanes = list(dict.fromkeys((start, end) for _, _, distance, start, end, _ in parsed if distance is None))
+    if lanes and not api_key:
+        raise ValueError("API keys not configured")
+    lane_distances = {}
+    calls = [(get_lane_distance, (start, end, api_key)) for start, end in lanes]
+    for lane, distance in zip(lanes, run_all(calls, fanout, return_exceptions=True) if calls else []):
+        lane_distances[lane] = distance
+
+    rows, distances, vehicles = [], [], []
+    for row, shipment_id, distance, start, end, allowed in parsed:
+        if distance is None:
+            distance = lane_distances[(start, end)]
+            if isinstance(distance, Exception):
+                errors.append({'row': row, 'id': shipment_id, 'error': str(distance)})
+                continue
+        rows.append((row, shipment_id))
+        distances.append(distance)
+        vehicles.append(allowed)
+
+    errors.sort(key=lambda error: error['row'])
+    totals, cheapest = price_shipments(distances, allowed_mask(vehicles))
+    return rows, np.asarray(distances, dtype=float), totals, cheapest, errors
+
+def batch_results_json(rows, distances, totals, cheapest, errors):
+    results = []
+    for i, (row, shipment_id) in enumerate(rows):
+        best = int(cheapest[i])
+        results.append({
+            'row': row,
+            'id': shipment_id,
+            'distance_km': round(float(distances[i]), 2),
+            'cheapest': {
+                'vehicle': COMBINATIONS[best][0],
+                'fuel': COMBINATIONS[best][1],
+                'total': float(totals[i, best])
+            },
+            'costs': [None if np.isnan(cost) else float(cost) for cost in totals[i]]
+        })
+    return {
+        'combinations': [
+            {'vehicle': vehicle, 'fuel': fuel, 'per_km': round(float(per_km), 2)}
+            for (vehicle, fuel), per_km in zip(COMBINATIONS, COST_PER_KM)
+        ],
+        'shipments': results,
+        'errors': errors
+    }
+
+def stream_batch_csv(rows, distances, totals, cheapest, errors):
+    """Yield the priced manifest as CSV, one line per shipment, followed by the rejected ones"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        ['row', 'id', 'distance_km', 'cheapest_vehicle', 'cheapest_fuel', 'cheapest_total']
+        + [f"{vehicle}_{fuel}" for vehicle, fuel in COMBINATIONS] + ['error']
+    )
+    for i, (row, shipment_id) in enumerate(rows):
+        best = int(cheapest[i])
+        writer.writerow(
+            [row, shipment_id, round(float(distances[i]), 2), COMBINATIONS[best][0], COMBINATIONS[best][1], totals[i, best]]
+            + ['' if np.isnan(cost) else cost for cost in totals[i]] + ['']
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    for error in errors:
+        writer.writerow([error['row'], error['id']] + [''] * (4 + len(COMBINATIONS)) + [error['error']])
+    yield buffer.getvalue()
+
+@app.route('/routes/geometry', methods=['GET'])
+def get_route_geometry():
+    """
+    Full geometry of a route shown on the report, from the route cache.
+
+    Query args: start, end, type ('fastest' or 'eco'), tolerance in metres
+    (0 keeps every point) and format ('polyline' or 'array' for a flat
+    lat, lon float list).
+    """
     try:
         tomtom_key = os.getenv("TOMTOM_API_KEY")
-        weather_key = os.getenv("WEATHER_API_KEY")
-        if not tomtom_key or not weather_key:
+        if not tomtom_key:
             raise ValueError("API keys not configured")
+        route_type = next((rt for rt in ROUTE_TYPES if rt['type'] == request.args.get('type', 'fastest')), None)
+        if route_type is None:
+            raise ValueError(f"Unknown route type: {request.args.get('type')}")
+        start = resolve_location(request.args['start'].strip(), tomtom_key)
+        end = resolve_location(request.args['end'].strip(), tomtom_key)
+        tolerance = float(request.args.get('tolerance', 0))
+
+        points = simplify(route_points(get_cached_route(start, end, route_type, tomtom_key)), tolerance)
+        if request.args.get('format') == 'array':
+            return jsonify({'type': route_type['type'], 'points': points.ravel().tolist()})
+        return jsonify({
+            'type': route_type['type'],
+            'polyline': encode(points),
+            'precision': POLYLINE_PRECISION,
+            'points': len(points)
+        })
+
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Get start and end locations
-        start_input = form_data['start'].strip()
-        end_input = form_data['end'].strip()
+@app.route('/routes/pair-cache-stats', methods=['GET'])
+def get_pair_cache_stats():
+    return jsonify(pair_cache.stats())
 
-        # Geocode start and end locations if they are not coordinates
-        if not re.match(r'^-?\d+\.?\d*,-?\d+\.?\d*$', start_input):
-            start = geocode_location(start_input, tomtom_key)
-        else:
-            start = start_input
+@app.route('/optimize-route', methods=['POST'])
+def optimize_route():
+    """
+    Plan a multi-stop run from a depot.
 
-        if not re.match(r'^-?\d+\.?\d*,-?\d+\.?\d*$', end_input):
-            end = geocode_location(end_input, tomtom_key)
+    Expects JSON with 'depot', 'stops' (objects with 'location' and
+    optionally 'id' and 'demand'), 'vehicle', 'fuel' and optionally
+    'capacity' and 'return_to_depot'. Stops are split into trips that fit
+    the vehicle, ordered, and the whole plan is priced with calculate_costs.
+    """
+    try:
+        data = request.get_json(force=True)
+        tomtom_key = os.getenv("TOMTOM_API_KEY")
+        if not tomtom_key:
+            raise ValueError("API keys not configured")
+
+        vehicle = str(data.get('vehicle', '')).lower()
+        fuel = str(data.get('fuel', '')).lower()
+        if vehicle not in FUEL_CONSUMPTION:
+            raise ValueError(f"Invalid vehicle. Choose: {', '.join(FUEL_CONSUMPTION)}")
+        validate_vehicle_fuel_combination(vehicle, fuel)
+        capacity = float(data.get('capacity') or VEHICLE_CAPACITY[vehicle])
+        return_to_depot = bool(data.get('return_to_depot', True))
+
+        stops = data.get('stops') or []
+        if not data.get('depot') or not stops:
+            raise ValueError("A depot and at least one stop are required")
+        locations = [str(data['depot']).strip()] + [str(stop['location']).strip() for stop in stops]
+        demands = [0.0] + [float(stop.get('demand', 0)) for stop in stops]
+
+        fanout = Fanout()
+        coords = fanout.map([(resolve_location, (location, tomtom_key)) for location in locations])
+
+        distances, minutes, sources = build_matrix(
+            coords, pair_cache, lambda origins, destinations: get_distance_matrix(origins, destinations, tomtom_key)
+        )
+        trips = solve_trips(distances, demands, capacity, return_to_depot)
+
+        plan = []
+        total_km = 0.0
+        for trip in trips:
+            legs = trip_legs(trip, return_to_depot)
+            trip_km = float(distances[legs[:-1], legs[1:]].sum())
+            total_km += trip_km
+            plan.append({
+                'stops': [{'id': stops[i - 1].get('id', i), 'location': locations[i], 'coords': coords[i]} for i in trip],
+                'load': sum(demands[i] for i in trip),
+                'distance_km': round(trip_km, 2),
+                'duration': format_time(int(minutes[legs[:-1], legs[1:]].sum() * 60))
+            })
+
+        return jsonify({
+            'vehicle': vehicle,
+            'fuel': fuel,
+            'capacity': capacity,
+            'depot': {'location': locations[0], 'coords': coords[0]},
+            'trips': plan,
+            'distance_km': round(total_km, 2),
+            'costs': calculate_costs(vehicle, fuel, total_km),
+            'matrix_sources': sources
+        })
+
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/calculate/batch', methods=['POST'])
+def calculate_batch():
+    """Price a manifest sent as a JSON list or as CSV; ?format=csv returns CSV"""
+    try:
+        if request.mimetype == 'text/csv':
+            shipments = iter_csv_shipments(request.stream)
         else:
-            end = end_input
+            shipments = iter_json_shipments(request.get_json(force=True))
 
-        # Calculate routes and get times
-        routes = get_tomtom_routes(start, end, tomtom_key)
-        fastest_time = routes[0]['summary']['travelTimeInSeconds']
-        eco_time = routes[1]['summary']['travelTimeInSeconds']
-        
-        # Calculate distance from the fastest route
-        distance_km = routes[0]['summary']['lengthInMeters'] / 1000
-        if distance_km <= 0:
-            raise ValueError("Could not calculate valid route distance")
+        rows, distances, totals, cheapest, errors = price_batch(
+            shipments, os.getenv("TOMTOM_API_KEY"), Fanout()
+        )
+        if request.args.get('format') == 'csv':
+            return Response(stream_batch_csv(rows, distances, totals, cheapest, errors), mimetype='text/csv')
+        return jsonify(batch_results_json(rows, distances, totals, cheapest, errors))
 
-        # Get weather data
-        weather_start = get_weather_data(*start.split(','), weather_key)
-        weather_end = get_weather_data(*end.split(','), weather_key)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Fetch POIs along the route
-        pois = {
-            'hotels': get_pois_along_route(routes[0], '7314', tomtom_key, max_pois=15),
-            'restaurants': get_pois_along_route(routes[0], '7315', tomtom_key, max_pois=15),
-            'fuel': get_pois_along_route(routes[0], '7311', tomtom_key, max_pois=15),
-        }
+def build_report(form_data):
+    """
+    Build the delivery report for a start, end, vehicle and fuel.
 
-        vehicle = form_data['vehicle'].lower()
-        fuel = form_data['fuel'].lower()
+    Raises DeadlineExceeded when the required parts do not arrive within
+    the request budget, ValueError for invalid input.
+    """
+    tomtom_key = os.getenv("TOMTOM_API_KEY")
+    weather_key = os.getenv("WEATHER_API_KEY")
+    if not tomtom_key or not weather_key:
+        raise ValueError("API keys not configured")
+
+    # Get start and end locations
+    start_input = form_data['start'].strip()
+    end_input = form_data['end'].strip()
+
+    vehicle = form_data['vehicle'].lower()
+    fuel = form_data['fuel'].lower()
+    if vehicle not in FUEL_CONSUMPTION:
+        raise ValueError(f"Invalid vehicle type: {vehicle}. Choose: {', '.join(FUEL_CONSUMPTION)}")
+    validate_vehicle_fuel_combination(vehicle, fuel)
+
+    # One latency budget covers every outbound call of this request. Only
+    # the locations and the fastest route are required; the other sections
+    # are dropped from the report if they fail or run out of time.
+    deadline = Deadline()
+    degraded = []
+    with deadline:
+        # Independent upstream calls for this request run concurrently
+        fanout = Fanout()
 
-        validate_vehicle_fuel_combination(vehicle, fuel)
+        # Geocode start and end locations if they are not coordinates
+        start, end = fanout.map([
+            (resolve_location, (start_input, tomtom_key)),
+            (resolve_location, (end_input, tomtom_key)),
+        ])
+
+        # Weather and the eco route only need the coordinates, so fetch them while routing
+        weather_start_future = fanout.submit(weather_cache.get, *start.split(','))
+        weather_end_future = fanout.submit(weather_cache.get, *end.split(','))
+        fastest_future = fanout.submit(get_cached_route, start, end, ROUTE_TYPES[0], tomtom_key)
+        eco_future = fanout.submit(get_cached_route, start, end, ROUTE_TYPES[1], tomtom_key)
+
+        fastest = {**deadline.result(fastest_future), 'color': ROUTE_TYPES[0]['color']}
+        fastest_time = fastest['summary']['travelTimeInSeconds']
+
+        # Calculate distance from the fastest route
+        distance_km = fastest['summary']['lengthInMeters'] / 1000
+        if distance_km <= 0:
+            raise ValueError("Could not calculate valid route distance")
+
+        # The cost only depends on the fastest route, so it never waits on the sections below
         costs = calculate_costs(vehicle, fuel, distance_km)
 
+        optional = deadline.child(OPTIONAL_BUDGET)
+        with optional:
+            # Fetch POIs along the route
+            poi_categories = {'hotels': '7314', 'restaurants': '7315', 'fuel': '7311'}
+            failures = []
+            try:
+                category_pois = get_route_pois_by_category(
+                    fastest, list(poi_categories.values()), tomtom_key, max_pois=15, fanout=fanout,
+                    failures=failures
+                )
+            except Exception as e:
+                print(f"Skipping pois: {str(e)}")
+                category_pois = {category: [] for category in poi_categories.values()}
+                failures.append(e)
+            if failures:
+                degraded.append('pois')
+            pois = {name: category_pois[category] for name, category in poi_categories.items()}
+
+            eco = optional_result(eco_future, optional, 'eco_route', degraded)
+            weather_start = optional_result(weather_start_future, optional, 'weather', degraded)
+            weather_end = optional_result(weather_end_future, optional, 'weather', degraded)
+
+    routes = [fastest]
+    route_comparison = None
+    eco_time = None
+    if eco is not None:
+        routes.append({**eco, 'color': ROUTE_TYPES[1]['color']})
+        eco_time = eco['summary']['travelTimeInSeconds']
+
         # Calculate route differences
         time_diff = eco_time - fastest_time
         time_diff_minutes = time_diff // 60
-        distance_diff = (routes[1]['summary']['lengthInMeters'] - routes[0]['summary']['lengthInMeters']) / 1000
-
-        report = {
-            'vehicle': vehicle.capitalize(),
-            'fuel': fuel.capitalize(),
-            'fuel_price': FUEL_PRICES[fuel],
-            'fuel_unit': 'kg' if fuel == 'cng' else 'liter',
-            'distance': round(distance_km, 2),
-            'per_km': costs['per_km'],
-            'total': costs['total'],
-            'routes': routes,
-            'route_comparison': {
-                'time_diff_minutes': int(time_diff_minutes),
-                'distance_diff': round(distance_diff, 2)
-            },
-            'weather_start': weather_start,
-            'weather_end': weather_end,
-            'pois': pois,
-            'start': start_input,
-            'end': end_input,
-            'time': {
-                    'fastest': format_time(fastest_time),
-                    'eco': format_time(eco_time)
-                },
+        distance_diff = (eco['summary']['lengthInMeters'] - fastest['summary']['lengthInMeters']) / 1000
+        route_comparison = {
+            'time_diff_minutes': int(time_diff_minutes),
+            'distance_diff': round(distance_diff, 2)
         }
 
+    report = {
+        'vehicle': vehicle.capitalize(),
+        'fuel': fuel.capitalize(),
+        'fuel_price': FUEL_PRICES[fuel],
+        'fuel_unit': 'kg' if fuel == 'cng' else 'liter',
+        'distance': round(distance_km, 2),
+        'per_km': costs['per_km'],
+        'total': costs['total'],
+        # Simplified, encoded geometry; /routes/geometry serves the full one
+        'routes': [compact_route(route) for route in routes],
+        'route_comparison': route_comparison,
+        'weather_start': weather_start,
+        'weather_end': weather_end,
+        'pois': pois,
+        'start': start_input,
+        'end': end_input,
+        'coords': {
+            'start': [float(value) for value in start.split(',')],
+            'end': [float(value) for value in end.split(',')]
+        },
+        'time': {
+                'fastest': format_time(fastest_time),
+                'eco': format_time(eco_time) if eco_time is not None else None
+            },
+        # Sections left out because they failed or ran out of time
+        'degraded': sorted(set(degraded)),
+    }
+
+    return report
+
+@app.route('/calculate', methods=['POST'])
+def calculate():
+    form_data = request.form.to_dict()
+    try:
+        report = build_report(form_data)
         return render_template('index.html', report=report, form_data=form_data)
 
+    except DeadlineExceeded:
+        error = "The route service did not respond in time. Please try again."
+        return render_template('index.html', error=error, form_data=form_data)
     except Exception as e:
         return render_template('index.html', error=str(e), form_data=form_data)
+
+
+# How long clients may reuse an /api/calculate response before revalidating it
+API_MAX_AGE = int(os.getenv('API_MAX_AGE', '30'))
+
+REPORT_FIELDS = ('start', 'end', 'vehicle', 'fuel')
+
+def report_etag(form_data):
+    """
+    ETag for the report these inputs would produce from the data cached now.
+
+    It is derived from the resolved locations, vehicle and fuel, and the
+    versions of the cached routes and weather the report is built from
+    (POIs are looked up along the fastest route, so they follow its
+    version). Returns None when any of that is missing or no longer fresh,
+    in which case the report has to be rebuilt, which also refreshes it.
+    """
+    start = cached_location(form_data['start'].strip())
+    end = cached_location(form_data['end'].strip())
+    if not start or not end:
+        return None
+
+    parts = [snap_coords(start), snap_coords(end), form_data['vehicle'].lower(), form_data['fuel'].lower()]
+    for route_type in ROUTE_TYPES:
+        parts.append(route_cache.version(route_cache.key(
+            start, end, route_type['params']['routeType'], route_type['params']['travelMode']
+        )))
+    for coords in (start, end):
+        parts.append(weather_cache.version(*coords.split(',')))
+    if None in parts:
+        return None
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()[:20]
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"private, max-age={API_MAX_AGE}"
+    return response
+
+@app.route('/api/calculate', methods=['GET', 'POST'])
+def api_calculate():
+    """
+    The /calculate report as JSON. Inputs (start, end, vehicle, fuel) come
+    as query args, form fields or a JSON body. Complete reports carry an
+    ETag, and a matching If-None-Match is answered with 304 from the cached
+    data versions alone, without rebuilding the report.
+    """
+    if request.method == 'GET':
+        form_data = request.args.to_dict()
+    else:
+        form_data = request.get_json(silent=True) or request.form.to_dict()
+
+    missing = [field for field in REPORT_FIELDS if not str(form_data.get(field) or '').strip()]
+    if missing:
+        return jsonify({'error': f"Missing field: {', '.join(missing)}"}), 400
+    form_data = {field: str(form_data[field]) for field in REPORT_FIELDS}
+
+    try:
+        etag = report_etag(form_data)
+        if etag and request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        report = build_report(form_data)
+
+        response = jsonify(report)
+        # Degraded reports are not reused: the missing sections may load next time
+        etag = None if report['degraded'] else report_etag(form_data)
+        if etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = f"private, max-age={API_MAX_AGE}"
+        else:
+            response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DeadlineExceeded:
+        return jsonify({'error': 'The route service did not respond in time. Please try again.'}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import csv
+import io
+
+import numpy as np
+
+# Constants
+FUEL_PRICES = {
+    "petrol": 100.80,
+    "diesel": 92.39,
+    "cng": 90.50
+}
+
+FUEL_CONSUMPTION = {
+    "truck": {"diesel": 0.35, "cng": 0.40,"petrol":0.30},
+    "van": {"diesel": 0.20, "petrol": 0.25, "cng": 0.25},
+    "car": {"petrol": 0.10, "diesel": 0.08, "cng": 0.12}
+}
+
+MAINTENANCE_COST = {
+    "truck": 5.0,
+    "van": 3.0,
+    "car": 2.0
+}
+
+# Default payload in kg, used by the multi-stop optimizer when no capacity is given
+VEHICLE_CAPACITY = {
+    "truck": 10000,
+    "van": 1500,
+    "car": 400
+}
+
+# Every valid (vehicle, fuel) pair, in a fixed order shared by the cost matrix columns
+COMBINATIONS = [(vehicle, fuel) for vehicle, fuels in FUEL_CONSUMPTION.items() for fuel in fuels]
+
+# Per-km fuel and maintenance cost of each combination
+FUEL_COST_PER_KM = np.array([FUEL_CONSUMPTION[v][f] * FUEL_PRICES[f] for v, f in COMBINATIONS])
+MAINTENANCE_PER_KM = np.array([MAINTENANCE_COST[v] for v, _ in COMBINATIONS])
+COST_PER_KM = FUEL_COST_PER_KM + MAINTENANCE_PER_KM
+
+
+def validate_vehicle_fuel_combination(vehicle, fuel):
+    if fuel not in FUEL_CONSUMPTION[vehicle]:
+        available_fuels = ", ".join(FUEL_CONSUMPTION[vehicle].keys())
+        raise ValueError(f"Invalid fuel for {vehicle}. Choose: {available_fuels}")
+
+def calculate_costs(vehicle, fuel, distance):
+    fuel_consumption = FUEL_CONSUMPTION[vehicle][fuel]
+    fuel_price = FUEL_PRICES[fuel]
+
+    fuel_cost_km = fuel_consumption * fuel_price
+    maintenance_km = MAINTENANCE_COST[vehicle]
+
+    return {
+        "per_km": {
+            "fuel": round(fuel_cost_km, 2),
+            "maintenance": maintenance_km,
+            "total": round(fuel_cost_km + maintenance_km, 2)
+        },
+        "total": {
+            "fuel": round(fuel_cost_km * distance, 2),
+            "maintenance": round(maintenance_km * distance, 2),
+            "total": round((fuel_cost_km + maintenance_km) * distance, 2)
+        }
+    }
+
+
+def iter_json_shipments(payload):
+    """Yield shipments from a JSON body: a list of shipments or {"shipments": [...]}"""
+    shipments = payload.get('shipments', []) if isinstance(payload, dict) else payload
+    if not isinstance(shipments, list):
+        raise ValueError('Expected a list of shipments')
+    return iter(shipments)
+
+
+def iter_csv_shipments(stream, encoding='utf-8'):
+    """Yield shipments from a CSV stream with a distance_km column or start,end columns"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding=encoding, newline=''))
+    columns = set(reader.fieldnames or [])
+    if 'distance_km' not in columns and not {'start', 'end'} <= columns:
+        raise ValueError('CSV needs a distance_km column or start and end columns')
+    return reader
+
+
+def parse_shipment(shipment):
+    """
+    Validate one shipment and return (id, distance_km or None, start, end, vehicles).
+
+    `vehicles` optionally restricts the vehicle types allowed for the
+    shipment, as a list or a '|'-separated string.
+    """
+    if not isinstance(shipment, dict):
+        raise ValueError('Shipment must be an object')
+
+    distance = shipment.get('distance_km')
+    if distance not in (None, ''):
+        try:
+            distance = float(str(distance).strip())
+        except ValueError:
+            raise ValueError(f"Invalid distance_km: {distance!r}")
+        if distance < 0:
+            raise ValueError('distance_km cannot be negative')
+    else:
+        distance = None
+
+    start = str(shipment.get('start') or '').strip()
+    end = str(shipment.get('end') or '').strip()
+    if distance is None and (not start or not end):
+        raise ValueError('Missing distance_km or start/end')
+
+    vehicles = shipment.get('vehicles') or []
+    if isinstance(vehicles, str):
+        vehicles = vehicles.split('|')
+    vehicles = [str(vehicle).strip().lower() for vehicle in vehicles if str(vehicle).strip()]
+    unknown = [vehicle for vehicle in vehicles if vehicle not in FUEL_CONSUMPTION]
+    if unknown:
+        raise ValueError(f"Unknown vehicle: {', '.join(unknown)}")
+
+    return shipment.get('id'), distance, start, end, vehicles
+
+
+def allowed_mask(vehicle_lists):
+    """Boolean (shipments, combinations) mask; an empty list allows every vehicle"""
+    vehicle_of = np.array([vehicle for vehicle, _ in COMBINATIONS])
+    mask = np.ones((len(vehicle_lists), len(COMBINATIONS)), dtype=bool)
+    for row, vehicles in enumerate(vehicle_lists):
+        if vehicles:
+            mask[row] = np.isin(vehicle_of, vehicles)
+    return mask
+
+
+def price_shipments(distances, mask=None):
+    """
+    Price every shipment for every vehicle/fuel combination at once.
+
+    Args:
+        distances (array): route length of each shipment in km
+        mask (array): optional (shipments, combinations) mask of allowed options
+
+    Returns:
+        tuple: (totals, cheapest) where totals is a (shipments, combinations)
+            matrix with NaN for disallowed options and cheapest holds the
+            column of the cheapest allowed option per shipment
+    """
+    distances = np.asarray(distances, dtype=float)
+    totals = np.round(distances[:, None] * COST_PER_KM[None, :], 2)
+    if mask is not None:
+        totals = np.where(mask, totals, np.nan)
+    cheapest = np.argmin(np.where(np.isnan(totals), np.inf, totals), axis=1) if len(totals) else np.empty(0, dtype=int)
+    return totals, cheapest
@@ -0,0 +1,60 @@
+import contextvars
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+# Total time a /calculate request may spend waiting on upstreams
+REQUEST_BUDGET = float(os.getenv('REQUEST_BUDGET', '8'))
+# Share of that budget the optional sections (POIs, weather, eco route) may use at most
+OPTIONAL_BUDGET = float(os.getenv('OPTIONAL_BUDGET', '3'))
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's latency budget runs out before a call completes"""
+
+
+class Deadline:
+    """
+    Latency budget for one request.
+
+    Entering a Deadline makes it the current one for the calling context;
+    Fanout copies the context into its worker threads, so every outbound
+    call made on behalf of the request sees the same budget and caps its
+    timeouts and retries to what is left.
+    """
+
+    def __init__(self, budget=REQUEST_BUDGET, expires_at=None):
+        self.expires_at = expires_at if expires_at is not None else time.monotonic() + budget
+        self._tokens = []
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def child(self, budget):
+        """A deadline for one stage: `budget` seconds from now, but never past this one"""
+        return Deadline(expires_at=min(self.expires_at, time.monotonic() + budget))
+
+    def result(self, future):
+        """Wait for a future until the deadline, cancelling it and raising DeadlineExceeded on expiry"""
+        try:
+            return future.result(timeout=self.remaining())
+        except FutureTimeout:
+            future.cancel()
+            raise DeadlineExceeded('Request time budget exhausted')
+
+    def __enter__(self):
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._tokens.pop())
+
+
+def current_deadline():
+    """The Deadline of the request being served in this context, or None"""
+    return _current.get()
@@ -1,41 +1,22 @@
+import argparse
+import csv
+import json
 import os
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from costing import FUEL_PRICES, FUEL_CONSUMPTION, validate_vehicle_fuel_combination, calculate_costs
 
 # Load environment variables
 load_dotenv()
 
-# Constants for Indian market
-FUEL_PRICES = {
-    "petrol": 100.80,  # INR per liter
-    "diesel": 92.39,   # INR per liter
-    "cng": 90.50      # INR per kg
-}
-
-# Fuel consumption rates (per km)
-FUEL_CONSUMPTION = {
-    "truck": {
-        "diesel": 0.35,    # 3.5 km/L
-        "cng": 0.40       # 4.0 km/kg
-    },
-    "van": {
-        "diesel": 0.20,    # 5 km/L
-        "petrol": 0.25,    # 4 km/L
-        "cng": 0.25       # 4 km/kg
-    },
-    "car": {
-        "petrol": 0.10,    # 10 km/L
-        "diesel": 0.08,    # 12.5 km/L
-        "cng": 0.12       # 8.3 km/kg
-    }
-}
-
-# Per km maintenance cost in INR
-MAINTENANCE_COST = {
-    "truck": 5.0,  # INR per km
-    "van": 3.0,    # INR per km
-    "car": 2.0     # INR per km
-}
+# Parallel routing lookups in batch mode
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+# Rows read, priced and written together; memory use is bounded by this, not by the file size
+BATCH_WINDOW = int(os.getenv('BATCH_WINDOW', '256'))
+
+BATCH_COLUMNS = ['row', 'id', 'vehicle', 'fuel', 'distance_km', 'fuel_cost_per_km', 'maintenance_cost_per_km',
+                 'fuel_cost', 'maintenance_cost', 'total_cost', 'error']
 
 def validate_api_keys():
     """Validate that required API keys are present"""
@@ -49,12 +30,6 @@ def validate_api_keys():
     
     return tomtom_key, weather_key
 
-def validate_vehicle_fuel_combination(vehicle, fuel):
-    """Validate if the chosen fuel type is available for the vehicle"""
-    if fuel not in FUEL_CONSUMPTION[vehicle]:
-        available_fuels = ", ".join(FUEL_CONSUMPTION[vehicle].keys())
-        raise ValueError(f"Invalid fuel type for {vehicle}. Available options: {available_fuels}")
-
 def get_user_input():
     # Get vehicle type
     while True:
@@ -96,33 +71,237 @@ def get_user_input():
     
     return vehicle, fuel, start, end
 
-def calculate_costs(vehicle, fuel, distance_km):
-    """Calculate all costs per kilometer and total"""
-    
-    # Fuel cost calculation
-    fuel_consumption_per_km = FUEL_CONSUMPTION[vehicle][fuel]
-    fuel_price_per_unit = FUEL_PRICES[fuel]
-    fuel_cost_per_km = fuel_consumption_per_km * fuel_price_per_unit
-    
-    # Maintenance cost per km
-    maintenance_cost_per_km = MAINTENANCE_COST[vehicle]
-    
-    # Total costs
-    total_fuel_cost = fuel_cost_per_km * distance_km
-    total_maintenance_cost = maintenance_cost_per_km * distance_km
-    
-    return {
-        "per_km": {
-            "fuel": fuel_cost_per_km,
-            "maintenance": maintenance_cost_per_km,
-            "total": fuel_cost_per_km + maintenance_cost_per_km
-        },
-        "total": {
-            "fuel": total_fuel_cost,
-            "maintenance": total_maintenance_cost,
-            "total": total_fuel_cost + total_maintenance_cost
-        }
-    }
+class LaneDistances:
+    """
+    Road distance of the fastest truck route between two locations.
+
+    Locations and routes go through the web app's geocoding and route
+    caches. Lane distances are also kept in its pair-distance store, so
+    lanes priced by an earlier run (or by the app) are not routed again.
+    """
+
+    def __init__(self, api_key):
+        # Importing the web app sets up its caches and stores, which only batch runs need
+        import app
+        self.app = app
+        self.api_key = api_key
+        self.lookups = {'cache': 0, 'routing': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, source):
+        with self._lock:
+            self.lookups[source] += 1
+
+    def distance(self, start, end):
+        app, route_type = self.app, self.app.ROUTE_TYPES[0]
+        start_coords = app.resolve_location(start, self.api_key)
+        end_coords = app.resolve_location(end, self.api_key)
+        key = app.pair_cache.key(start_coords, end_coords, route_type['params']['travelMode'])
+        cached = app.pair_cache.get_many([key]).get(key)
+        if cached:
+            self._count('cache')
+            return cached['km']
+
+        if not self.api_key:
+            raise ValueError("TOMTOM_API_KEY not found in environment variables")
+        summary = app.get_cached_route(start_coords, end_coords, route_type, self.api_key)['summary']
+        km = summary['lengthInMeters'] / 1000
+        app.pair_cache.set_many([(key, {'km': km, 'minutes': summary['travelTimeInSeconds'] / 60})])
+        self._count('routing')
+        return km
+
+def read_shipments(path, fmt):
+    """Yield (row, shipment) from a CSV or JSONL file, one line at a time"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for row, shipment in enumerate(csv.DictReader(f), start=1):
+                yield row, shipment
+            return
+        row = 0
+        for line in f:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                yield row, json.loads(line)
+            except ValueError:
+                yield row, line.strip()
+
+def parse_batch_row(shipment, default_vehicle, default_fuel):
+    """Validate one batch row and return (id, vehicle, fuel, distance_km or None, start, end)"""
+    if not isinstance(shipment, dict):
+        raise ValueError("Row is not a JSON object")
+
+    vehicle = str(shipment.get('vehicle') or default_vehicle).strip().lower()
+    fuel = str(shipment.get('fuel') or default_fuel).strip().lower()
+    if vehicle not in FUEL_CONSUMPTION:
+        raise ValueError(f"Invalid vehicle type: {vehicle}")
+    validate_vehicle_fuel_combination(vehicle, fuel)
+
+    distance = shipment.get('distance_km')
+    if distance in (None, ''):
+        distance = None
+        start = str(shipment.get('start') or '').strip()
+        end = str(shipment.get('end') or '').strip()
+        if not start or not end:
+            raise ValueError("Missing distance_km or start/end")
+    else:
+        start = end = None
+        try:
+            distance = float(str(distance).strip())
+        except ValueError:
+            raise ValueError(f"Invalid distance_km: {distance!r}")
+        if distance < 0:
+            raise ValueError("distance_km cannot be negative")
+
+    return shipment.get('id'), vehicle, fuel, distance, start, end
+
+def price_window(window, lanes, executor, default_vehicle, default_fuel):
+    """Price a window of (row, shipment) pairs, routing each distinct lane once and in parallel"""
+    parsed = []
+    for row, shipment in window:
+        try:
+            parsed.append((row, parse_batch_row(shipment, default_vehicle, default_fuel), None))
+        except ValueError as e:
+            shipment_id = shipment.get('id') if isinstance(shipment, dict) else None
+            parsed.append((row, (shipment_id, None, None, None, None, None), str(e)))
+
+    pending = list(dict.fromkeys((start, end) for _, (_, _, _, distance, start, end), error in parsed
+                                 if error is None and distance is None))
+    futures = {lane: executor.submit(lanes.distance, *lane) for lane in pending}
+
+    results = []
+    for row, (shipment_id, vehicle, fuel, distance, start, end), error in parsed:
+        if error is None and distance is None:
+            try:
+                distance = futures[(start, end)].result()
+            except Exception as e:
+                error = str(e)
+        result = {'row': row, 'id': shipment_id, 'vehicle': vehicle, 'fuel': fuel}
+        if error is None:
+            costs = calculate_costs(vehicle, fuel, distance)
+            result.update({
+                'distance_km': round(distance, 2),
+                'fuel_cost_per_km': round(costs['per_km']['fuel'], 2),
+                'maintenance_cost_per_km': round(costs['per_km']['maintenance'], 2),
+                'fuel_cost': round(costs['total']['fuel'], 2),
+                'maintenance_cost': round(costs['total']['maintenance'], 2),
+                'total_cost': round(costs['total']['total'], 2)
+            })
+        else:
+            result['error'] = error
+        results.append(result)
+    return results
+
+def last_written_row(path, fmt):
+    """
+    Row number of the last complete result in an existing output file, or 0.
+
+    A line cut short by an interruption is dropped from the file so the
+    run can append after the last complete one.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = end = f.tell()
+        # Walk back to the last newline in small blocks, keeping memory constant
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+
+    last = None
+    with open(path, newline='', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                last = line
+    if last is None:
+        return 0
+    if fmt == 'csv':
+        value = next(csv.reader([last]))[0]
+        return int(value) if value.isdigit() else 0
+    return int(json.loads(last)['row'])
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+def run_batch(input_path, output_path, workers=BATCH_WORKERS, resume=False, input_format=None,
+              output_format=None, default_vehicle='truck', default_fuel='diesel', window_size=BATCH_WINDOW):
+    """
+    Price every shipment of a CSV or JSONL file and stream the results to output_path.
+
+    Rows give vehicle, fuel and either distance_km or start and end
+    locations (names or 'lat,lon'); rows without a vehicle or fuel use the
+    defaults. Rows that cannot be priced are written with an error instead
+    of stopping the run. With resume, rows already in output_path are
+    skipped and new results are appended.
+
+    Returns:
+        dict: counts of priced rows, failed rows, skipped rows and lane lookups
+    """
+    input_format = detect_format(input_path, input_format)
+    output_format = detect_format(output_path, output_format)
+    skip = last_written_row(output_path, output_format) if resume else 0
+    append = resume and os.path.exists(output_path) and os.path.getsize(output_path) > 0
+    lanes = LaneDistances(os.getenv("TOMTOM_API_KEY"))
+    summary = {'priced': 0, 'failed': 0, 'skipped': skip}
+
+    with open(output_path, 'a' if append else 'w', newline='', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        writer = csv.DictWriter(out, fieldnames=BATCH_COLUMNS) if output_format == 'csv' else None
+        if writer and not append:
+            writer.writeheader()
+
+        def flush(window):
+            for result in price_window(window, lanes, executor, default_vehicle, default_fuel):
+                summary['failed' if 'error' in result else 'priced'] += 1
+                if writer:
+                    writer.writerow(result)
+                else:
+                    out.write(json.dumps(result) + '\n')
+            out.flush()
+
+        window = []
+        for row, shipment in read_shipments(input_path, input_format):
+            if row <= skip:
+                continue
+            window.append((row, shipment))
+            if len(window) >= window_size:
+                flush(window)
+                window = []
+        if window:
+            flush(window)
+
+    summary['lookups'] = lanes.lookups
+    return summary
+
+def batch_main(args):
+    print(f"\n🚚 Pricing {args.batch} -> {args.output}")
+    try:
+        validate_vehicle_fuel_combination(args.vehicle, args.fuel)
+        summary = run_batch(args.batch, args.output, workers=args.workers, resume=args.resume,
+                            input_format=args.input_format, output_format=args.output_format,
+                            default_vehicle=args.vehicle, default_fuel=args.fuel)
+    except KeyboardInterrupt:
+        print("\n⏸  Interrupted. Run again with --resume to continue where it stopped.")
+        return 130
+    except (OSError, ValueError) as e:
+        print(f"\n❌ Error: {str(e)}")
+        return 1
+
+    print(f"✅ {summary['priced']} priced, {summary['failed']} failed"
+          + (f", {summary['skipped']} already done" if summary['skipped'] else ""))
+    print(f"   Lanes: {summary['lookups']['cache']} from cache, {summary['lookups']['routing']} routed")
+    return 0
 
 def main():
     print("\n🚚 Indian Delivery Cost Calculator 🚚")
@@ -167,4 +346,19 @@ def main():
         print("Please try again or contact support if the problem persists")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indian delivery cost calculator. Runs interactively unless --batch is given.")
+    parser.add_argument('--batch', metavar='INPUT', help="CSV or JSONL file of shipments to price")
+    parser.add_argument('--output', metavar='OUTPUT', help="file the priced rows are written to (CSV or JSONL)")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help="parallel routing lookups")
+    parser.add_argument('--resume', action='store_true', help="skip rows already in the output and append")
+    parser.add_argument('--vehicle', choices=list(FUEL_CONSUMPTION), default='truck', help="vehicle for rows that do not name one")
+    parser.add_argument('--fuel', default='diesel', help="fuel for rows that do not name one")
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help="default: from the file extension")
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'], help="default: from the file extension")
+    args = parser.parse_args()
+
+    if args.batch:
+        if not args.output:
+            parser.error("--output is required with --batch")
+        raise SystemExit(batch_main(args))
     main()
\ No newline at end of file
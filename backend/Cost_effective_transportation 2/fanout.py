@@ -0,0 +1,78 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from deadline import current_deadline
+
+# Threads shared by all requests for outbound API calls
+OUTBOUND_MAX_WORKERS = int(os.getenv('OUTBOUND_MAX_WORKERS', '32'))
+
+# Outbound calls a single request may have in flight at once
+REQUEST_MAX_CONCURRENCY = int(os.getenv('REQUEST_MAX_CONCURRENCY', '8'))
+
+_executor = ThreadPoolExecutor(max_workers=OUTBOUND_MAX_WORKERS, thread_name_prefix='outbound')
+
+
+class Fanout:
+    """
+    Runs one request's independent outbound calls concurrently.
+
+    Calls go to a thread pool shared by all requests, but each Fanout lets
+    at most `limit` of its own calls run at once, so one large request cannot
+    take every thread. submit() blocks the caller while the request is at
+    its limit; calls must not submit further work to the same Fanout.
+
+    Calls run in a copy of the submitter's context, so they see the current
+    request Deadline, and map() stops waiting once it expires.
+    """
+
+    def __init__(self, limit=REQUEST_MAX_CONCURRENCY):
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def submit(self, fn, *args, **kwargs):
+        """Start fn(*args, **kwargs) on the pool and return its Future"""
+        self._slots.acquire()
+        try:
+            future = _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def map(self, calls, return_exceptions=False):
+        """
+        Run (fn, args) pairs concurrently and return their results in order.
+
+        With return_exceptions, a failed or timed-out call contributes its
+        exception to the results instead of raising it.
+        """
+        futures = [self.submit(fn, *args) for fn, args in calls]
+        deadline = current_deadline()
+        results = []
+        for future in futures:
+            try:
+                results.append(deadline.result(future) if deadline else future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                results.append(e)
+        return results
+
+
+def run_all(calls, fanout=None, return_exceptions=False):
+    """Run (fn, args) pairs through `fanout`, or one after another without one"""
+    if fanout is not None:
+        return fanout.map(calls, return_exceptions)
+    results = []
+    for fn, args in calls:
+        try:
+            results.append(fn(*args))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
@@ -0,0 +1,87 @@
+import csv
+import os
+import re
+import sys
+
+from local_store import LRUCache, SQLiteStore
+
+# Where geocoding results are persisted between restarts
+LOCAL_STORE_PATH = os.getenv(
+    'LOCAL_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_cache.sqlite3')
+)
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', '2048'))
+
+
+def normalize_location(location_name):
+    """Canonical cache key for a typed location: case, spacing and punctuation are ignored"""
+    name = location_name.strip().lower()
+    name = re.sub(r'[^\w\s,]', ' ', name)
+    name = re.sub(r'\s*,\s*', ', ', name)
+    return re.sub(r'\s+', ' ', name).strip(' ,')
+
+
+class GeocodeCache:
+    """
+    Geocoding results ("lat,lon" per normalized query) held in an in-memory
+    LRU in front of a SQLite table, so lookups survive restarts.
+    """
+
+    def __init__(self, path=LOCAL_STORE_PATH, max_entries=GEOCODE_CACHE_SIZE):
+        self.memory = LRUCache(max_entries)
+        self.store = SQLiteStore(path, 'geocode')
+
+    def get(self, location_name):
+        key = normalize_location(location_name)
+        coords = self.memory.get(key)
+        if coords is None:
+            coords = self.store.get(key)
+            if coords is not None:
+                self.memory.set(key, coords)
+        return coords
+
+    def set(self, location_name, coords):
+        key = normalize_location(location_name)
+        self.memory.set(key, coords)
+        self.store.set(key, coords)
+
+    def preload_csv(self, path):
+        """
+        Load known locations from a CSV with a name column and either a
+        coordinates ("lat,lon") column or lat and lon columns.
+
+        Returns:
+            int: number of locations stored
+        """
+        items = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                name = (row.get('name') or '').strip()
+                if row.get('coordinates'):
+                    lat, lon = row['coordinates'].split(',')
+                else:
+                    lat, lon = row.get('lat'), row.get('lon')
+                try:
+                    coords = f"{float(lat)},{float(lon)}"
+                except (TypeError, ValueError):
+                    print(f"Skipping depot {name!r}: invalid coordinates")
+                    continue
+                if name:
+                    items.append((normalize_location(name), coords))
+
+        self.store.set_many(items)
+        for key, coords in items:
+            self.memory.set(key, coords)
+        return len(items)
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['stored'] = self.store.count()
+        return stats
+
+
+if __name__ == '__main__':
+    # Usage: python geocache.py depots.csv
+    cache = GeocodeCache()
+    for csv_path in sys.argv[1:]:
+        print(f"Loaded {cache.preload_csv(csv_path)} locations from {csv_path}")
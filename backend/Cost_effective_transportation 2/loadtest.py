@@ -0,0 +1,264 @@
+"""
+Load-test harness for /calculate and /calculate/batch.
+
+Drives the app at a fixed request rate (open loop: requests are sent on
+schedule whether or not earlier ones finished) and reports latency
+percentiles and the outbound calls made per request.
+
+Against an app that is already running behind upstream_standin.py:
+
+    python loadtest.py --app http://127.0.0.1:5000 --standin http://127.0.0.1:8600 --rps 20 --duration 30
+
+Or let the harness start both on free ports with cold local caches, which
+needs no network and no API keys:
+
+    python loadtest.py --spawn --latency 80 --rps 20 --duration 30 --workload mixed
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Lanes are drawn from these coordinates; fewer lanes means more cache hits
+CITIES = [
+    '28.6139,77.2090', '19.0760,72.8777', '12.9716,77.5946', '13.0827,80.2707',
+    '22.5726,88.3639', '17.3850,78.4867', '18.5204,73.8567', '23.0225,72.5714',
+    '26.9124,75.7873', '26.8467,80.9462', '21.1458,79.0882', '30.7333,76.7794',
+]
+VEHICLE_FUELS = [('truck', 'diesel'), ('truck', 'cng'), ('van', 'diesel'), ('van', 'petrol'), ('car', 'petrol')]
+
+
+def make_lanes(count, seed):
+    rng = random.Random(seed)
+    pairs = [(a, b) for a in CITIES for b in CITIES if a != b]
+    rng.shuffle(pairs)
+    return pairs[:max(1, count)]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Workload:
+    """Builds requests for one of the supported workloads"""
+
+    def __init__(self, name, lanes, batch_size, seed):
+        self.name = name
+        self.lanes = lanes
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def next_request(self):
+        with self.lock:
+            kind = self.name if self.name != 'mixed' else self.random.choice(['calculate', 'calculate', 'batch'])
+            if kind == 'calculate':
+                start, end = self.random.choice(self.lanes)
+                vehicle, fuel = self.random.choice(VEHICLE_FUELS)
+                return kind, 'calculate', {'data': {'start': start, 'end': end, 'vehicle': vehicle, 'fuel': fuel}}
+            shipments = []
+            for i in range(self.batch_size):
+                if self.random.random() < 0.5:
+                    start, end = self.random.choice(self.lanes)
+                    shipments.append({'id': i, 'start': start, 'end': end})
+                else:
+                    shipments.append({'id': i, 'distance_km': round(self.random.uniform(5, 2500), 1)})
+            return kind, 'calculate/batch', {'json': shipments}
+
+
+def succeeded(kind, response):
+    if response.status_code != 200:
+        return False
+    # /calculate renders errors into the page with a 200
+    return kind != 'calculate' or b'<div class="error">' not in response.content
+
+
+def fetch_json(url):
+    try:
+        return requests.get(url, timeout=5).json()
+    except Exception:
+        return None
+
+
+def run(app_url, workload, rps, duration, concurrency, standin_url=None, timeout=60):
+    """Send requests at `rps` for `duration` seconds and return the report dict"""
+    sessions = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    if standin_url:
+        requests.post(f"{standin_url}/__reset", timeout=5)
+    upstream_before = fetch_json(f"{app_url}/upstream/stats") or {}
+
+    def send(kind, path, kwargs, scheduled):
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        started = time.monotonic()
+        try:
+            response = session.post(f"{app_url}/{path}", timeout=timeout, **kwargs)
+            ok = succeeded(kind, response)
+        except requests.exceptions.RequestException:
+            ok = False
+        finished = time.monotonic()
+        with results_lock:
+            # Latency counts from the scheduled send time, so queueing in the harness shows up too
+            results.append((kind, ok, finished - scheduled, started - scheduled))
+
+    total = int(rps * duration)
+    began = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(total):
+            scheduled = began + i / rps
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            kind, path, kwargs = workload.next_request()
+            executor.submit(send, kind, path, kwargs, scheduled)
+    elapsed = time.monotonic() - began
+
+    report = {'workload': workload.name, 'target_rps': rps, 'duration': round(elapsed, 2),
+              'achieved_rps': round(len(results) / elapsed, 2) if elapsed else None}
+    for kind in sorted({r[0] for r in results}) + ['all']:
+        rows = [r for r in results if kind == 'all' or r[0] == kind]
+        if not rows:
+            continue
+        latencies = sorted(r[2] * 1000 for r in rows)
+        report[kind] = {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if not r[1]),
+            'p50_ms': round(percentile(latencies, 0.50), 1),
+            'p95_ms': round(percentile(latencies, 0.95), 1),
+            'p99_ms': round(percentile(latencies, 0.99), 1),
+            'max_ms': round(latencies[-1], 1),
+            'max_queue_ms': round(max(r[3] for r in rows) * 1000, 1)
+        }
+
+    if standin_url:
+        outbound = fetch_json(f"{standin_url}/__stats")
+        if outbound:
+            report['outbound'] = {name: counts['requests'] for name, counts in outbound.items()}
+            report['outbound_per_request'] = round(outbound['total']['requests'] / max(1, len(results)), 2)
+            report['outbound_errors'] = outbound['total']['errors']
+
+    upstream_after = fetch_json(f"{app_url}/upstream/stats") or {}
+    report['app_upstream'] = {
+        host: {key: value - upstream_before.get(host, {}).get(key, 0)
+               for key, value in counts.items() if isinstance(value, int)}
+        for host, counts in upstream_after.items()
+    }
+    return report
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def spawn(args, workdir):
+    """Start the stand-in and the app on free ports; returns (app_url, standin_url, processes)"""
+    standin_port, app_port = free_port(), free_port()
+    standin_url, app_url = f"http://127.0.0.1:{standin_port}", f"http://127.0.0.1:{app_port}"
+
+    standin_cmd = [sys.executable, os.path.join(APP_DIR, 'upstream_standin.py'), '--port', str(standin_port),
+                   '--latency', str(args.latency), '--jitter', str(args.jitter),
+                   '--error-rate', str(args.error_rate), '--seed', str(args.seed)]
+    if args.recordings:
+        standin_cmd += ['--recordings', args.recordings]
+
+    env = dict(os.environ,
+               TOMTOM_BASE_URL=standin_url, OPENWEATHER_BASE_URL=standin_url,
+               TOMTOM_API_KEY='offline', WEATHER_API_KEY='offline',
+               LOCAL_STORE_PATH=os.path.join(workdir, 'local_cache.sqlite3'))
+    app_cmd = [sys.executable, '-c', f"from app import app; app.run(port={app_port}, threaded=True)"]
+
+    processes = [subprocess.Popen(standin_cmd, stdout=subprocess.DEVNULL)]
+    wait_until_up(f"{standin_url}/__stats", processes[0])
+    processes.append(subprocess.Popen(app_cmd, cwd=APP_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    wait_until_up(f"{app_url}/upstream/stats", processes[1])
+    return app_url, standin_url, processes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--app', default='http://127.0.0.1:5000')
+    parser.add_argument('--standin', help='stand-in URL, for outbound call counts')
+    parser.add_argument('--workload', choices=['calculate', 'batch', 'mixed'], default='calculate')
+    parser.add_argument('--rps', type=float, default=10)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=64, help='most requests in flight')
+    parser.add_argument('--lanes', type=int, default=10, help='distinct start/end pairs to draw from')
+    parser.add_argument('--batch-size', type=int, default=200, help='shipments per batch request')
+    parser.add_argument('--warmup', type=float, default=0, help='seconds of unreported traffic first')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    spawned = parser.add_argument_group('--spawn', 'start the stand-in and the app locally')
+    spawned.add_argument('--spawn', action='store_true')
+    spawned.add_argument('--latency', type=float, default=50, help='stand-in latency per call in ms')
+    spawned.add_argument('--jitter', type=float, default=20)
+    spawned.add_argument('--error-rate', type=float, default=0)
+    spawned.add_argument('--recordings', help='recordings file for the stand-in to replay')
+    args = parser.parse_args(argv)
+
+    processes = []
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        app_url, standin_url = args.app.rstrip('/'), args.standin and args.standin.rstrip('/')
+        if args.spawn:
+            app_url, standin_url, processes = spawn(args, workdir.name)
+
+        workload = Workload(args.workload, make_lanes(args.lanes, args.seed), args.batch_size, args.seed)
+        if args.warmup:
+            run(app_url, workload, args.rps, args.warmup, args.concurrency, standin_url)
+        report = run(app_url, workload, args.rps, args.duration, args.concurrency, standin_url)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        workdir.cleanup()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['workload']}: {report['achieved_rps']} req/s over {report['duration']}s (target {report['target_rps']})")
+    for kind in [k for k in ('calculate', 'batch', 'all') if k in report]:
+        r = report[kind]
+        print(f"  {kind:<10} n={r['requests']:<6} errors={r['errors']:<4} p50={r['p50_ms']}ms "
+              f"p95={r['p95_ms']}ms p99={r['p99_ms']}ms max={r['max_ms']}ms")
+    if 'outbound' in report:
+        print(f"  outbound   {report['outbound_per_request']} calls/request, {report['outbound_errors']} failed: "
+              + ', '.join(f"{name}={count}" for name, count in report['outbound'].items() if name != 'total'))
+
+
+if __name__ == '__main__':
+    main()
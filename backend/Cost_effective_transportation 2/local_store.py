@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with an optional TTL.
+
+    get() only returns entries younger than `ttl` seconds; get_entry() also
+    returns expired ones with their age, for callers that can serve stale data.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key):
+        """Return (value, age_seconds) or None, ignoring the TTL"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], time.monotonic() - entry[1]
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        with self._lock:
+            if entry is None or (self.ttl is not None and entry[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def record_hit(self):
+        """Count a hit for a caller that reads entries through get_entry()"""
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def stored_at(self, key):
+        """Monotonic time the entry was last set, or None; does not count as a hit or a use"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class SQLiteStore:
+    """
+    Small persistent key/value table in a local SQLite file.
+
+    Values are stored as JSON. One connection is shared by all threads and
+    guarded by a lock; WAL mode lets other processes read while one writes.
+    """
+
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"(key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys that are stored"""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def set_many(self, items):
+        """Store (key, value) pairs in one transaction"""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items]
+            )
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
@@ -0,0 +1,220 @@
+import os
+import time
+
+import numpy as np
+
+from geocache import LOCAL_STORE_PATH
+from local_store import LRUCache, SQLiteStore
+from route_cache import snap_coords
+
+# Road distance is roughly this much longer than the great-circle distance
+ROAD_DISTANCE_FACTOR = float(os.getenv('ROAD_DISTANCE_FACTOR', '1.3'))
+# Average speed assumed for pairs without routing data
+FALLBACK_SPEED_KMH = float(os.getenv('FALLBACK_SPEED_KMH', '45'))
+PAIR_CACHE_SIZE = int(os.getenv('PAIR_CACHE_SIZE', '50000'))
+# Most origin x destination cells requested in one matrix call
+MATRIX_MAX_CELLS = int(os.getenv('MATRIX_MAX_CELLS', '2500'))
+# Time allowed for improving the trips once they are built
+OPTIMIZER_TIME_LIMIT = float(os.getenv('OPTIMIZER_TIME_LIMIT', '2'))
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def parse_coords(coords):
+    """Return (lat, lon) floats for a 'lat,lon' string"""
+    lat, lon = (float(value) for value in coords.split(','))
+    return lat, lon
+
+
+def haversine_matrix(points):
+    """Great-circle distances in km between every pair of (lat, lon) points"""
+    radians = np.radians(np.asarray(points, dtype=float))
+    lat, lon = radians[:, 0], radians[:, 1]
+    a = (np.sin((lat[None, :] - lat[:, None]) / 2) ** 2
+         + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin((lon[None, :] - lon[:, None]) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class PairDistanceCache:
+    """
+    Road distance and drive time between snapped coordinate pairs, held in
+    an in-memory LRU in front of a SQLite table. Road distances barely
+    change, so entries do not expire.
+    """
+
+    def __init__(self, path=LOCAL_STORE_PATH, max_entries=PAIR_CACHE_SIZE):
+        self.memory = LRUCache(max_entries)
+        self.store = SQLiteStore(path, 'pair_distances')
+
+    @staticmethod
+    def key(start_coords, end_coords, travel_mode):
+        return f"{snap_coords(start_coords)}|{snap_coords(end_coords)}|{travel_mode}"
+
+    def get_many(self, keys):
+        """Return {key: {'km': ..., 'minutes': ...}} for the pairs that are known"""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.memory.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            stored = self.store.get_many(missing)
+            for key, value in stored.items():
+                self.memory.set(key, value)
+            found.update(stored)
+        return found
+
+    def set_many(self, items):
+        items = list(items)
+        for key, value in items:
+            self.memory.set(key, value)
+        self.store.set_many(items)
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['stored'] = self.store.count()
+        return stats
+
+
+def build_matrix(coords, pair_cache, fetch_matrix=None, travel_mode='truck'):
+    """
+    Distance (km) and time (minutes) matrices between 'lat,lon' points.
+
+    Known pairs come from `pair_cache`. The missing ones are requested in
+    blocks of at most MATRIX_MAX_CELLS through fetch_matrix(origins,
+    destinations), which returns {(i, j): {'km', 'minutes'}} for the cells
+    it could route; whatever is still missing falls back to the haversine
+    distance scaled by ROAD_DISTANCE_FACTOR.
+
+    Returns:
+        tuple: (distances, minutes, sources) where sources counts the cells
+            taken from the cache, the routing API and the fallback
+    """
+    n = len(coords)
+    distances = np.zeros((n, n))
+    minutes = np.zeros((n, n))
+    known = np.eye(n, dtype=bool)
+    keys = {(i, j): pair_cache.key(coords[i], coords[j], travel_mode) for i in range(n) for j in range(n) if i != j}
+
+    cached = pair_cache.get_many(keys.values())
+    for (i, j), key in keys.items():
+        if key in cached:
+            distances[i, j] = cached[key]['km']
+            minutes[i, j] = cached[key]['minutes']
+            known[i, j] = True
+    sources = {'cache': len(cached), 'routing': 0, 'fallback': 0}
+
+    if fetch_matrix is not None and not known.all():
+        rows = np.flatnonzero(~known.all(axis=1))
+        columns = np.flatnonzero(~known.all(axis=0))
+        block = max(1, MATRIX_MAX_CELLS // len(columns))
+        fetched = []
+        for start in range(0, len(rows), block):
+            origins = rows[start:start + block]
+            try:
+                cells = fetch_matrix([coords[i] for i in origins], [coords[j] for j in columns])
+            except Exception as e:
+                print(f"Distance matrix error: {str(e)}")
+                continue
+            for (row, column), value in cells.items():
+                i, j = int(origins[row]), int(columns[column])
+                if i == j or known[i, j]:
+                    continue
+                distances[i, j] = value['km']
+                minutes[i, j] = value['minutes']
+                known[i, j] = True
+                fetched.append((keys[(i, j)], value))
+        if fetched:
+            pair_cache.set_many(fetched)
+        sources['routing'] = len(fetched)
+
+    if not known.all():
+        estimate = haversine_matrix([parse_coords(c) for c in coords]) * ROAD_DISTANCE_FACTOR
+        distances = np.where(known, distances, estimate)
+        minutes = np.where(known, minutes, estimate / FALLBACK_SPEED_KMH * 60)
+        sources['fallback'] = int((~known).sum())
+
+    return distances, minutes, sources
+
+
+def _path_cost(cost, path):
+    return cost[path[:-1], path[1:]].sum()
+
+
+def _savings_trips(cost, demands, capacity):
+    """Clarke-Wright savings: start with one trip per stop and merge the most profitable ends"""
+    n = len(cost)
+    trips = {i: [i] for i in range(1, n)}
+    trip_of = {i: i for i in range(1, n)}
+    loads = {i: demands[i] for i in range(1, n)}
+
+    # Saving of driving i -> j directly instead of i -> depot -> j
+    savings = cost[1:, :1] + cost[:1, 1:] - cost[1:, 1:]
+    np.fill_diagonal(savings, -np.inf)
+    order = np.argsort(savings, axis=None)[::-1]
+
+    for flat in order:
+        i, j = divmod(int(flat), n - 1)
+        if savings[i, j] <= 0:
+            break
+        i, j = i + 1, j + 1
+        a, b = trip_of[i], trip_of[j]
+        if a == b or trips[a][-1] != i or trips[b][0] != j or loads[a] + loads[b] > capacity:
+            continue
+        trips[a].extend(trips[b])
+        loads[a] += loads.pop(b)
+        for stop in trips.pop(b):
+            trip_of[stop] = a
+
+    return list(trips.values())
+
+
+def _two_opt(cost, trip, deadline):
+    """Improve one depot-to-depot trip by reversing segments while that shortens it"""
+    path = np.array([0] + trip + [0])
+    best = _path_cost(cost, path)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(1, len(path) - 2):
+            for j in range(i + 1, len(path) - 1):
+                candidate = np.concatenate([path[:i], path[i:j + 1][::-1], path[j + 1:]])
+                candidate_cost = _path_cost(cost, candidate)
+                if candidate_cost < best - 1e-9:
+                    path, best = candidate, candidate_cost
+                    improved = True
+    return path[1:-1].tolist()
+
+
+def solve_trips(distances, demands, capacity, return_to_depot=True, time_limit=OPTIMIZER_TIME_LIMIT):
+    """
+    Split the stops into trips that respect the vehicle capacity and order each trip.
+
+    Index 0 of `distances` is the depot. Trips start at the depot and come
+    back to it unless `return_to_depot` is False. Uses Clarke-Wright
+    savings followed by 2-opt within each trip.
+
+    Returns:
+        list: trips, each a list of stop indices in visiting order
+    """
+    demands = np.asarray(demands, dtype=float)
+    if len(distances) < 2:
+        return []
+    if (demands[1:] > capacity).any():
+        raise ValueError('A stop needs more than the vehicle capacity')
+
+    cost = np.array(distances, dtype=float)
+    if not return_to_depot:
+        cost[:, 0] = 0
+
+    trips = _savings_trips(cost, demands, capacity)
+    deadline = time.monotonic() + time_limit
+    return [_two_opt(cost, trip, deadline) for trip in trips]
+
+
+def trip_legs(trip, return_to_depot=True):
+    """Matrix indices travelled by a trip, depot first"""
+    return [0] + trip + ([0] if return_to_depot else [])
@@ -0,0 +1,205 @@
+import math
+import os
+
+import numpy as np
+
+from local_store import LRUCache
+
+# Grid cell size in degrees (0.1 is roughly 11 km); one nearby search covers one cell
+POI_CELL_DEG = float(os.getenv('POI_CELL_DEG', '0.1'))
+# Hotels, restaurants and fuel stations rarely change, so cells stay valid for a day
+POI_CELL_TTL = float(os.getenv('POI_CELL_TTL', '86400'))
+POI_INDEX_SIZE = int(os.getenv('POI_INDEX_SIZE', '20000'))
+# Cells sampled per route section when the corridor is not indexed yet
+POI_SAMPLES_PER_SECTION = int(os.getenv('POI_SAMPLES_PER_SECTION', '5'))
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def poi_category(result, categories):
+    """Return which of `categories` a TomTom search result belongs to, or None"""
+    for category_set in result.get('poi', {}).get('categorySet', []):
+        category_id = str(category_set.get('id', ''))
+        for category in categories:
+            if category_id.startswith(category):
+                return category
+    return None
+
+
+class PartialCell(list):
+    """
+    Search results for a cell that are known to be incomplete. They answer
+    the query that fetched them but are not indexed, so a later query
+    fetches the cell again.
+    """
+
+
+class POIIndex:
+    """
+    Grid index of TomTom POIs for all tracked categories.
+
+    The world is split into square cells of `cell_deg` degrees. A cell is
+    filled by one nearby search around its centre for every category at
+    once, and stays valid for `ttl` seconds. Route queries are answered from
+    the indexed cells and only fetch the sampled cells that are missing.
+    """
+
+    def __init__(self, cell_deg=POI_CELL_DEG, ttl=POI_CELL_TTL, max_cells=POI_INDEX_SIZE):
+        self.cell_deg = cell_deg
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.partial_fetches = 0
+        self._cells = LRUCache(max_cells, ttl)
+
+    def cell_of(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def cell_center(self, cell):
+        return ((cell[0] + 0.5) * self.cell_deg, (cell[1] + 0.5) * self.cell_deg)
+
+    def cell_radius(self, cell):
+        """Search radius in metres that covers the whole cell from its centre"""
+        lat, lon = self.cell_center(cell)
+        corner = (cell[0] * self.cell_deg, cell[1] * self.cell_deg)
+        return math.ceil(haversine_km(lat, lon, *corner) * 1000)
+
+    def _indexed(self, cell):
+        return self._cells.get(cell)
+
+    def fill(self, cells, fetch_cells):
+        """
+        Fetch the cells that are not indexed yet.
+
+        Args:
+            cells (iterable): cell keys that should be available
+            fetch_cells (callable): takes a list of cells and returns one list
+                of TomTom results per cell, a PartialCell, or an exception for
+                a failed cell
+
+        Returns:
+            dict: cell -> results for the cells that came back partial
+        """
+        missing = [cell for cell in dict.fromkeys(cells) if self._indexed(cell) is None]
+        if not missing:
+            return {}
+        self.fetches += len(missing)
+        partial = {}
+        for cell, results in zip(missing, fetch_cells(missing)):
+            if isinstance(results, Exception):
+                self.fetch_errors += 1
+                print(f"POI cell fetch error for {cell}: {str(results)}")
+                continue
+            if isinstance(results, PartialCell):
+                self.partial_fetches += 1
+                partial[cell] = results
+                continue
+            self._cells.set(cell, results)
+        return partial
+
+    def pois_along_route(self, waypoints, categories, fetch_cells, radius_km=5, max_pois=15,
+                         samples_per_section=POI_SAMPLES_PER_SECTION):
+        """
+        Return up to `max_pois` POIs per category within `radius_km` of a polyline.
+
+        POIs are split over the start, middle and end of the route (33%, 33%
+        and 34%), picking the ones closest to the route in each section.
+
+        Args:
+            waypoints (list): TomTom route points with 'latitude'/'longitude'
+            categories (list): TomTom category ids, e.g. ['7314', '7315']
+            fetch_cells (callable): see fill()
+
+        Returns:
+            dict: category -> list of raw TomTom results, in route order
+        """
+        points = [(point['latitude'], point['longitude']) for point in waypoints]
+        if not points:
+            return {category: [] for category in categories}
+
+        bounds = [0, len(points) // 3, 2 * len(points) // 3, len(points)]
+        quotas = [max_pois // 3, max_pois // 3, max_pois // 3 + max_pois % 3]
+
+        # Make sure a few evenly spaced cells per section are indexed
+        samples = []
+        for start, end in zip(bounds, bounds[1:]):
+            section = points[start:end]
+            if section:
+                step = max(1, len(section) // samples_per_section)
+                samples.extend(section[::step][:samples_per_section])
+        partial = self.fill([self.cell_of(lat, lon) for lat, lon in samples], fetch_cells)
+
+        # Bucket the polyline by cell so POIs are only compared to nearby points
+        buckets = {}
+        for index, (lat, lon) in enumerate(points):
+            buckets.setdefault(self.cell_of(lat, lon), []).append(index)
+        ring = max(1, math.ceil(radius_km / (KM_PER_DEGREE * self.cell_deg)))
+
+        # Within a few km a flat projection around the route's latitude is accurate enough
+        scale = np.array([KM_PER_DEGREE, KM_PER_DEGREE * math.cos(math.radians(points[len(points) // 2][0]))])
+        route_xy = np.array(points) * scale
+
+        # Every indexed cell the route passes through contributes its POIs
+        candidates = {}
+        for cell in buckets:
+            results = self._indexed(cell)
+            if results is None:
+                results = partial.get(cell, [])
+            for result in results:
+                candidates.setdefault(result.get('id') or id(result), result)
+
+        # Group the POIs by cell and measure each group against the route points around it at once
+        groups = {}
+        for result in candidates.values():
+            category = poi_category(result, categories)
+            if category is not None:
+                position = result['position']
+                groups.setdefault(self.cell_of(position['lat'], position['lon']), []).append((category, result))
+
+        nearest = {category: [] for category in categories}
+        for (row, col), group in groups.items():
+            nearby = [
+                buckets[(row + d_row, col + d_col)]
+                for d_row in range(-ring, ring + 1)
+                for d_col in range(-ring, ring + 1)
+                if (row + d_row, col + d_col) in buckets
+            ]
+            if not nearby:
+                continue
+            indices = np.concatenate(nearby)
+            poi_xy = np.array([(r['position']['lat'], r['position']['lon']) for _, r in group]) * scale
+            offsets = poi_xy[:, None, :] - route_xy[indices][None, :, :]
+            distances = np.hypot(offsets[..., 0], offsets[..., 1])
+            closest = distances.argmin(axis=1)
+            for k, (category, result) in enumerate(group):
+                distance = distances[k, closest[k]]
+                if distance <= radius_km:
+                    nearest[category].append((int(indices[closest[k]]), float(distance), result))
+
+        pois = {}
+        for category, matches in nearest.items():
+            chosen = []
+            for (start, end), quota in zip(zip(bounds, bounds[1:]), quotas):
+                section = [match for match in matches if start <= match[0] < end]
+                section.sort(key=lambda match: match[1])
+                chosen.extend(section[:quota])
+            chosen.sort(key=lambda match: match[0])
+            pois[category] = [match[2] for match in chosen]
+        return pois
+
+    def stats(self):
+        stats = self._cells.stats()
+        stats.update({
+            'cell_deg': self.cell_deg,
+            'fetches': self.fetches,
+            'fetch_errors': self.fetch_errors,
+            'partial_fetches': self.partial_fetches
+        })
+        return stats
@@ -0,0 +1,102 @@
+import math
+import os
+
+import numpy as np
+
+# Points closer than this many metres to the simplified line are dropped
+ROUTE_SIMPLIFY_TOLERANCE = float(os.getenv('ROUTE_SIMPLIFY_TOLERANCE', '15'))
+# Decimal places kept by the encoded polyline (5 is roughly 1 m)
+POLYLINE_PRECISION = int(os.getenv('POLYLINE_PRECISION', '5'))
+
+
+def route_points(route):
+    """Return the route geometry as an (n, 2) array of lat, lon"""
+    points = route['legs'][0]['points']
+    return np.array([(point['latitude'], point['longitude']) for point in points], dtype=float).reshape(-1, 2)
+
+
+def simplify(points, tolerance=ROUTE_SIMPLIFY_TOLERANCE):
+    """
+    Douglas-Peucker simplification of an (n, 2) lat/lon array.
+
+    Points are projected to metres around the route's mean latitude, which
+    is accurate enough for a tolerance of a few metres. The first and last
+    points are always kept.
+    """
+    if len(points) < 3 or tolerance <= 0:
+        return points
+
+    scale = np.array([110540.0, 111320.0 * math.cos(math.radians(points[:, 0].mean()))])
+    xy = points * scale
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = xy[first], xy[last]
+        segment = end - start
+        length = np.hypot(*segment)
+        offsets = xy[first + 1:last] - start
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return points[keep]
+
+
+def encode(points, precision=POLYLINE_PRECISION):
+    """Encode an (n, 2) lat/lon array with the Google encoded polyline algorithm"""
+    factor = 10 ** precision
+    values = np.round(np.asarray(points, dtype=float) * factor).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    chunks = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def decode(encoded, precision=POLYLINE_PRECISION):
+    """Decode an encoded polyline back into an (n, 2) lat/lon array"""
+    deltas = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return np.cumsum(np.array(deltas, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def compact_route(route, tolerance=ROUTE_SIMPLIFY_TOLERANCE, precision=POLYLINE_PRECISION):
+    """
+    Return a copy of a TomTom route with its legs replaced by a simplified,
+    encoded polyline, for embedding in pages and API responses.
+    """
+    points = route_points(route)
+    simplified = simplify(points, tolerance)
+    compact = {key: value for key, value in route.items() if key not in ('legs', 'guidance', 'sections')}
+    compact['geometry'] = {
+        'polyline': encode(simplified, precision),
+        'precision': precision,
+        'tolerance': tolerance,
+        'points': len(points),
+        'simplified_points': len(simplified)
+    }
+    return compact
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from local_store import LRUCache
+
+# Routes carry live traffic, so they are only fresh for a short time
+ROUTE_CACHE_TTL = float(os.getenv('ROUTE_CACHE_TTL', '300'))
+# Up to this age a stale route is still served while it is refreshed in the background
+ROUTE_CACHE_STALE = float(os.getenv('ROUTE_CACHE_STALE', '1800'))
+ROUTE_CACHE_SIZE = int(os.getenv('ROUTE_CACHE_SIZE', '1024'))
+# Decimal places coordinates are snapped to (3 is roughly 100 m)
+ROUTE_SNAP_DECIMALS = int(os.getenv('ROUTE_SNAP_DECIMALS', '3'))
+
+
+def snap_coords(coords, decimals=ROUTE_SNAP_DECIMALS):
+    """Round a 'lat,lon' string so nearby points share a cache key"""
+    lat, lon = (float(value) for value in coords.split(','))
+    return f"{round(lat, decimals):.{decimals}f},{round(lon, decimals):.{decimals}f}"
+
+
+class RouteCache:
+    """
+    Cache of TomTom routes keyed on snapped start/end, route type and vehicle.
+
+    Fresh routes (younger than `ttl`) are returned directly. Stale routes up
+    to `stale_ttl` old are returned immediately too, while a single
+    background refresh per key fetches the current traffic picture.
+    """
+
+    def __init__(self, ttl=ROUTE_CACHE_TTL, stale_ttl=ROUTE_CACHE_STALE, max_entries=ROUTE_CACHE_SIZE):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._cache = LRUCache(max_entries)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='route-refresh')
+
+    @staticmethod
+    def key(start_coords, end_coords, route_type, travel_mode):
+        return (snap_coords(start_coords), snap_coords(end_coords), route_type, travel_mode)
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached route for `key`, calling fetch() when there is no usable one"""
+        entry = self._cache.get_entry(key)
+        if entry is not None:
+            route, age = entry
+            if age <= self.ttl:
+                self._cache.record_hit()
+                return route
+            if age <= self.stale_ttl:
+                self._count('stale_hits')
+                self._refresh(key, fetch)
+                return route
+
+        self._cache.record_miss()
+        route = fetch()
+        self._cache.set(key, route)
+        return route
+
+    def version(self, key):
+        """Stamp of the cached route for `key` while it is fresh, else None"""
+        stored_at = self._cache.stored_at(key)
+        if stored_at is None or time.monotonic() - stored_at > self.ttl:
+            return None
+        return stored_at
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _refresh(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._cache.set(key, fetch())
+                self._count('refreshes')
+            except Exception as e:
+                self._count('refresh_errors')
+                print(f"Background route refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(run)
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._lock:
+            stats.update({
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+                'stale_hits': self.stale_hits,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors
+            })
+        return stats
@@ -0,0 +1,71 @@
+import threading
+
+from deadline import DeadlineExceeded, current_deadline
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls.
+
+    The first caller for a key runs the call; callers that arrive while it
+    is in flight wait for it and share its result or exception. Nothing is
+    kept once the call finishes, so results are never stale.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Return (result, shared) for fn(), where shared is True when the
+        result came from another caller's call.
+
+        A waiting caller stops at its own request Deadline. If the shared
+        call only failed because its caller ran out of time, the waiter
+        makes the call itself.
+        """
+        while True:
+            with self._lock:
+                call = self._in_flight.get(key)
+                leader = call is None
+                if leader:
+                    call = self._in_flight[key] = _Call()
+                    self.calls += 1
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                try:
+                    call.result = fn()
+                except BaseException as e:
+                    call.error = e
+                finally:
+                    with self._lock:
+                        del self._in_flight[key]
+                    call.done.set()
+                if call.error is not None:
+                    raise call.error
+                return call.result, False
+
+            deadline = current_deadline()
+            if not call.done.wait(deadline.remaining() if deadline else None):
+                raise DeadlineExceeded('Request time budget exhausted')
+            if isinstance(call.error, DeadlineExceeded):
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
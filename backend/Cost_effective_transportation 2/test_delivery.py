@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+os.environ.setdefault('LOCAL_STORE_PATH', os.path.join(tempfile.mkdtemp(), 'local_cache.sqlite3'))
+
+import app  # noqa: E402
+import delivery  # noqa: E402
+
+ROWS = [
+    {'id': 'a', 'vehicle': 'truck', 'fuel': 'diesel', 'distance_km': '120'},
+    {'id': 'b', 'vehicle': 'van', 'fuel': 'petrol', 'distance_km': '35.5'},
+    {'id': 'c', 'vehicle': 'car', 'fuel': 'diesel', 'distance_km': '-4'},
+    {'id': 'd', 'vehicle': 'truck', 'fuel': 'cng', 'start': '28.614,77.209', 'end': '28.704,77.102'},
+    {'id': 'e', 'vehicle': 'van', 'fuel': 'cng', 'start': '28.614,77.209', 'end': '28.704,77.102'},
+    {'id': 'f', 'vehicle': 'car', 'fuel': 'petrol', 'distance_km': '8'},
+]
+
+
+def write_shipments(directory):
+    path = os.path.join(directory, 'shipments.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['id', 'vehicle', 'fuel', 'distance_km', 'start', 'end'])
+        writer.writeheader()
+        writer.writerows(ROWS)
+    return path
+
+
+def fake_route(monkeypatch):
+    routed = []
+
+    def get_cached_route(start_coords, end_coords, route_type, api_key):
+        routed.append((start_coords, end_coords))
+        return {'summary': {'lengthInMeters': 15400, 'travelTimeInSeconds': 1800}}
+
+    monkeypatch.setattr(app, 'get_cached_route', get_cached_route)
+    monkeypatch.setenv('TOMTOM_API_KEY', 'key')
+    return routed
+
+
+def test_importing_delivery_does_not_load_the_web_app():
+    code = 'import sys, delivery; sys.exit("app" in sys.modules)'
+    assert subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__))).returncode == 0
+
+
+def test_batch_prices_rows_with_the_shared_cost_tables(tmp_path, monkeypatch):
+    routed = fake_route(monkeypatch)
+    output = str(tmp_path / 'priced.jsonl')
+
+    summary = delivery.run_batch(write_shipments(str(tmp_path)), output, workers=2, window_size=2)
+
+    with open(output) as f:
+        results = [json.loads(line) for line in f]
+    assert [result['row'] for result in results] == [1, 2, 3, 4, 5, 6]
+    assert summary['priced'] == 5 and summary['failed'] == 1
+    assert 'negative' in results[2]['error']
+    assert results[3]['distance_km'] == results[4]['distance_km'] == 15.4
+    expected = delivery.calculate_costs('van', 'petrol', 35.5)['total']['total']
+    assert results[1]['total_cost'] == round(expected, 2)
+    # The lane is routed at most once; the other row on it reads the pair cache
+    assert len(routed) <= 1
+    assert summary['lookups'] == {'routing': len(routed), 'cache': 2 - len(routed)}
+
+
+def test_resume_continues_after_the_last_complete_row(tmp_path, monkeypatch):
+    fake_route(monkeypatch)
+    shipments = write_shipments(str(tmp_path))
+    complete = str(tmp_path / 'complete.csv')
+    delivery.run_batch(shipments, complete, window_size=2)
+    with open(complete, newline='') as f:
+        expected = f.read()
+
+    # An interrupted run: the header, three rows and half of the fourth
+    lines = expected.splitlines(keepends=True)
+    interrupted = str(tmp_path / 'interrupted.csv')
+    with open(interrupted, 'w', newline='') as f:
+        f.write(''.join(lines[:4]) + lines[4][:10])
+
+    summary = delivery.run_batch(shipments, interrupted, resume=True, window_size=2)
+
+    assert summary['skipped'] == 3
+    assert summary['priced'] + summary['failed'] == 3
+    with open(interrupted, newline='') as f:
+        assert f.read() == expected
@@ -0,0 +1,31 @@
+from geocache import GeocodeCache, normalize_location
+
+
+def test_spelling_variants_share_a_key():
+    assert normalize_location('  New   Delhi ,India. ') == normalize_location('new delhi, india')
+
+
+def test_lookups_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'local_cache.sqlite3')
+    GeocodeCache(path).set('Mumbai', '19.076,72.8777')
+
+    restarted = GeocodeCache(path)
+
+    assert restarted.get('mumbai') == '19.076,72.8777'
+    assert restarted.get('MUMBAI!') == '19.076,72.8777'
+    assert restarted.stats()['hits'] == 1
+    assert restarted.get('Pune') is None
+
+
+def test_preload_skips_depots_without_coordinates(tmp_path):
+    depots = tmp_path / 'depots.csv'
+    depots.write_text('name,coordinates,lat,lon\n'
+                      'Depot A,"28.61,77.20",,\n'
+                      'Depot B,,12.97,77.59\n'
+                      'Depot C,,,\n')
+    cache = GeocodeCache(str(tmp_path / 'local_cache.sqlite3'))
+
+    assert cache.preload_csv(str(depots)) == 2
+    assert cache.get('depot a') == '28.61,77.2'
+    assert cache.get('Depot B') == '12.97,77.59'
+    assert cache.stats()['stored'] == 2
@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+os.environ.setdefault('LOCAL_STORE_PATH', os.path.join(tempfile.mkdtemp(), 'local_cache.sqlite3'))
+
+import app  # noqa: E402
+from poi_index import PartialCell, poi_category  # noqa: E402
+
+RESTAURANT, FUEL, HOTEL = '7315', '7311', '7314'
+
+
+def fake_places(counts):
+    """A get_nearby_places stand-in with `counts[category]` results per category, returned in that order"""
+    calls = []
+
+    def get_nearby_places(coords, category, api_key, radius=5000, limit=10):
+        calls.append(category)
+        results = []
+        for wanted in category.split(','):
+            results += [
+                {'id': f"{wanted}-{i}", 'poi': {'name': f"{wanted} {i}", 'categorySet': [{'id': int(wanted + '002')}]},
+                 'position': {'lat': coords[0], 'lon': coords[1]}}
+                for i in range(counts.get(wanted, 0))
+            ]
+        return results[:limit]
+
+    return get_nearby_places, calls
+
+
+def test_dense_category_does_not_crowd_out_the_others(monkeypatch):
+    places, calls = fake_places({RESTAURANT: app.POI_CELL_LIMIT + 50, FUEL: 3, HOTEL: 2})
+    monkeypatch.setattr(app, 'get_nearby_places', places)
+
+    [results] = app.fetch_poi_cells([(286, 772)], [RESTAURANT, FUEL, HOTEL], 'key')
+
+    assert not isinstance(results, PartialCell)
+    found = [poi_category(result, [RESTAURANT, FUEL, HOTEL]) for result in results]
+    assert found.count(FUEL) == 3
+    assert found.count(HOTEL) == 2
+    assert found.count(RESTAURANT) == app.POI_CELL_LIMIT
+    assert len({result['id'] for result in results}) == len(results)
+    assert calls == [f"{RESTAURANT},{FUEL},{HOTEL}", RESTAURANT, FUEL, HOTEL]
+
+
+def test_cell_under_the_cap_takes_one_search(monkeypatch):
+    places, calls = fake_places({RESTAURANT: 10, FUEL: 3, HOTEL: 2})
+    monkeypatch.setattr(app, 'get_nearby_places', places)
+
+    [results] = app.fetch_poi_cells([(286, 772)], [RESTAURANT, FUEL, HOTEL], 'key')
+
+    assert len(results) == 15
+    assert len(calls) == 1
+
+
+def test_split_searches_are_capped_per_lookup(monkeypatch):
+    places, calls = fake_places({RESTAURANT: app.POI_CELL_LIMIT + 50, FUEL: 3, HOTEL: 2})
+    monkeypatch.setattr(app, 'get_nearby_places', places)
+    monkeypatch.setattr(app, 'POI_SPLIT_CELLS', 2)
+    cells = [(286, 772 + i) for i in range(5)]
+
+    results = app.fetch_poi_cells(cells, [RESTAURANT, FUEL, HOTEL], 'key')
+
+    assert len(calls) == len(cells) + 2 * 3
+    assert [isinstance(result, PartialCell) for result in results] == [False, False, True, True, True]
+
+
+def test_partial_cells_answer_the_lookup_but_are_fetched_again():
+    index = app.POIIndex()
+    cell = (286, 772)
+    fetched = []
+
+    def fetch_cells(cells):
+        fetched.extend(cells)
+        return [PartialCell([{'id': 'a'}]) for _ in cells]
+
+    assert index.fill([cell], fetch_cells) == {cell: [{'id': 'a'}]}
+    index.fill([cell], fetch_cells)
+    assert fetched == [cell, cell]
+    assert index.stats()['partial_fetches'] == 2
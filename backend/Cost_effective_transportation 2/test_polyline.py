@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from polyline import compact_route, decode, encode, simplify
+
+# The worked example from the encoded polyline algorithm format documentation
+REFERENCE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+REFERENCE_ENCODED = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+def test_encodes_the_reference_example():
+    assert encode(REFERENCE_POINTS) == REFERENCE_ENCODED
+    np.testing.assert_allclose(decode(REFERENCE_ENCODED), REFERENCE_POINTS)
+
+
+@pytest.mark.parametrize('precision', [5, 6])
+def test_round_trip_is_exact_to_the_precision(precision):
+    rng = np.random.default_rng(precision)
+    points = np.column_stack([rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)])
+
+    decoded = decode(encode(points, precision), precision)
+
+    np.testing.assert_allclose(decoded, np.round(points, precision), atol=10 ** -(precision + 3))
+
+
+@pytest.mark.parametrize('points', [np.zeros((0, 2)), np.array([[28.6139, 77.209]])])
+def test_round_trips_empty_and_single_point_lines(points):
+    np.testing.assert_allclose(decode(encode(points)).reshape(-1, 2), points)
+
+
+def test_simplify_drops_points_within_tolerance_and_keeps_corners():
+    # East along a parallel with 1 m wobble, then a right-angle turn north
+    east = np.column_stack([np.full(50, 28.6) + np.tile([0, 0.00001], 25), np.linspace(77.0, 77.1, 50)])
+    north = np.column_stack([np.linspace(28.6, 28.7, 50)[1:], np.full(49, 77.1)])
+    points = np.vstack([east, north])
+
+    simplified = simplify(points, tolerance=15)
+
+    assert len(simplified) == 3
+    np.testing.assert_array_equal(simplified[[0, -1]], points[[0, -1]])
+
+
+def test_compact_route_reports_its_geometry():
+    route = {'summary': {'lengthInMeters': 1000},
+             'legs': [{'points': [{'latitude': lat, 'longitude': 77.2} for lat in np.linspace(28.6, 28.7, 20)]}]}
+
+    compact = compact_route(route, tolerance=15, precision=5)
+
+    assert 'legs' not in compact and compact['summary'] == route['summary']
+    assert compact['geometry']['points'] == 20
+    assert compact['geometry']['simplified_points'] == 2
+    np.testing.assert_allclose(decode(compact['geometry']['polyline']), [(28.6, 77.2), (28.7, 77.2)])
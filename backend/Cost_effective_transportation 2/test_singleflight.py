@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded
+from singleflight import SingleFlight
+
+
+def blocked_call(result=None, error=None):
+    """A call that runs until `release` is set, counting how often it ran"""
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+
+    return fn, started, release, runs
+
+
+def join_while_in_flight(flight, key, fn, started, release, waiters=4):
+    """Start one leader, let `waiters` callers join it, then let it finish"""
+    with ThreadPoolExecutor(max_workers=waiters + 1) as executor:
+        leader = executor.submit(flight.do, key, fn)
+        started.wait(5)
+        followers = [executor.submit(flight.do, key, fn) for _ in range(waiters)]
+        while flight.stats()['coalesced'] < waiters:
+            time.sleep(0.01)
+        release.set()
+        return leader, followers
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    fn, started, release, runs = blocked_call(result={'km': 12})
+
+    leader, followers = join_while_in_flight(flight, 'lane', fn, started, release)
+
+    assert leader.result() == ({'km': 12}, False)
+    assert [follower.result() for follower in followers] == [({'km': 12}, True)] * 4
+    assert len(runs) == 1
+    assert flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_callers_share_the_leaders_exception():
+    flight = SingleFlight()
+    fn, started, release, runs = blocked_call(error=ConnectionError('upstream down'))
+
+    leader, followers = join_while_in_flight(flight, 'lane', fn, started, release, waiters=2)
+
+    for future in [leader] + followers:
+        with pytest.raises(ConnectionError):
+            future.result()
+    assert len(runs) == 1
+
+
+def test_finished_calls_are_not_reused():
+    flight = SingleFlight()
+    results = iter(['first', 'second'])
+
+    assert flight.do('lane', lambda: next(results)) == ('first', False)
+    assert flight.do('lane', lambda: next(results)) == ('second', False)
+
+
+def test_waiter_stops_at_its_own_deadline():
+    flight = SingleFlight()
+    fn, started, release, _ = blocked_call(result='late')
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        leader = executor.submit(flight.do, 'lane', fn)
+        started.wait(5)
+        with Deadline(budget=0.05), pytest.raises(DeadlineExceeded):
+            flight.do('lane', fn)
+        release.set()
+        assert leader.result() == ('late', False)
+
+
+def test_waiter_retries_when_the_leader_ran_out_of_time():
+    flight = SingleFlight()
+    fn, started, release, _ = blocked_call(error=DeadlineExceeded('leader budget exhausted'))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, 'lane', fn)
+        started.wait(5)
+        follower = executor.submit(flight.do, 'lane', lambda: 'own call')
+        while flight.stats()['coalesced'] < 1:
+            time.sleep(0.01)
+        release.set()
+
+        with pytest.raises(DeadlineExceeded):
+            leader.result()
+        assert follower.result() == ('own call', False)
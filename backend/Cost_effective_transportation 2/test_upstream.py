@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import upstream
+from upstream import CircuitBreaker, CircuitOpenError
+
+
+class FakeResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b'{}'
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Send requests to a stand-in session; append a response or exception to `calls` to answer the next one"""
+    answers = []
+
+    def request(method, url, **kwargs):
+        answer = answers.pop(0)
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(upstream._session, 'request', request)
+    monkeypatch.setattr(upstream, 'MAX_RETRIES', 0)
+    return answers
+
+
+def test_breaker_opens_then_lets_one_trial_through_and_closes():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_release_only_frees_the_callers_own_trial():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    breaker.record_failure()
+    assert breaker.allow()
+
+    other = threading.Thread(target=breaker.release)
+    other.start()
+    other.join()
+    assert breaker.trial_in_flight
+
+    breaker.release()
+    assert not breaker.trial_in_flight
+
+
+def breaker_for(url, threshold=1, cooldown=0):
+    breaker, _ = upstream._upstream(upstream._endpoint(url))
+    breaker.threshold, breaker.cooldown = threshold, cooldown
+    return breaker
+
+
+def test_unexpected_error_in_a_trial_call_releases_it(calls):
+    url = 'http://trial.test/routing/1/calculateRoute/1,2:3,4/json'
+    breaker = breaker_for(url)
+    breaker.record_failure()
+    assert breaker.state == 'half-open'
+
+    calls.append(RuntimeError('bug while sending'))
+    with pytest.raises(RuntimeError):
+        upstream.http_get(url)
+    assert not breaker.trial_in_flight
+
+    calls.append(FakeResponse(200))
+    assert upstream.http_get(url).status_code == 200
+    assert breaker.state == 'closed'
+
+
+def test_other_request_errors_count_as_failures(calls):
+    url = 'http://invalid.test/search/2/geocode/x.json'
+    calls.append(requests.exceptions.ChunkedEncodingError('truncated body'))
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        upstream.http_get(url)
+    assert upstream.upstream_stats()[upstream._endpoint(url)]['failures'] == 1
+
+
+def test_breakers_are_kept_per_endpoint(calls):
+    geocode = 'http://split.test/search/2/geocode/somewhere.json'
+    route = 'http://split.test/routing/1/calculateRoute/1,2:3,4/json'
+    assert upstream._endpoint(geocode) == 'split.test/search/2/geocode'
+    breaker_for(geocode, cooldown=60)
+
+    calls.append(requests.exceptions.ConnectionError('down'))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        upstream.http_get(geocode)
+    with pytest.raises(CircuitOpenError):
+        upstream.http_get(geocode)
+
+    calls.append(FakeResponse(200))
+    assert upstream.http_get(route).status_code == 200
@@ -0,0 +1,267 @@
+import json as jsonlib
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import DeadlineExceeded, current_deadline
+from singleflight import SingleFlight
+
+# Outbound HTTP settings, overridable from the environment
+CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '10'))
+MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '3'))
+BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', '0.25'))
+BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', '4'))
+POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '32'))
+BREAKER_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.getenv('UPSTREAM_BREAKER_COOLDOWN', '30'))
+# Leading path segments that name an endpoint (e.g. /search/2/geocode); each endpoint has its own breaker
+ENDPOINT_PATH_SEGMENTS = int(os.getenv('UPSTREAM_ENDPOINT_PATH_SEGMENTS', '3'))
+
+# Point these at upstream_standin.py to run without the real APIs
+TOMTOM_BASE_URL = os.getenv('TOMTOM_BASE_URL', 'https://api.tomtom.com').rstrip('/')
+OPENWEATHER_BASE_URL = os.getenv('OPENWEATHER_BASE_URL', 'http://api.openweathermap.org').rstrip('/')
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    After `threshold` consecutive failed calls the breaker opens and calls
+    fail fast for `cooldown` seconds. Then a single trial call is let
+    through (half-open): success closes the breaker, failure reopens it.
+    The thread making the trial call must settle it with a verdict or
+    release() it, or the breaker stays half-open with no trial allowed.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._trial_thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                self._trial_thread = threading.get_ident()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release(self):
+        """
+        Give up this thread's trial call without a verdict, e.g. when the
+        caller ran out of time; a no-op for calls that were not the trial
+        """
+        with self._lock:
+            if self.trial_in_flight and self._trial_thread == threading.get_ident():
+                self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=POOL_SIZE)
+_session.mount('https://', _adapter)
+_session.mount('http://', _adapter)
+
+_breakers = {}
+_stats = {}
+_lock = threading.Lock()
+
+# Identical requests in flight at the same time share one call
+_flights = SingleFlight()
+
+
+def _endpoint(url):
+    """Host and leading path segments of a URL, e.g. api.tomtom.com/routing/1/calculateRoute"""
+    parts = urlsplit(url)
+    segments = [segment for segment in parts.path.split('/') if segment][:ENDPOINT_PATH_SEGMENTS]
+    return '/'.join([parts.netloc.lower()] + segments)
+
+
+def _upstream(endpoint):
+    with _lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker()
+            _stats[endpoint] = {'requests': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'coalesced': 0}
+        return _breakers[endpoint], _stats[endpoint]
+
+
+def _count(stats, key):
+    with _lock:
+        stats[key] += 1
+
+
+def _backoff(attempt, retry_after=None):
+    """Exponential backoff with full jitter, honouring Retry-After when it is given"""
+    if retry_after is not None:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _flight_key(method, url, params, json):
+    """Identity of a request: method, URL with every query parameter sorted, and body"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True) + sorted((params or {}).items())
+    url = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(sorted(query)), ''))
+    return (method, url, jsonlib.dumps(json, sort_keys=True) if json is not None else None)
+
+
+def http_request(method, url, params=None, json=None, timeout=None):
+    """
+    Send a request, sharing the call with identical requests already in flight.
+
+    See _send() for retries, circuit breaking and deadlines. Callers that
+    join an in-flight call get the same response object (its body is read
+    before it is shared) or the same exception.
+    """
+    def send():
+        response = _send(method, url, params, json, timeout)
+        response.content
+        return response
+
+    response, shared = _flights.do(_flight_key(method, url, params, json), send)
+    if shared:
+        _count(_upstream(_endpoint(url))[1], 'coalesced')
+    return response
+
+
+def _send(method, url, params=None, json=None, timeout=None):
+    """
+    Send a request through the shared keep-alive session.
+
+    Connection errors, timeouts and 429/5xx responses are retried up to
+    MAX_RETRIES times with jittered exponential backoff. The final response
+    is returned (callers still call raise_for_status()); calls to an upstream
+    whose breaker is open raise CircuitOpenError without touching the network.
+
+    Under a request Deadline, timeouts are capped to the time left and a
+    call that cannot fit raises DeadlineExceeded instead of being sent or
+    retried; running out of budget does not count against the breaker.
+    """
+    endpoint = _endpoint(url)
+    breaker, stats = _upstream(endpoint)
+
+    if not breaker.allow():
+        _count(stats, 'rejected')
+        raise CircuitOpenError(f"{endpoint} is unavailable (circuit open), try again shortly")
+
+    try:
+        return _attempt(breaker, stats, endpoint, method, url, params, json, timeout)
+    except BaseException:
+        # Whatever went wrong, a trial call must not leave the breaker waiting on it
+        breaker.release()
+        raise
+
+
+def _attempt(breaker, stats, endpoint, method, url, params, json, timeout):
+    """The retry loop of _send(), for a call its breaker has let through"""
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    deadline = current_deadline()
+    attempt = 0
+    while True:
+        response = None
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                breaker.release()
+                raise DeadlineExceeded(f"No time budget left for {endpoint}")
+            timeout = tuple(min(t, remaining) for t in timeout) if isinstance(timeout, tuple) else min(timeout, remaining)
+
+        _count(stats, 'requests')
+        try:
+            response = _session.request(method, url, params=params, json=json, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if deadline is not None and deadline.expired():
+                breaker.release()
+                raise DeadlineExceeded(f"{endpoint} did not answer within the time budget")
+            if attempt >= MAX_RETRIES:
+                _count(stats, 'failures')
+                breaker.record_failure()
+                raise
+            delay = _backoff(attempt)
+        except requests.exceptions.RequestException:
+            # Invalid responses, redirect loops and the like are not worth retrying
+            _count(stats, 'failures')
+            breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            if attempt >= MAX_RETRIES:
+                _count(stats, 'failures')
+                breaker.record_failure()
+                return response
+            delay = _backoff(attempt, response.headers.get('Retry-After'))
+
+        if deadline is not None and delay >= deadline.remaining():
+            # No time to retry: hand back the last error response, or give up
+            breaker.release()
+            if response is not None:
+                return response
+            raise DeadlineExceeded(f"No time budget left to retry {endpoint}")
+
+        attempt += 1
+        _count(stats, 'retries')
+        time.sleep(delay)
+
+
+def http_get(url, params=None, timeout=None):
+    """GET with retries and circuit breaking, see http_request()"""
+    return http_request('GET', url, params=params, timeout=timeout)
+
+
+def http_post(url, json=None, params=None, timeout=None):
+    """POST a JSON body with retries and circuit breaking, see http_request()"""
+    return http_request('POST', url, params=params, json=json, timeout=timeout)
+
+
+def upstream_stats():
+    """Counters and breaker state for every upstream endpoint called so far"""
+    with _lock:
+        endpoints = {
+            endpoint: dict(_stats[endpoint], breaker=_breakers[endpoint].state)
+            for endpoint in _breakers
+        }
+    return dict(endpoints, single_flight=_flights.stats())
@@ -0,0 +1,320 @@
+"""
+Offline stand-in for the TomTom and OpenWeather endpoints used by app.py.
+
+Start it, then point the app at it:
+
+    python upstream_standin.py --port 8600 --latency 80 --jitter 40 --error-rate 0.01
+    TOMTOM_BASE_URL=http://127.0.0.1:8600 OPENWEATHER_BASE_URL=http://127.0.0.1:8600 \
+        TOMTOM_API_KEY=offline WEATHER_API_KEY=offline python app.py
+
+Requests are answered from a recordings file when one matches, and with
+deterministic synthetic responses otherwise. With --record the stand-in
+forwards to the real APIs instead and appends every response to the
+recordings file, so a real session can be replayed later without network.
+
+GET /__stats returns call counts per endpoint and POST /__reset clears them.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import requests
+
+REAL_BASE_URLS = {
+    'tomtom': 'https://api.tomtom.com',
+    'openweather': 'http://api.openweathermap.org'
+}
+
+# (endpoint, path prefix, upstream)
+ENDPOINTS = [
+    ('geocode', '/search/2/geocode/', 'tomtom'),
+    ('nearby', '/search/2/nearbySearch/', 'tomtom'),
+    ('route', '/routing/1/calculateRoute/', 'tomtom'),
+    ('matrix', '/routing/matrix/2', 'tomtom'),
+    ('weather', '/data/2.5/weather', 'openweather'),
+]
+
+# Query parameters that carry credentials and are left out of recording keys
+SECRET_PARAMS = {'key', 'appid'}
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def endpoint_of(path):
+    for name, prefix, upstream in ENDPOINTS:
+        if path.startswith(prefix):
+            return name, upstream
+    return None, None
+
+
+def request_key(method, path, params, body=None):
+    """Stable key for a request, ignoring credentials and parameter order"""
+    query = '&'.join(f"{k}={v}" for k, v in sorted(params) if k not in SECRET_PARAMS)
+    key = f"{method} {unquote(path)}?{query}"
+    if body:
+        key += ' ' + json.dumps(json.loads(body), sort_keys=True)
+    return key
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _rng(key):
+    return random.Random(zlib.crc32(key.encode()))
+
+
+def synth_geocode(path, params, body):
+    query = unquote(path[len('/search/2/geocode/'):]).rsplit('.json', 1)[0]
+    rng = _rng(query.strip().lower())
+    # Somewhere in India, stable per query
+    lat, lon = rng.uniform(9.0, 30.0), rng.uniform(72.0, 88.0)
+    return {'results': [{'type': 'Geography', 'address': {'freeformAddress': query},
+                         'position': {'lat': round(lat, 5), 'lon': round(lon, 5)}}]}
+
+
+def synth_route(path, params, body):
+    coords = unquote(path[len('/routing/1/calculateRoute/'):]).split('/')[0]
+    (lat1, lon1), (lat2, lon2) = [tuple(map(float, point.split(','))) for point in coords.split(':')[:2]]
+    eco = params.get('routeType') == 'eco'
+    km = haversine_km(lat1, lon1, lat2, lon2) * (1.28 if eco else 1.25)
+    # Roughly one point per 200 m, like a real TomTom route
+    count = max(2, min(20000, int(km * 5)))
+    rng = _rng(coords + str(eco))
+    wobble = 0.02 if eco else 0.01
+    # Smooth bends every few km, like a road, rather than per-point noise
+    phase, period = rng.uniform(0, 2 * math.pi), rng.uniform(3, 8)
+    points = []
+    for i in range(count):
+        t = i / (count - 1)
+        bend = math.sin(t * math.pi) * (wobble + 0.002 * math.sin(phase + t * km / period))
+        points.append({'latitude': round(lat1 + (lat2 - lat1) * t + bend, 5),
+                       'longitude': round(lon1 + (lon2 - lon1) * t - bend, 5)})
+    seconds = int(km / (55 if eco else 62) * 3600)
+    return {'routes': [{
+        'summary': {'lengthInMeters': int(km * 1000), 'travelTimeInSeconds': seconds,
+                    'trafficDelayInSeconds': int(seconds * 0.03)},
+        'legs': [{'points': points}]
+    }]}
+
+
+def synth_nearby(path, params, body):
+    lat, lon = float(params['lat']), float(params['lon'])
+    radius_deg = float(params.get('radius', 5000)) / 111000
+    limit = int(params.get('limit', 10))
+    categories = str(params.get('categorySet', '7315')).split(',')
+    rng = _rng(f"{lat:.3f},{lon:.3f},{params.get('categorySet')}")
+    results = []
+    for i in range(limit):
+        category = categories[i % len(categories)]
+        results.append({
+            'id': f"standin-{category}-{lat:.3f}-{lon:.3f}-{i}",
+            'poi': {'name': f"Stand-in {category} {i}", 'categorySet': [{'id': int(category + '002')}]},
+            'position': {'lat': round(lat + rng.uniform(-radius_deg, radius_deg), 5),
+                         'lon': round(lon + rng.uniform(-radius_deg, radius_deg), 5)}
+        })
+    return {'results': results}
+
+
+def synth_matrix(path, params, body):
+    request = json.loads(body or '{}')
+    points = lambda key: [(p['point']['latitude'], p['point']['longitude']) for p in request.get(key, [])]
+    data = []
+    for i, origin in enumerate(points('origins')):
+        for j, destination in enumerate(points('destinations')):
+            km = haversine_km(*origin, *destination) * 1.25
+            data.append({'originIndex': i, 'destinationIndex': j,
+                         'routeSummary': {'lengthInMeters': int(km * 1000), 'travelTimeInSeconds': int(km / 60 * 3600)}})
+    return {'data': data}
+
+
+def synth_weather(path, params, body):
+    lat, lon = float(params['lat']), float(params['lon'])
+    rng = _rng(f"{lat:.1f},{lon:.1f}")
+    main, description, icon = rng.choice([('Clear', 'clear sky', '01d'), ('Clouds', 'scattered clouds', '03d'),
+                                          ('Rain', 'light rain', '10d'), ('Haze', 'haze', '50d')])
+    return {'coord': {'lat': lat, 'lon': lon}, 'name': f"Stand-in {lat:.1f},{lon:.1f}",
+            'weather': [{'main': main, 'description': description, 'icon': icon}],
+            'main': {'temp': round(rng.uniform(12, 38), 1), 'humidity': rng.randint(20, 90)}}
+
+
+SYNTHESIZERS = {
+    'geocode': synth_geocode,
+    'nearby': synth_nearby,
+    'route': synth_route,
+    'matrix': synth_matrix,
+    'weather': synth_weather,
+}
+
+
+class StandIn:
+    """Shared state of the stand-in: recordings, fault settings and counters"""
+
+    def __init__(self, recordings=None, record=False, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503, seed=None):
+        self.recordings_path = recordings
+        self.record = record
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.recorded = {}
+        self.lock = threading.Lock()
+        self.reset()
+        if recordings and not record:
+            self.load(recordings)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recorded[entry['key']] = (entry['status'], entry['body'])
+        except FileNotFoundError:
+            print(f"No recordings at {path}, synthesizing every response")
+
+    def reset(self):
+        with self.lock:
+            self.counts = {name: {'requests': 0, 'replayed': 0, 'synthesized': 0, 'errors': 0}
+                           for name, _, _ in ENDPOINTS}
+
+    def count(self, endpoint, field):
+        with self.lock:
+            self.counts[endpoint][field] += 1
+
+    def stats(self):
+        with self.lock:
+            counts = {name: dict(values) for name, values in self.counts.items()}
+        counts['total'] = {field: sum(c[field] for c in counts.values()) for field in
+                           ('requests', 'replayed', 'synthesized', 'errors')}
+        return counts
+
+    def delay(self):
+        with self.lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0
+            fail = self.random.random() < self.error_rate
+        if self.latency or extra:
+            time.sleep((self.latency + extra) / 1000)
+        return fail
+
+    def forward(self, method, upstream, path, query, body):
+        """Send the request to the real API and append the response to the recordings file"""
+        url = f"{REAL_BASE_URLS[upstream]}{path}" + (f"?{query}" if query else '')
+        response = requests.request(method, url, data=body, timeout=30,
+                                    headers={'Content-Type': 'application/json'} if body else None)
+        return response.status_code, response.json()
+
+    def save(self, key, status, payload):
+        with self.lock:
+            self.recorded[key] = (status, payload)
+            with open(self.recordings_path, 'a') as f:
+                f.write(json.dumps({'key': key, 'status': status, 'body': payload}) + '\n')
+
+
+def make_handler(standin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def handle_request(self, method):
+            parts = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode() if length else None
+
+            if parts.path == '/__stats':
+                return self.send_json(200, standin.stats())
+            if parts.path == '/__reset':
+                standin.reset()
+                return self.send_json(200, {'reset': True})
+
+            endpoint, upstream = endpoint_of(parts.path)
+            if endpoint is None:
+                return self.send_json(404, {'error': f"Unknown endpoint {parts.path}"})
+
+            params = parse_qsl(parts.query, keep_blank_values=True)
+            key = request_key(method, parts.path, params, body)
+            standin.count(endpoint, 'requests')
+
+            if standin.delay():
+                standin.count(endpoint, 'errors')
+                return self.send_json(standin.error_status, {'error': 'Injected failure'})
+
+            try:
+                if standin.record:
+                    status, payload = standin.forward(method, upstream, parts.path, parts.query, body)
+                    standin.save(key, status, payload)
+                elif key in standin.recorded:
+                    status, payload = standin.recorded[key]
+                    standin.count(endpoint, 'replayed')
+                else:
+                    status, payload = 200, SYNTHESIZERS[endpoint](parts.path, dict(params), body)
+                    standin.count(endpoint, 'synthesized')
+            except Exception as e:
+                standin.count(endpoint, 'errors')
+                return self.send_json(500, {'error': str(e)})
+            self.send_json(status, payload)
+
+        def do_GET(self):
+            self.handle_request('GET')
+
+        def do_POST(self):
+            self.handle_request('POST')
+
+    return Handler
+
+
+def serve(standin, host='127.0.0.1', port=8600):
+    server = ThreadingHTTPServer((host, port), make_handler(standin))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--recordings', help='JSON lines file of recorded responses')
+    parser.add_argument('--record', action='store_true', help='proxy to the real APIs and append to --recordings')
+    parser.add_argument('--latency', type=float, default=0, help='added latency per call in ms')
+    parser.add_argument('--jitter', type=float, default=0, help='extra random latency up to this many ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of calls that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, help='seed for latency jitter and error injection')
+    args = parser.parse_args(argv)
+    if args.record and not args.recordings:
+        parser.error('--record needs --recordings')
+
+    standin = StandIn(args.recordings, args.record, args.latency, args.jitter,
+                      args.error_rate, args.error_status, args.seed)
+    server = serve(standin, args.host, args.port)
+    print(f"Upstream stand-in listening on http://{args.host}:{server.server_address[1]}")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
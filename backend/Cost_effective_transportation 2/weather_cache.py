@@ -0,0 +1,115 @@
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from local_store import LRUCache
+
+# Weather is treated as uniform within a grid cell (0.1 degrees is roughly 11 km)
+WEATHER_CELL_DEG = float(os.getenv('WEATHER_CELL_DEG', '0.1'))
+WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', '600'))
+WEATHER_CACHE_SIZE = int(os.getenv('WEATHER_CACHE_SIZE', '4096'))
+# Every interval the most requested cells that would expire before the next run are refetched
+WEATHER_REFRESH_INTERVAL = float(os.getenv('WEATHER_REFRESH_INTERVAL', '60'))
+WEATHER_REFRESH_TOP = int(os.getenv('WEATHER_REFRESH_TOP', '50'))
+
+
+class WeatherCache:
+    """
+    Current weather cached per grid cell.
+
+    A miss calls fetch(lat, lon) on the request thread. A background thread
+    keeps the hottest cells fresh, so popular areas are refetched before
+    they expire; request counts are halved every run so the hot set follows
+    recent traffic.
+    """
+
+    def __init__(self, fetch, cell_deg=WEATHER_CELL_DEG, ttl=WEATHER_CACHE_TTL,
+                 max_entries=WEATHER_CACHE_SIZE, refresh_interval=WEATHER_REFRESH_INTERVAL,
+                 refresh_top=WEATHER_REFRESH_TOP):
+        self.fetch = fetch
+        self.cell_deg = cell_deg
+        self.refresh_interval = refresh_interval
+        self.refresh_top = refresh_top
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._cache = LRUCache(max_entries, ttl)
+        self._heat = Counter()
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def cell_of(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def get(self, lat, lon):
+        """Return weather for the cell containing (lat, lon), with 'coord' set to the point asked for"""
+        lat, lon = float(lat), float(lon)
+        cell = self.cell_of(lat, lon)
+        with self._lock:
+            self._heat[cell] += 1
+
+        entry = self._cache.get(cell)
+        if entry is None:
+            entry = {'lat': lat, 'lon': lon, 'data': self.fetch(lat, lon)}
+            self._cache.set(cell, entry)
+        self._ensure_refresher()
+
+        # The map on the report is centred on these coordinates
+        return {**entry['data'], 'coord': {'lat': lat, 'lon': lon}}
+
+    def version(self, lat, lon):
+        """Stamp of the cached weather for the cell of (lat, lon) while it is fresh, else None"""
+        stored_at = self._cache.stored_at(self.cell_of(float(lat), float(lon)))
+        if stored_at is None or time.monotonic() - stored_at > self._cache.ttl:
+            return None
+        return stored_at
+
+    def _ensure_refresher(self):
+        if self.refresh_interval and self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                    self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh_hot()
+
+    def refresh_hot(self):
+        """Refetch the hottest cells that would otherwise expire before the next run"""
+        with self._lock:
+            hottest = [cell for cell, _ in self._heat.most_common(self.refresh_top)]
+            for cell in list(self._heat):
+                self._heat[cell] //= 2
+                if not self._heat[cell]:
+                    del self._heat[cell]
+
+        for cell in hottest:
+            cached = self._cache.get_entry(cell)
+            if cached is None:
+                continue
+            entry, age = cached
+            if age + self.refresh_interval < self._cache.ttl:
+                continue
+            try:
+                self._cache.set(cell, {**entry, 'data': self.fetch(entry['lat'], entry['lon'])})
+                self.refreshes += 1
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Weather refresh error for {cell}: {str(e)}")
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._lock:
+            tracked = len(self._heat)
+        stats.update({
+            'cell_deg': self.cell_deg,
+            'tracked_cells': tracked,
+            'refresh_interval': self.refresh_interval,
+            'refresh_top': self.refresh_top,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors
+        })
+        return stats
@@ -1,6 +1,5 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 import requests
-import pickle
 import numpy as np
 from datetime import datetime, timedelta
 import pandas as pd
@@ -8,25 +7,65 @@ from typing import Dict, List
 from scipy.optimize import linear_sum_assignment
 import re
 import os
+import json
+import multiprocessing
+import threading
 from dotenv import load_dotenv
 from groq import Groq
-import mysql.connector
+from forecasting import forecast_warehouses
+from forecast_cache import ForecastCache
+from model_registry import ModelRegistry
+from inference_pool import InferencePool, PoolBusy, JobTimeout
+from db_pool import ConnectionPool
+from stock_bulk import apply_bulk_update, iter_csv_rows, iter_json_rows, BulkUpdateFailed
+from stock_snapshot import StockSnapshot
+from distribution import compute_distribution, forecast_products, forecasts_to_array
+from transfers import solve_transfers, transfers_to_dict, TRANSFER_SOLVERS
+from distance_matrix import DistanceMatrix, transport_costing
 from mysql.connector import Error
 load_dotenv()
 
 
 app = Flask(__name__)
 
-# Load the models
-models = {
-    'Warehouse1': pickle.load(open('model1.pkl', 'rb')),
-    'Warehouse2': pickle.load(open('model2.pkl', 'rb')),
-    'Warehouse3': pickle.load(open('model3.pkl', 'rb')),
-    'Warehouse4': pickle.load(open('model4.pkl', 'rb'))
-}
+MODEL_DIR = os.getenv('MODEL_DIR', os.path.dirname(os.path.abspath(__file__)))
+MODEL_CACHE_SIZE = int(os.getenv('MODEL_CACHE_SIZE', '8'))
+
+# Discover the models; each one is loaded on first use and evicted when unused
+model_registry = ModelRegistry(MODEL_DIR, max_loaded=MODEL_CACHE_SIZE)
+
+# Number of inference worker processes; 0 runs forecasts inline in the request thread.
+# The pool is per web process: under gunicorn each web worker starts its own
+# INFERENCE_WORKERS processes with their own copy of the models, so run a single
+# web worker with threads (e.g. gunicorn -w 1 --threads 8) when using the pool.
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '32'))
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', '30'))
+
+_inference_pool = None
+_inference_pool_lock = threading.Lock()
+
+# Optionally load models before the first request, e.g. MODEL_WARMUP=all or Warehouse1,Warehouse4.
+# With an inference pool the workers hold the models, so the web process never loads them.
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '')
+MODEL_WARMUP = MODEL_WARMUP if MODEL_WARMUP in ('', 'all') else MODEL_WARMUP.split(',')
+
+_services_started = False
+_services_lock = threading.Lock()
+
 # Define products and warehouses
 products = ['Product_0349', 'Product_2167', 'Product_0191', 'Product_1342', 'Product_1432']
-warehouses = ['Warehouse1', 'Warehouse2', 'Warehouse3', 'Warehouse4']
+warehouses = model_registry.warehouses()
+
+VALID_FORECAST_DAYS = [10, 20, 30, 40]
+
+# Seed for forecast randomness, so identical requests get identical (cacheable) results
+FORECAST_SEED = int(os.getenv('FORECAST_SEED', '0'))
+
+forecast_cache = ForecastCache(
+    max_entries=int(os.getenv('FORECAST_CACHE_SIZE', '128')),
+    ttl=float(os.getenv('FORECAST_CACHE_TTL', '600'))
+)
 
 DB_CONFIG = {
     'host': os.getenv('MYSQL_HOST', 'localhost'),
@@ -35,113 +74,172 @@ DB_CONFIG = {
     'database': os.getenv('MYSQL_DATABASE', 'warehouse_management')
 }
 
+# Shared connection pool; connections are opened on demand up to DB_POOL_SIZE
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    size=int(os.getenv('DB_POOL_SIZE', '5')),
+    acquire_timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK', '30'))
+)
+
+# Statements are prepared once per pooled connection and reused
+SELECT_STOCK_LEVELS_SQL = "SELECT warehouse_id, product_id, quantity FROM stock_levels"
+UPDATE_STOCK_LEVEL_SQL = "UPDATE stock_levels SET quantity = %s WHERE warehouse_id = %s AND product_id = %s"
+
+# Rows per batched statement in /update-stock/bulk
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '500'))
+
 # Groq API Key
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-groq_client = Groq(api_key=GROQ_API_KEY)
-
-def initialize_sequence(features):
-    """Initialize sequence with random normal values scaled to reasonable range"""
-    base = np.random.normal(50, 10, features)  # Generate base demands around 50 units
-    sequence = np.tile(base, (1, 30, 1))  # Repeat for all timesteps
-    return sequence
+_groq_client = None
+
+def get_groq_client():
+    """Return the Groq client, creating it on first use"""
+    global _groq_client
+    if _groq_client is None:
+        _groq_client = Groq(api_key=GROQ_API_KEY)
+    return _groq_client
+
+def fetch_stock_rows():
+    """Fetch every (warehouse, product, quantity) row from database"""
+    with db_pool.connection() as connection:
+        cursor = connection.execute(SELECT_STOCK_LEVELS_SQL)
+        return cursor.fetchall()
+
+# In-memory copy of stock_levels, refreshed from the database every STOCK_REFRESH_INTERVAL seconds
+stock_snapshot = StockSnapshot(
+    fetch_stock_rows,
+    refresh_interval=float(os.getenv('STOCK_REFRESH_INTERVAL', '300'))
+)
 
-def get_db_connection():
-    """Create and return a database connection"""
+def update_stock_level(warehouse_id, product_id, quantity):
+    """Update stock level for a specific product in a warehouse"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        with db_pool.connection() as connection:
+            cursor = connection.execute(UPDATE_STOCK_LEVEL_SQL, (quantity, warehouse_id, product_id))
+            connection.commit()
+            # Read before the connection (and its reused cursor) goes back to the pool
+            updated = cursor.rowcount
+
+        # Keep the snapshot current; updating a missing row changes nothing
+        if updated:
+            stock_snapshot.set(warehouse_id, product_id, quantity)
+        return True
+
     except Error as e:
-        print(f"Error connecting to MySQL: {e}")
+        print(f"Error updating stock level: {e}")
+        return False
+
+def is_inference_worker():
+    """True in a spawned inference worker, which re-imports this module when it is run as python app.py"""
+    return multiprocessing.parent_process() is not None
+
+def start_services():
+    """
+    Load the MODEL_WARMUP models, once per web process.
+
+    Runs on the first request rather than at import time, so spawned
+    inference workers that re-import this module do not repeat it.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started or is_inference_worker():
+            return
+        _services_started = True
+
+    if not MODEL_WARMUP:
+        return
+    if INFERENCE_WORKERS:
+        # The workers preload the models as they start
+        get_inference_pool()
+    else:
+        model_registry.warm_up(None if MODEL_WARMUP == 'all' else MODEL_WARMUP)
+
+@app.before_request
+def ensure_services_started():
+    start_services()
+
+def get_inference_pool():
+    """
+    Return the shared inference pool, starting it on first use.
+
+    The pool is not created at import time because spawned worker processes
+    re-import the main module, and must not start pools of their own. There
+    is one pool per web process.
+    """
+    global _inference_pool
+    if not INFERENCE_WORKERS or is_inference_worker():
         return None
 
-def get_current_stock_levels():
-    """Fetch current stock levels from database"""
-    connection = get_db_connection()
-    if not connection:
-        return {}
+    with _inference_pool_lock:
+        if _inference_pool is None:
+            _inference_pool = InferencePool(
+                MODEL_DIR,
+                workers=INFERENCE_WORKERS,
+                max_loaded=MODEL_CACHE_SIZE,
+                queue_size=INFERENCE_QUEUE_SIZE,
+                timeout=INFERENCE_TIMEOUT,
+                warm_up=MODEL_WARMUP
+            )
+        return _inference_pool
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT warehouse_id, product_id, quantity 
-            FROM stock_levels
-        """)
-        results = cursor.fetchall()
-
-        # Format the results into the required structure
-        current_stocks = {}
-        for row in results:
-            warehouse = row['warehouse_id']
-            if warehouse not in current_stocks:
-                current_stocks[warehouse] = {}
-            current_stocks[warehouse][row['product_id']] = row['quantity']
-
-        return current_stocks
+def run_forecasts(requested, days, seed):
+    """Roll forecasts forward in the inference pool, or inline when it is disabled"""
+    pool = get_inference_pool()
+    if pool is not None:
+        # Split the warehouses across the workers so they roll out in parallel
+        return pool.forecast_each(requested, days, seed)
 
-    except Error as e:
-        print(f"Error fetching stock levels: {e}")
-        return {}
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+    return forecast_warehouses(model_registry, requested, days, seed)
 
+def get_forecasts(requested, days, seed=FORECAST_SEED):
+    """Return one (days, outputs) rollout per warehouse, reusing cached rollouts"""
+    results = {}
+    for warehouse in requested:
+        results[warehouse] = forecast_cache.get(warehouse, days, model_registry.version(warehouse), seed)
 
-def update_stock_level(warehouse_id, product_id, quantity):
-    """Update stock level for a specific product in a warehouse"""
-    connection = get_db_connection()
-    if not connection:
-        return False
+    missing = [w for w in requested if results[w] is None]
+    if missing:
+        for warehouse, rollout in zip(missing, run_forecasts(missing, days, seed)):
+            forecast_cache.put(warehouse, model_registry.version(warehouse), seed, rollout)
+            results[warehouse] = rollout
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            UPDATE stock_levels 
-            SET quantity = %s 
-            WHERE warehouse_id = %s AND product_id = %s
-        """, (quantity, warehouse_id, product_id))
-        
-        connection.commit()
-        return True
+    return [results[w] for w in requested]
 
-    except Error as e:
-        print(f"Error updating stock level: {e}")
-        return False
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+def postprocess_forecast(forecast_data):
+    """Apply post-processing to make predictions more realistic"""
+    forecast_data = np.maximum(forecast_data, 0)  # Ensure non-negative values
+    return np.round(forecast_data)  # Round to whole numbers
 
-def forecast_next_days(model, days, features):
-    predictions = []
-    
-    # Initialize with realistic values instead of zeros
-    sequence = initialize_sequence(features)
-    
-    for _ in range(days):
-        try:
-            # Make prediction using the current sequence
-            prediction = model.predict(sequence, verbose=0)
-            
-            # Apply activation to ensure non-negative values
-            prediction = np.maximum(prediction, 0)  # ReLU-like activation
-            
-            # Add some randomness to avoid static predictions
-            noise = np.random.normal(0, 2, prediction.shape)
-            prediction = prediction + noise
-            
-            predictions.append(prediction[0])
-            
-            # Update sequence by shifting the time window
-            sequence = np.roll(sequence, -1, axis=1)
-            sequence[0, -1, :] = prediction[0]
-            
-        except Exception as e:
-            print(f"Error during prediction: {str(e)}")
-            print(f"Input shape: {sequence.shape}")
-            raise e
-    
-    return np.array(predictions)
+def forecast_demand_array(rollouts):
+    """
+    Stack per-warehouse rollouts into a (products, warehouses, days) demand
+    array and a mask of the (product, warehouse) pairs the models predict
+    """
+    days = min(len(rollout) for rollout in rollouts)
+    demand = np.zeros((len(products), len(rollouts), days))
+    mask = np.zeros((len(products), len(rollouts)), dtype=bool)
+    for w, rollout in enumerate(rollouts):
+        n_products = min(len(products), rollout.shape[1])
+        demand[:n_products, w, :] = postprocess_forecast(rollout[:days, :n_products]).T
+        mask[:n_products, w] = True
+    return demand, mask
+
+def format_forecast(forecast_data, days):
+    """Build the /forecast response body from a (days, outputs) prediction array"""
+    # Create dates for the forecast period
+    dates = [(datetime.now() + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+
+    # Ensure we only return data for available products
+    n_products = min(len(products), forecast_data.shape[1])
+    forecast_data = postprocess_forecast(forecast_data)
+
+    return {
+        'dates': dates,
+        'predictions': {
+            products[i]: forecast_data[:, i].tolist() for i in range(n_products)
+        }
+    }
 
 def generate_recommendations(transfer_details):
     """Generate recommendations using Groq Gemma model."""
@@ -163,7 +261,7 @@ Provide clear and actionable recommendations in simple language."""
 
     try:
         # Use the Groq Gemma model
-        response = groq_client.chat.completions.create(
+        response = get_groq_client().chat.completions.create(
             model="gemma2-9b-it",
             messages=messages,
             max_tokens=500,
@@ -191,50 +289,76 @@ def get_forecast():
         warehouse_type = data['warehouse']
         days = int(data['days'])
         
-        if warehouse_type not in models:
+        if warehouse_type not in model_registry:
             return jsonify({'error': 'Invalid warehouse type'}), 400
         
-        if days not in [10, 20, 30, 40]:
+        if days not in VALID_FORECAST_DAYS:
             return jsonify({'error': 'Invalid number of days'}), 400
         
-        model = models[warehouse_type]
-        
-        # Map warehouses to their feature dimensions
-        feature_dims = {
-            'Warehouse1': 24,
-            'Warehouse2': 18,
-            'Warehouse3': 83,
-            'Warehouse4': 265
-        }
+        seed = int(data.get('seed', FORECAST_SEED))
         
         # Get forecast using the unified function
-        forecast_data = forecast_next_days(model, days, feature_dims[warehouse_type])
-        
-        # Create dates for the forecast period
-        dates = [(datetime.now() + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
-        
-        # Create response data
-        products = ['Product_0349', 'Product_2167', 'Product_0191', 'Product_1342', 'Product_1432']
-        
-        # Ensure we only return data for available products
-        n_products = min(len(products), forecast_data.shape[1])
-        products = products[:n_products]
+        forecast_data = get_forecasts([warehouse_type], days, seed)[0]
         
-        # Apply post-processing to make predictions more realistic
-        forecast_data = np.maximum(forecast_data, 0)  # Ensure non-negative values
-        forecast_data = np.round(forecast_data)  # Round to whole numbers
-        
-        response_data = {
-            'dates': dates,
-            'predictions': {
-                products[i]: forecast_data[:, i].tolist() for i in range(n_products)
-            }
-        }
-        
-        return jsonify(response_data)
+        return jsonify(format_forecast(forecast_data, days))
     
+    except PoolBusy as e:
+        return jsonify({'error': str(e)}), 503
+    except JobTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/forecast/batch', methods=['POST'])
+def get_forecast_batch():
+    """Forecast several warehouses in one request, sharing inference calls"""
+    try:
+        data = request.json
+        requested = data.get('warehouses') or warehouses
+        days = int(data['days'])
+
+        invalid = [w for w in requested if w not in model_registry]
+        if invalid:
+            return jsonify({'error': f"Invalid warehouse type: {', '.join(invalid)}"}), 400
+
+        if days not in VALID_FORECAST_DAYS:
+            return jsonify({'error': 'Invalid number of days'}), 400
+
+        seed = int(data.get('seed', FORECAST_SEED))
+        forecast_data = get_forecasts(requested, days, seed)
+
+        return jsonify({
+            warehouse: format_forecast(result, days)
+            for warehouse, result in zip(requested, forecast_data)
+        })
+
+    except PoolBusy as e:
+        return jsonify({'error': str(e)}), 503
+    except JobTimeout as e:
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@app.route('/forecast/cache-stats', methods=['GET'])
+def get_forecast_cache_stats():
+    return jsonify(forecast_cache.stats())
+
+@app.route('/models/stats', methods=['GET'])
+def get_model_stats():
+    return jsonify(model_registry.stats())
+
+@app.route('/db/pool-stats', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify(db_pool.stats())
+
+@app.route('/stock/snapshot-stats', methods=['GET'])
+def get_stock_snapshot_stats():
+    return jsonify(stock_snapshot.stats())
+
+@app.route('/inference/stats', methods=['GET'])
+def get_inference_stats():
+    pool = get_inference_pool()
+    return jsonify(pool.stats() if pool else {'workers': 0})
     
 # Add these new routes to your Flask application
 
@@ -243,139 +367,198 @@ def optimize_distribution():
     try:
         data = request.json
         forecasts = data.get('forecasts', {})
+        transfer_solver = data.get('transfer_solver', TRANSFER_SOLVER)
 
-        # Get current stocks from database instead of request
-        current_stocks = get_current_stock_levels()
+        if transfer_solver not in TRANSFER_SOLVERS:
+            return jsonify({'error': f"Invalid transfer solver. Choose: {', '.join(TRANSFER_SOLVERS)}"}), 400
 
-        # Validate data
-        if not current_stocks or not forecasts:
+        # Get current stocks from the in-memory snapshot instead of request
+        if not stock_snapshot.ensure_loaded() or not forecasts:
             return jsonify({'error': 'Missing stock data or forecasts'}), 400
 
-        distribution = calculate_optimal_distribution(current_stocks, forecasts)
+        distribution = calculate_optimal_distribution(forecasts, transfer_solver)
         return jsonify(distribution)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def calculate_optimal_distribution(current_stocks, forecasts):
+def calculate_optimal_distribution(forecasts, transfer_solver=None):
     """
     Calculate the optimal distribution of stock across warehouses
+    for every product that appears in the forecasts
     """
-    distribution = {
-        'requiredStock': {},
-        'surplus': {},
-        'orderNeeded': {},
-        'transfers': {}
-    }
+    catalog = forecast_products(forecasts, warehouses)
+    demand, mask = forecasts_to_array(forecasts, catalog, warehouses)
+    stock = stock_snapshot.array(catalog, warehouses)
 
-    # Calculate total demand for each product in each warehouse
-    for product in products:
-        distribution['requiredStock'][product] = {}
-        distribution['surplus'][product] = {}
-        distribution['orderNeeded'][product] = 0
-
-        totalRequired = 0
-        totalCurrentStock = 0
-
-        for warehouse in warehouses:
-            # Ensure the product exists in the forecasts
-            if product not in forecasts[warehouse]['predictions']:
-                continue
-
-            demands = forecasts[warehouse]['predictions'][product]
-            required = sum(demands)
-            current = current_stocks.get(warehouse, {}).get(product, 0)
-
-            distribution['requiredStock'][product][warehouse] = required
-            distribution['surplus'][product][warehouse] = current - required
-
-            totalRequired += required
-            totalCurrentStock += current
-
-        distribution['orderNeeded'][product] = max(0, totalRequired - totalCurrentStock)
+    distribution = compute_distribution(demand, stock, catalog, warehouses, mask)
+    result = distribution.to_dict()
 
     # Calculate transfer recommendations
-    distribution['transfers'] = recommend_stock_transfers(distribution)
-
-    return distribution
+    result['transfers'] = recommend_stock_transfers(distribution, transfer_solver)
+
+    return result
+
+# Vehicle and fuel used for transfers between warehouses, priced with the transportation service's cost tables
+TRANSFER_VEHICLE = os.getenv('TRANSFER_VEHICLE', 'truck')
+TRANSFER_FUEL = os.getenv('TRANSFER_FUEL', 'diesel')
+# Units of stock that share one vehicle's cost on a transfer; defaults to the vehicle's payload in kg
+TRANSFER_UNITS_PER_LOAD = os.getenv('TRANSFER_UNITS_PER_LOAD')
+
+# Warehouse-to-warehouse road distances, kept on disk and extended as warehouses are stored
+DISTANCE_MATRIX_PATH = os.getenv(
+    'DISTANCE_MATRIX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouse_distances.npz')
+)
+# Estimated distances are checked against newly routed lanes at most this often (seconds)
+DISTANCE_REFRESH_INTERVAL = float(os.getenv('DISTANCE_REFRESH_INTERVAL', '300'))
+# Known warehouse coordinates, added to the matrix when it is first used
+WAREHOUSE_LOCATIONS_FILE = os.getenv(
+    'WAREHOUSE_LOCATIONS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'warehouse_locations.json')
+)
+
+_distance_matrix = None
+_transport_cost_per_km = None
+_transfer_costs_lock = threading.Lock()
+
+def get_distance_matrix():
+    """
+    Return the warehouse distance matrix, loading it on first use.
 
-import numpy as np
+    It reads the transportation service's route store and may write
+    DISTANCE_MATRIX_PATH, so it is not built at import time.
+    """
+    global _distance_matrix
+    with _transfer_costs_lock:
+        if _distance_matrix is None:
+            matrix = DistanceMatrix(DISTANCE_MATRIX_PATH)
+            seeded = {'added': []}
+            if os.path.exists(WAREHOUSE_LOCATIONS_FILE):
+                with open(WAREHOUSE_LOCATIONS_FILE) as f:
+                    seeded = matrix.add({
+                        name: coords for name, coords in json.load(f).items() if name not in matrix.warehouses
+                    })
+            if not seeded['added']:
+                matrix.refresh_routes()
+            _distance_matrix = matrix
+        return _distance_matrix
+
+def transport_cost_per_km():
+    """Estimated transportation cost per unit of stock per km (INR)"""
+    global _transport_cost_per_km
+    with _transfer_costs_lock:
+        if _transport_cost_per_km is None:
+            costing = transport_costing()
+            costing.validate_vehicle_fuel_combination(TRANSFER_VEHICLE, TRANSFER_FUEL)
+            per_km = costing.COST_PER_KM[costing.COMBINATIONS.index((TRANSFER_VEHICLE, TRANSFER_FUEL))]
+            units = float(TRANSFER_UNITS_PER_LOAD or costing.VEHICLE_CAPACITY[TRANSFER_VEHICLE])
+            _transport_cost_per_km = float(per_km) / units
+        return _transport_cost_per_km
+
+# Default transfer planner ('exact' or 'greedy') and the time the exact one may take
+TRANSFER_SOLVER = os.getenv('TRANSFER_SOLVER', 'exact')
+TRANSFER_TIME_LIMIT = float(os.getenv('TRANSFER_TIME_LIMIT', '10'))
+
+def transfer_cost_matrix(warehouse_list):
+    """
+    Per-unit transfer cost between every pair of warehouses, np.inf where no
+    distance is known. Pairs still on estimated distances pick up lanes the
+    transportation service has routed since, every DISTANCE_REFRESH_INTERVAL.
+    """
+    matrix = get_distance_matrix()
+    matrix.refresh_estimated(warehouse_list, DISTANCE_REFRESH_INTERVAL)
+    return matrix.distances(warehouse_list) * transport_cost_per_km()
 
-# Assume constant distances for simplicity (km)
-DISTANCE_MATRIX = {
-    'Warehouse1': {
-        'Warehouse1': 0, 
-        'Warehouse2': 100, 
-        'Warehouse3': 200, 
-        'Warehouse4': 300
-    },
-    'Warehouse2': {
-        'Warehouse1': 100, 
-        'Warehouse2': 0, 
-        'Warehouse3': 150, 
-        'Warehouse4': 250
-    },
-    'Warehouse3': {
-        'Warehouse1': 200, 
-        'Warehouse2': 150, 
-        'Warehouse3': 0, 
-        'Warehouse4': 100
-    },
-    'Warehouse4': {
-        'Warehouse1': 300, 
-        'Warehouse2': 250, 
-        'Warehouse3': 100, 
-        'Warehouse4': 0
-    }
-}
+def recommend_stock_transfers(distribution, method=None):
+    """
+    Plan transfers from surplus to deficit warehouses for every product
 
-# Estimated transportation cost per km ($/km)
-TRANSPORT_COST_PER_KM = 0.5
+    Each product is solved as a transportation problem, so no warehouse
+    ships more than its surplus and products without any surplus source
+    simply get no transfers.
 
-def calculate_transfer_cost(source, destination, quantity):
-    """
-    Calculate transportation cost between warehouses
-    
     Args:
-        source (str): Source warehouse
-        destination (str): Destination warehouse
-        quantity (float): Quantity of goods to transfer
-    
+        distribution (Distribution): result of compute_distribution
+        method (str): 'exact' (cost-optimal) or 'greedy' (fast approximation)
+
     Returns:
-        float: Total transportation cost
+        dict: {product: [{'from', 'to', 'quantity', 'cost'}]}
+    """
+    cost = transfer_cost_matrix(distribution.warehouses)
+    plan = solve_transfers(
+        distribution.surplus, cost, method or TRANSFER_SOLVER, time_limit=TRANSFER_TIME_LIMIT
+    )
+    return transfers_to_dict(plan, cost, distribution.products, distribution.warehouses)
+
+def stream_plan(distribution, transfers):
+    """Serialize a plan to JSON one product at a time, so large catalogs start streaming immediately"""
+    sections = distribution.to_dict()
+    sections['transfers'] = transfers
+
+    yield '{'
+    for n, (name, section) in enumerate(sections.items()):
+        yield (', ' if n else '') + json.dumps(name) + ': {'
+        for i, (product, value) in enumerate(section.items()):
+            yield (', ' if i else '') + json.dumps(product) + ': ' + json.dumps(value)
+        yield '}'
+    yield '}'
+
+@app.route('/plan', methods=['POST'])
+def plan():
+    """
+    Forecast every warehouse, read stock, and plan distribution and transfers
+    in one request. Forecasts never leave the server, so the response size
+    does not depend on the horizon.
     """
-    distance = DISTANCE_MATRIX[source][destination]
-    cost = distance * TRANSPORT_COST_PER_KM * quantity
-    return cost
+    try:
+        data = request.get_json(silent=True) or {}
+        days = int(data.get('days', max(VALID_FORECAST_DAYS)))
+        seed = int(data.get('seed', FORECAST_SEED))
+        transfer_solver = data.get('transfer_solver', TRANSFER_SOLVER)
 
-def recommend_stock_transfers(distribution):
-    transfers = {}
+        if days not in VALID_FORECAST_DAYS:
+            return jsonify({'error': 'Invalid number of days'}), 400
 
-    for product in products:
-        transfers[product] = []
+        if transfer_solver not in TRANSFER_SOLVERS:
+            return jsonify({'error': f"Invalid transfer solver. Choose: {', '.join(TRANSFER_SOLVERS)}"}), 400
 
-        # Find warehouses with surplus and deficit
-        surplus_warehouses = [w for w in warehouses if distribution['surplus'][product][w] > 0]
-        deficit_warehouses = [w for w in warehouses if distribution['surplus'][product][w] < 0]
+        if not stock_snapshot.ensure_loaded():
+            return jsonify({'error': 'Missing stock data'}), 503
 
-        for deficit_wh in deficit_warehouses:
-            deficit_amount = abs(distribution['surplus'][product][deficit_wh])
+        demand, mask = forecast_demand_array(get_forecasts(warehouses, days, seed))
+        stock = stock_snapshot.array(products, warehouses)
 
-            # Find best source warehouse with minimum transfer cost
-            best_source = min(
-                surplus_warehouses,
-                key=lambda source: calculate_transfer_cost(source, deficit_wh, deficit_amount)
-            )
+        distribution = compute_distribution(demand, stock, products, warehouses, mask)
+        transfers = recommend_stock_transfers(distribution, transfer_solver)
 
-            transfer_cost = calculate_transfer_cost(best_source, deficit_wh, deficit_amount)
+        return Response(stream_plan(distribution, transfers), mimetype='application/json')
 
-            transfers[product].append({
-                'from': best_source,
-                'to': deficit_wh,
-                'quantity': deficit_amount,
-                'cost': transfer_cost
-            })
+    except PoolBusy as e:
+        return jsonify({'error': str(e)}), 503
+    except JobTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/store-warehouse-locations', methods=['POST'])
+def store_warehouse_locations():
+    """Add or move warehouses, sent as {name: 'lat,lon' or {'lat', 'lon'}}; only their distances are recomputed"""
+    try:
+        locations = request.get_json(force=True)
+        if not isinstance(locations, dict) or not locations:
+            return jsonify({'error': 'Expected an object of warehouse locations'}), 400
+
+        result = get_distance_matrix().add(locations)
+        result['message'] = (f"Stored {len(locations)} warehouse locations "
+                             f"({len(result['added'])} added, {len(result['moved'])} moved)")
+        return jsonify(result)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f"Invalid coordinates: {e}"}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-    return transfers
+@app.route('/transfers/distance-stats', methods=['GET'])
+def get_distance_matrix_stats():
+    return jsonify(get_distance_matrix().stats())
 
 @app.route('/ai-recommendations', methods=['POST'])
 def ai_recommendations():
@@ -415,6 +598,30 @@ def update_stock():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/update-stock/bulk', methods=['POST'])
+def update_stock_bulk():
+    """Apply many stock rows, sent as a JSON list or streamed as CSV, in one transaction"""
+    try:
+        if request.mimetype == 'text/csv':
+            rows = iter_csv_rows(request.stream)
+        else:
+            rows = iter_json_rows(request.get_json(force=True))
+
+        results, applied = apply_bulk_update(db_pool, rows, BULK_CHUNK_SIZE)
+        stock_snapshot.apply(applied)
+        return jsonify({
+            'updated': sum(1 for r in results if r['status'] == 'updated'),
+            'failed': sum(1 for r in results if r['status'] == 'error'),
+            'results': results
+        })
+
+    except BulkUpdateFailed as e:
+        return jsonify({'error': f"Bulk update rolled back: {e.msg}", 'results': e.results}), 500
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
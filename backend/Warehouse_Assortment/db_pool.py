@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+
+class PoolTimeout(Error):
+    """Raised when no pooled connection becomes free within the acquire timeout"""
+
+
+class PooledConnection:
+    """A pooled MySQL connection that keeps its prepared statements across checkouts"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = time.monotonic()
+        self._statements = {}
+
+    def execute(self, sql, params=()):
+        """Execute `sql` through a prepared statement reused for this connection"""
+        cursor = self._statements.get(sql)
+        if cursor is None:
+            cursor = self.connection.cursor(prepared=True)
+            self._statements[sql] = cursor
+        cursor.execute(sql, params)
+        return cursor
+
+    def cursor(self, **kwargs):
+        return self.connection.cursor(**kwargs)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        for cursor in self._statements.values():
+            try:
+                cursor.close()
+            except Error:
+                pass
+        self._statements.clear()
+        try:
+            self.connection.close()
+        except Error:
+            pass
+
+
+class ConnectionPool:
+    """
+    Size-bounded pool of MySQL connections shared by the request threads.
+
+    Connections are opened lazily up to `size`. A connection that has been
+    idle for longer than `health_check_interval` seconds is pinged before it
+    is handed out and replaced if the ping fails. Callers that find the pool
+    exhausted wait up to `acquire_timeout` seconds before PoolTimeout.
+    """
+
+    def __init__(self, config, size=5, acquire_timeout=10.0, health_check_interval=30.0):
+        self.config = config
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._acquisitions = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        return PooledConnection(mysql.connector.connect(**self.config))
+
+    def _is_healthy(self, pooled):
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return True
+        try:
+            pooled.connection.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def _discard(self, pooled):
+        pooled.close()
+        with self._lock:
+            self._open -= 1
+            self._discarded += 1
+
+    def acquire(self, timeout=None):
+        """Check a connection out of the pool, opening one if there is room"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._lock:
+            self._waiting += 1
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    pooled = None
+                    with self._lock:
+                        can_open = self._open < self.size
+                        if can_open:
+                            self._open += 1
+                    if can_open:
+                        try:
+                            pooled = self._connect()
+                        except Error:
+                            with self._lock:
+                                self._open -= 1
+                            raise
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            with self._lock:
+                                self._timeouts += 1
+                            raise PoolTimeout(f"No database connection available after {timeout} seconds")
+                        try:
+                            pooled = self._idle.get(timeout=remaining)
+                        except queue.Empty:
+                            continue
+
+                if not self._is_healthy(pooled):
+                    self._discard(pooled)
+                    continue
+
+                waited = time.monotonic() - started
+                with self._lock:
+                    self._in_use += 1
+                    self._acquisitions += 1
+                    self._total_wait += waited
+                    self._max_wait = max(self._max_wait, waited)
+                return pooled
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self, pooled, discard=False):
+        """Return a connection to the pool, closing it if it is broken"""
+        with self._lock:
+            self._in_use -= 1
+
+        if not discard:
+            try:
+                discard = not pooled.connection.is_connected()
+                if not discard and pooled.connection.in_transaction:
+                    pooled.rollback()
+            except Error:
+                discard = True
+
+        if discard:
+            self._discard(pooled)
+        else:
+            pooled.last_used = time.monotonic()
+            self._idle.put(pooled)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks out a connection and always returns it"""
+        pooled = self.acquire(timeout)
+        failed = False
+        try:
+            yield pooled
+        except Error:
+            failed = True
+            try:
+                pooled.rollback()
+            except Error:
+                pass
+            raise
+        finally:
+            self.release(pooled, discard=failed and not self._still_connected(pooled))
+
+    @staticmethod
+    def _still_connected(pooled):
+        try:
+            return pooled.connection.is_connected()
+        except Error:
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'waiting': self._waiting,
+                'acquisitions': self._acquisitions,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'avg_wait_ms': round(1000 * self._total_wait / self._acquisitions, 3) if self._acquisitions else 0.0,
+                'max_wait_ms': round(1000 * self._max_wait, 3)
+            }
@@ -0,0 +1,271 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+# The transportation service lives next to this one
+TRANSPORT_DIR = os.getenv(
+    'TRANSPORT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Cost_effective_transportation 2')
+)
+# Local store of the transportation service, which holds the road distances it has already routed
+TRANSPORT_STORE_PATH = os.getenv('TRANSPORT_STORE_PATH', os.path.join(TRANSPORT_DIR, 'local_cache.sqlite3'))
+
+# Road distance is roughly this much longer than the great-circle distance
+ROAD_DISTANCE_FACTOR = float(os.getenv('ROAD_DISTANCE_FACTOR', '1.3'))
+# Must match the coordinate rounding the transportation service uses for its cache keys
+ROUTE_SNAP_DECIMALS = int(os.getenv('ROUTE_SNAP_DECIMALS', '3'))
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def transport_costing():
+    """
+    The transportation service's costing module, with its vehicle and fuel tables.
+
+    Its directory name has a space, so it is not importable as a package;
+    the directory is put at the end of sys.path instead, where it cannot
+    shadow this service's own modules.
+    """
+    if TRANSPORT_DIR not in sys.path:
+        sys.path.append(TRANSPORT_DIR)
+    import costing
+    return costing
+
+
+def parse_coords(coords):
+    """Return (lat, lon) floats for a 'lat,lon' string, a (lat, lon) pair or a {'lat', 'lon'} dict"""
+    if isinstance(coords, dict):
+        if 'lat' in coords and 'lon' in coords:
+            return float(coords['lat']), float(coords['lon'])
+        coords = coords.get('coordinates', '')
+    if isinstance(coords, str):
+        coords = coords.split(',')
+    lat, lon = (float(value) for value in coords)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Coordinates out of range: {lat},{lon}")
+    return lat, lon
+
+
+def haversine_km(origins, destinations):
+    """Great-circle distances in km from every origin to every destination, as an (origins, destinations) matrix"""
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1, lon1 = origins[:, :1], origins[:, 1:]
+    lat2, lon2 = destinations[:, 0][None, :], destinations[:, 1][None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class RoutedDistances:
+    """
+    Read-only view of the road distances the transportation service has
+    cached for its truck routes, keyed on snapped start and end coordinates.
+    """
+
+    def __init__(self, path=TRANSPORT_STORE_PATH, travel_mode='truck'):
+        self.path = path
+        self.travel_mode = travel_mode
+
+    def snap(self, point):
+        lat, lon = (round(value, ROUTE_SNAP_DECIMALS) for value in point)
+        return f"{lat:.{ROUTE_SNAP_DECIMALS}f},{lon:.{ROUTE_SNAP_DECIMALS}f}"
+
+    def get_many(self, pairs):
+        """Return {(origin, destination): km} for the (lat, lon) pairs that have been routed"""
+        keys = {f"{self.snap(a)}|{self.snap(b)}|{self.travel_mode}": (a, b) for a, b in pairs}
+        if not keys or not os.path.exists(self.path):
+            return {}
+
+        found = {}
+        try:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                names = list(keys)
+                for start in range(0, len(names), 500):
+                    chunk = names[start:start + 500]
+                    rows = connection.execute(
+                        f"SELECT key, value FROM pair_distances WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    found.update((keys[key], json.loads(value)['km']) for key, value in rows)
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            # No routes cached yet, or the store is locked; the haversine estimate stands in
+            print(f"Error reading routed distances: {e}")
+        return found
+
+
+class DistanceMatrix:
+    """
+    Road distances between warehouses as a dense km matrix, persisted to disk.
+
+    Pairs the transportation service has routed use that road distance;
+    the rest use the haversine distance scaled by ROAD_DISTANCE_FACTOR until
+    a route for them shows up. Adding or moving a warehouse only computes
+    its own row and column, and every change bumps `version`.
+    """
+
+    def __init__(self, path, routed=None):
+        self.path = path
+        self.routed = routed if routed is not None else RoutedDistances()
+        self.version = 0
+        self.refreshed_at = None
+        self.warehouses = []
+        self._index = {}
+        self.coords = np.zeros((0, 2))
+        self.km = np.zeros((0, 0))
+        self.is_routed = np.zeros((0, 0), dtype=bool)
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Read the matrix saved at `path`; a missing or unreadable file leaves it empty"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as saved:
+                warehouses = [str(name) for name in saved['warehouses']]
+                coords, km, is_routed = saved['coords'], saved['km'], saved['is_routed']
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error loading distance matrix: {e}")
+            return False
+
+        with self._lock:
+            self.warehouses = warehouses
+            self._index = {name: i for i, name in enumerate(warehouses)}
+            self.coords, self.km, self.is_routed = coords, km, is_routed
+            self.version += 1
+        return True
+
+    def save(self):
+        with self._lock:
+            arrays = {'warehouses': np.array(self.warehouses, dtype=str), 'coords': self.coords,
+                      'km': self.km, 'is_routed': self.is_routed}
+        # Write next to the target and swap it in, so readers never see a half-written file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, self.path)
+
+    def _fill(self, rows):
+        """Recompute the distances from and to the warehouses at the given indices"""
+        n = len(self.warehouses)
+        rows = np.asarray(sorted(rows), dtype=np.intp)
+        estimate = haversine_km(self.coords[rows], self.coords) * ROAD_DISTANCE_FACTOR
+        self.km[rows, :] = estimate
+        self.km[:, rows] = estimate.T
+        self.km[rows, rows] = 0
+        self.is_routed[rows, :] = False
+        self.is_routed[:, rows] = False
+
+        changed = set(rows.tolist())
+        pairs = {(i, j) for i in changed for j in range(n) if i != j}
+        pairs |= {(j, i) for i, j in pairs}
+        return self._apply_routed(pairs)
+
+    def _apply_routed(self, pairs):
+        points = [tuple(point) for point in self.coords.tolist()]
+        routed = self.routed.get_many((points[i], points[j]) for i, j in pairs)
+        by_points = {(points[i], points[j]): (i, j) for i, j in pairs}
+        for (a, b), km in routed.items():
+            i, j = by_points[(a, b)]
+            self.km[i, j] = km
+            self.is_routed[i, j] = True
+        return len(routed)
+
+    def add(self, locations):
+        """
+        Add or move warehouses, given as {name: coordinates}.
+
+        Returns:
+            dict: names of the warehouses added, moved and unchanged
+        """
+        parsed = {str(name): parse_coords(coords) for name, coords in locations.items()}
+        result = {'added': [], 'moved': [], 'unchanged': []}
+
+        with self._lock:
+            rows = set()
+            for name, point in parsed.items():
+                i = self._index.get(name)
+                if i is None:
+                    self._index[name] = len(self.warehouses)
+                    self.warehouses.append(name)
+                    self.coords = np.vstack([self.coords, [point]])
+                    result['added'].append(name)
+                elif not np.allclose(self.coords[i], point):
+                    self.coords[i] = point
+                    result['moved'].append(name)
+                else:
+                    result['unchanged'].append(name)
+                    continue
+                rows.add(self._index[name])
+
+            if not rows:
+                return result
+
+            grow = len(self.warehouses) - len(self.km)
+            if grow:
+                self.km = np.pad(self.km, ((0, grow), (0, grow)))
+                self.is_routed = np.pad(self.is_routed, ((0, grow), (0, grow)))
+            self._fill(rows)
+            self.version += 1
+            self.save()
+        return result
+
+    def refresh_routes(self):
+        """Swap estimated pairs for road distances the transportation service has routed since; returns how many"""
+        with self._lock:
+            self.refreshed_at = time.monotonic()
+            pairs = list(zip(*np.nonzero(~self.is_routed & ~np.eye(len(self.warehouses), dtype=bool))))
+            found = self._apply_routed([(int(i), int(j)) for i, j in pairs]) if pairs else 0
+            if found:
+                self.version += 1
+                self.save()
+        return found
+
+    def refresh_estimated(self, warehouse_list, min_interval):
+        """
+        refresh_routes() if any pair among the given warehouses is still
+        estimated, at most once every `min_interval` seconds; returns how many
+        pairs were swapped for road distances
+        """
+        with self._lock:
+            if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < min_interval:
+                return 0
+            index = np.array([self._index[name] for name in warehouse_list if name in self._index], dtype=np.intp)
+            estimated = ~self.is_routed[np.ix_(index, index)] & ~np.eye(len(index), dtype=bool)
+            if not estimated.any():
+                return 0
+            return self.refresh_routes()
+
+    def distances(self, warehouse_list):
+        """km between every pair of the given warehouses, np.inf for warehouses without coordinates"""
+        with self._lock:
+            index = np.array([self._index.get(name, -1) for name in warehouse_list], dtype=np.intp)
+            result = np.full((len(index), len(index)), np.inf)
+            known = index >= 0
+            result[np.ix_(known, known)] = self.km[np.ix_(index[known], index[known])]
+        np.fill_diagonal(result, 0)
+        return result
+
+    def distance(self, source, destination):
+        return float(self.distances([source, destination])[0, 1])
+
+    def stats(self):
+        with self._lock:
+            n = len(self.warehouses)
+            pairs = n * (n - 1)
+            routed = int(self.is_routed.sum())
+            return {
+                'warehouses': n,
+                'pairs': pairs,
+                'routed': routed,
+                'estimated': pairs - routed,
+                'version': self.version,
+                'path': self.path
+            }
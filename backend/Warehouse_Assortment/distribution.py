@@ -0,0 +1,100 @@
+import numpy as np
+
+
+def forecast_products(forecasts, warehouses):
+    """Return every product that appears in the forecasts, in first-seen order"""
+    seen = {}
+    for warehouse in warehouses:
+        for product in forecasts.get(warehouse, {}).get('predictions', {}):
+            seen.setdefault(product, None)
+    return list(seen)
+
+
+def forecasts_to_array(forecasts, products, warehouses):
+    """
+    Convert /forecast responses into dense arrays.
+
+    Args:
+        forecasts (dict): {warehouse: {'predictions': {product: [demand per day]}}}
+        products (list): product order of the first axis
+        warehouses (list): warehouse order of the second axis
+
+    Returns:
+        tuple: (demand, mask) where demand is a (products, warehouses, days)
+            float array, zero-padded to the longest horizon, and mask marks
+            the (product, warehouse) pairs that have a forecast
+    """
+    product_index = {product: i for i, product in enumerate(products)}
+    days = max(
+        (len(values) for w in warehouses for values in forecasts.get(w, {}).get('predictions', {}).values()),
+        default=0
+    )
+
+    demand = np.zeros((len(products), len(warehouses), days))
+    mask = np.zeros((len(products), len(warehouses)), dtype=bool)
+    for w, warehouse in enumerate(warehouses):
+        for product, values in forecasts.get(warehouse, {}).get('predictions', {}).items():
+            p = product_index.get(product)
+            if p is None:
+                continue
+            demand[p, w, :len(values)] = values
+            mask[p, w] = True
+
+    return demand, mask
+
+
+class Distribution:
+    """
+    Stock distribution for a catalog held as (products, warehouses) arrays.
+
+    `required`, `surplus` and `current` are zero where `mask` is False, so
+    they can be summed or fed to the transfer solver directly; to_dict()
+    renders the /optimize-distribution JSON shape from them.
+    """
+
+    def __init__(self, products, warehouses, required, current, mask):
+        self.products = products
+        self.warehouses = warehouses
+        self.required = required
+        self.current = current
+        self.mask = mask
+        self.surplus = current - required
+        self.order_needed = np.maximum(0, required.sum(axis=1) - current.sum(axis=1))
+
+    def to_dict(self):
+        """Return {'requiredStock', 'surplus', 'orderNeeded'} keyed by product and warehouse"""
+        required = self.required.tolist()
+        surplus = self.surplus.tolist()
+        mask = self.mask.tolist()
+        order_needed = self.order_needed.tolist()
+
+        distribution = {'requiredStock': {}, 'surplus': {}, 'orderNeeded': {}}
+        for p, product in enumerate(self.products):
+            columns = [w for w, present in enumerate(mask[p]) if present]
+            distribution['requiredStock'][product] = {self.warehouses[w]: required[p][w] for w in columns}
+            distribution['surplus'][product] = {self.warehouses[w]: surplus[p][w] for w in columns}
+            distribution['orderNeeded'][product] = order_needed[p]
+        return distribution
+
+
+def compute_distribution(demand, stock, products, warehouses, mask=None):
+    """
+    Compute required stock, surplus and order-needed for a whole catalog.
+
+    Args:
+        demand (np.ndarray): (products, warehouses, days) forecast demand
+        stock (np.ndarray): (products, warehouses) current stock
+        products (list): names for the first axis
+        warehouses (list): names for the second axis
+        mask (np.ndarray): optional (products, warehouses) bool array of the
+            pairs to include; excluded pairs count as neither demand nor stock
+
+    Returns:
+        Distribution: the result arrays
+    """
+    if mask is None:
+        mask = np.ones(stock.shape, dtype=bool)
+
+    required = np.where(mask, demand.sum(axis=2), 0)
+    current = np.where(mask, stock, 0)
+    return Distribution(products, warehouses, required, current, mask)
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ForecastCache:
+    """
+    In-process LRU cache of forecast rollouts with a TTL.
+
+    Entries are keyed by warehouse, model version and seed and hold the
+    longest rollout computed so far, so any shorter horizon is served by
+    slicing the cached prefix instead of rerunning the model.
+    """
+
+    def __init__(self, max_entries=128, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, warehouse, days, version, seed):
+        """Return the first `days` rows of a cached rollout, or None on a miss"""
+        key = (warehouse, version, seed)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None or len(entry[1]) < days:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1][:days]
+
+    def put(self, warehouse, version, seed, rollout):
+        """Store a rollout unless a longer one is already cached for the key"""
+        key = (warehouse, version, seed)
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl or len(entry[1]) < len(rollout):
+                entry = (now, rollout)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,243 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from forecasting import forecast_warehouses
+from model_registry import ModelRegistry
+
+
+class PoolBusy(Exception):
+    """Raised when the job queue is full and a forecast cannot be accepted"""
+
+
+class JobTimeout(Exception):
+    """Raised when a forecast job does not finish within its timeout"""
+
+
+# Error a worker reports for a job it dropped or stopped because its deadline passed
+CANCELLED = 'cancelled'
+
+
+def _worker_main(model_dir, max_loaded, warm_up, jobs, results):
+    """Worker process loop: keep a private model registry and run forecast jobs"""
+    registry = ModelRegistry(model_dir, max_loaded=max_loaded)
+    if warm_up:
+        registry.warm_up(None if warm_up == 'all' else warm_up)
+
+    while True:
+        item = jobs.get()
+        if item is None:
+            break
+
+        job_id, deadline, requested, days, seed = item
+        if time.time() > deadline:
+            # The caller has already given up on this job
+            results.put((job_id, None, CANCELLED))
+            continue
+
+        try:
+            rollouts = forecast_warehouses(registry, requested, days, seed, deadline=deadline)
+            results.put((job_id, rollouts, None))
+        except TimeoutError:
+            # Stop as soon as the caller has given up, so the worker is free for the next job
+            results.put((job_id, None, CANCELLED))
+        except Exception as e:
+            results.put((job_id, None, f"{type(e).__name__}: {e}"))
+
+
+class InferencePool:
+    """
+    Pool of worker processes that run forecast rollouts off the request thread.
+
+    Each worker loads its models once through its own ModelRegistry and takes
+    jobs from a bounded queue. submit() fails fast with PoolBusy when the
+    queue is full, and forecast() waits at most `timeout` seconds for a result.
+    A job carries its deadline to the worker, which skips it or stops its
+    rollout once the deadline passes, so a job the caller gave up on does not
+    keep a worker busy. `warm_up` ('all' or a list of warehouses) is preloaded
+    by every worker.
+
+    Processes are started with the spawn method so no framework state (or
+    TensorFlow threads) is inherited from the web process. The pool belongs
+    to the process that created it: every web server process (e.g. each
+    gunicorn worker) that creates one starts its own workers, each loading
+    its own copy of the models.
+    """
+
+    def __init__(self, model_dir, workers=2, max_loaded=8, queue_size=32, timeout=30.0, warm_up=None):
+        self.model_dir = model_dir
+        self.max_loaded = max_loaded
+        self.warm_up = warm_up
+        self.timeout = timeout
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+        self._context = multiprocessing.get_context('spawn')
+        self._jobs = self._context.Queue(queue_size)
+        self._results = self._context.Queue()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._closed = False
+
+        self._processes = [self._start_worker() for _ in range(workers)]
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _start_worker(self):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.model_dir, self.max_loaded, self.warm_up, self._jobs, self._results),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def _ensure_workers(self):
+        """Replace worker processes that have died"""
+        for i, process in enumerate(self._processes):
+            if not process.is_alive():
+                print(f"Inference worker {process.pid} exited with {process.exitcode}, restarting")
+                self._processes[i] = self._start_worker()
+
+    def _collect(self):
+        """Resolve pending futures as results come back from the workers"""
+        while not self._closed:
+            try:
+                job_id, rollouts, error = self._results.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._pending_lock:
+                future = self._pending.pop(job_id, None)
+            if error == CANCELLED:
+                self.cancelled += 1
+                if future is not None:
+                    future.set_exception(JobTimeout('Forecast deadline passed before it finished'))
+                continue
+            if future is None:
+                continue
+
+            if error is None:
+                self.completed += 1
+                future.set_result(rollouts)
+            else:
+                self.failed += 1
+                future.set_exception(RuntimeError(error))
+
+    def submit(self, requested, days, seed, timeout=None, block=False):
+        """
+        Queue a forecast job and return (job_id, Future) without waiting for it.
+        With `block`, wait up to `timeout` seconds for room in the queue
+        instead of failing at once.
+        """
+        self._ensure_workers()
+        timeout = self.timeout if timeout is None else timeout
+        job_id = next(self._ids)
+        future = Future()
+
+        with self._pending_lock:
+            self._pending[job_id] = future
+        try:
+            item = (job_id, time.time() + timeout, list(requested), days, seed)
+            if block:
+                self._jobs.put(item, timeout=max(0, timeout))
+            else:
+                self._jobs.put_nowait(item)
+        except queue.Full:
+            self.discard(job_id)
+            self.rejected += 1
+            raise PoolBusy('Forecast queue is full, try again later')
+
+        return job_id, future
+
+    def discard(self, job_id):
+        """Stop tracking a job; a worker that still gets to it drops it once its deadline passes"""
+        with self._pending_lock:
+            self._pending.pop(job_id, None)
+
+    def wait(self, job_id, future, timeout, limit=None):
+        """
+        Wait up to `timeout` seconds for a submitted job, raising JobTimeout
+        if it takes too long. `limit` is the caller's whole time limit, for the
+        error message, when `timeout` is only what is left of it.
+        """
+        try:
+            return future.result(timeout=max(0, timeout))
+        except FutureTimeoutError:
+            self.discard(job_id)
+            self.timed_out += 1
+            raise JobTimeout(f"Forecast did not finish within {timeout if limit is None else limit:g} seconds")
+
+    def forecast(self, requested, days, seed, timeout=None):
+        """Run a forecast job in the pool and wait for its rollouts"""
+        timeout = self.timeout if timeout is None else timeout
+        job_id, future = self.submit(requested, days, seed, timeout)
+        return self.wait(job_id, future, timeout)
+
+    def forecast_each(self, requested, days, seed, timeout=None):
+        """
+        Spread the warehouses over at most one job per worker, so their
+        rollouts run in parallel without one job per warehouse filling the
+        queue. Every job shares the request's deadline; if one cannot be
+        queued before it, the jobs already queued expire with it.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        requested = list(requested)
+        if not requested:
+            return []
+
+        size = -(-len(requested) // len(self._processes))
+        jobs = []
+        try:
+            for start in range(0, len(requested), size):
+                jobs.append(self.submit(requested[start:start + size], days, seed,
+                                        deadline - time.monotonic(), block=True))
+            results = []
+            for job_id, future in jobs:
+                results += self.wait(job_id, future, deadline - time.monotonic(), timeout)
+            return results
+        except Exception:
+            for job_id, _ in jobs:
+                self.discard(job_id)
+            raise
+
+    def close(self):
+        self._closed = True
+        for _ in self._processes:
+            try:
+                self._jobs.put_nowait(None)
+            except queue.Full:
+                break
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def stats(self):
+        try:
+            queued = self._jobs.qsize()
+        except NotImplementedError:  # macOS
+            queued = None
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            'workers': len(self._processes),
+            'alive': sum(p.is_alive() for p in self._processes),
+            'queued': queued,
+            'pending': pending,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'cancelled': self.cancelled
+        }
@@ -0,0 +1,132 @@
+import glob
+import json
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+class ModelRegistry:
+    """
+    Registry of per-warehouse forecasting models.
+
+    Warehouses are discovered from small JSON metadata files stored next to
+    the pickled models, e.g. model1.json:
+
+        {"warehouse": "Warehouse1", "model_file": "model1.pkl", "features": 24}
+
+    Only the metadata is read up front. Models are unpickled on first use and
+    at most `max_loaded` of them are kept resident, evicting the least
+    recently used one when a new model is loaded.
+    """
+
+    def __init__(self, model_dir, max_loaded=8):
+        self.model_dir = model_dir
+        self.max_loaded = max_loaded
+        self.loads = 0
+        self.evictions = 0
+        self._metadata = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.discover()
+
+    def discover(self):
+        """(Re)read the metadata files in the model directory"""
+        metadata = {}
+        for path in glob.glob(os.path.join(self.model_dir, '*.json')):
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping model metadata {path}: {e}")
+                continue
+
+            if 'warehouse' not in meta or 'features' not in meta:
+                continue
+
+            model_path = os.path.join(self.model_dir, meta.get('model_file', os.path.basename(path)[:-5] + '.pkl'))
+            if 'version' in meta:
+                version = str(meta['version'])
+            else:
+                stat = os.stat(model_path)
+                version = f"{int(stat.st_mtime)}-{stat.st_size}"
+
+            metadata[meta['warehouse']] = {
+                'path': model_path,
+                'features': int(meta['features']),
+                'version': version
+            }
+
+        with self._lock:
+            self._metadata = dict(sorted(metadata.items(), key=lambda item: _natural_key(item[0])))
+            for warehouse in list(self._loaded):
+                if warehouse not in self._metadata:
+                    del self._loaded[warehouse]
+
+    def __contains__(self, warehouse):
+        return warehouse in self._metadata
+
+    def warehouses(self):
+        return list(self._metadata)
+
+    def features(self, warehouse):
+        return self._metadata[warehouse]['features']
+
+    def version(self, warehouse):
+        return self._metadata[warehouse]['version']
+
+    def model_key(self, warehouse):
+        """Identity of the model file a warehouse uses; warehouses sharing a file share a key"""
+        meta = self._metadata[warehouse]
+        return meta['path'], meta['version']
+
+    def get(self, warehouse):
+        """Return the model for a warehouse, loading it if it is not resident"""
+        with self._lock:
+            model = self._loaded.get(warehouse)
+            if model is not None:
+                self._loaded.move_to_end(warehouse)
+                return model
+            meta = self._metadata[warehouse]
+            load_lock = self._load_locks.setdefault(warehouse, threading.Lock())
+
+        # Load outside the registry lock so other warehouses stay available,
+        # while concurrent requests for this warehouse wait for a single load
+        with load_lock:
+            with self._lock:
+                model = self._loaded.get(warehouse)
+            if model is None:
+                with open(meta['path'], 'rb') as f:
+                    model = pickle.load(f)
+
+                with self._lock:
+                    self.loads += 1
+                    self._loaded[warehouse] = model
+                    while len(self._loaded) > self.max_loaded:
+                        self._loaded.popitem(last=False)
+                        self.evictions += 1
+
+        return model
+
+    def warm_up(self, warehouses=None):
+        """Load the given warehouses (default: as many as fit) ahead of the first request"""
+        if warehouses is None:
+            warehouses = self.warehouses()[:self.max_loaded]
+        for warehouse in warehouses:
+            self.get(warehouse)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'warehouses': len(self._metadata),
+                'loaded': list(self._loaded),
+                'max_loaded': self.max_loaded,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,142 @@
+import csv
+import io
+from itertools import islice
+
+from mysql.connector import Error
+
+
+class BulkUpdateFailed(Error):
+    """Raised when a bulk update is rolled back; carries the per-row results"""
+
+    def __init__(self, msg, results):
+        super().__init__(msg=msg)
+        self.results = results
+
+
+def iter_json_rows(payload):
+    """Yield stock rows from a JSON body: a list of rows or {"rows": [...]}"""
+    rows = payload.get('rows', []) if isinstance(payload, dict) else payload
+    if not isinstance(rows, list):
+        raise ValueError('Expected a list of rows')
+    return iter(rows)
+
+
+def iter_csv_rows(stream, encoding='utf-8'):
+    """Yield stock rows from a CSV stream with warehouse,product,quantity columns"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding=encoding, newline=''))
+    missing = {'warehouse', 'product', 'quantity'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+    return reader
+
+
+def parse_row(row):
+    """Validate one row and return (warehouse, product, quantity)"""
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+
+    warehouse = str(row.get('warehouse') or '').strip()
+    product = str(row.get('product') or '').strip()
+    if not warehouse or not product:
+        raise ValueError('Missing warehouse or product')
+
+    quantity = row.get('quantity')
+    try:
+        quantity = int(str(quantity).strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid quantity: {quantity!r}")
+    if quantity < 0:
+        raise ValueError('Quantity cannot be negative')
+
+    return warehouse, product, quantity
+
+
+def _apply_chunk(cursor, updates):
+    """
+    Apply one chunk of {(warehouse, product): quantity} with two multi-row
+    statements and return the set of keys that exist in stock_levels.
+    """
+    keys = list(updates)
+    placeholders = ', '.join(['(%s, %s)'] * len(keys))
+    cursor.execute(
+        f"SELECT warehouse_id, product_id FROM stock_levels "
+        f"WHERE (warehouse_id, product_id) IN ({placeholders}) FOR UPDATE",
+        [value for key in keys for value in key]
+    )
+    existing = {(warehouse, product) for warehouse, product in cursor.fetchall()}
+    if not existing:
+        return existing
+
+    found = [key for key in keys if key in existing]
+    values = ' UNION ALL '.join(
+        ['SELECT %s AS warehouse_id, %s AS product_id, %s AS quantity']
+        + ['SELECT %s, %s, %s'] * (len(found) - 1)
+    )
+    cursor.execute(
+        f"UPDATE stock_levels s JOIN ({values}) v "
+        f"ON s.warehouse_id = v.warehouse_id AND s.product_id = v.product_id "
+        f"SET s.quantity = v.quantity",
+        [value for key in found for value in (key[0], key[1], updates[key])]
+    )
+    return existing
+
+
+def apply_bulk_update(pool, rows, chunk_size=500):
+    """
+    Apply stock rows in chunks inside a single transaction.
+
+    Invalid rows and rows for unknown (warehouse, product) pairs are reported
+    and skipped; the valid rows are committed together. If the database
+    fails mid-way the whole transaction is rolled back and every row that
+    had been applied is reported as failed.
+
+    Returns:
+        tuple: (per-row results, list of applied (warehouse, product, quantity))
+    """
+    results = []
+    applied = []
+    rows = iter(rows)
+
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+
+                # Later rows for the same key win, as they would row by row
+                updates = {}
+                chunk_results = []
+                for row in chunk:
+                    index = len(results) + len(chunk_results)
+                    try:
+                        warehouse, product, quantity = parse_row(row)
+                    except ValueError as e:
+                        chunk_results.append({'row': index, 'status': 'error', 'error': str(e)})
+                        continue
+                    updates[(warehouse, product)] = quantity
+                    chunk_results.append({'row': index, 'status': 'updated', 'key': (warehouse, product)})
+
+                existing = _apply_chunk(cursor, updates) if updates else set()
+
+                for result in chunk_results:
+                    key = result.pop('key', None)
+                    if key is not None and key not in existing:
+                        result['status'] = 'error'
+                        result['error'] = f"Unknown stock entry {key[0]}/{key[1]}"
+                applied.extend((key[0], key[1], updates[key]) for key in updates if key in existing)
+                results.extend(chunk_results)
+
+            connection.commit()
+        except Error as e:
+            connection.rollback()
+            for result in results:
+                if result['status'] == 'updated':
+                    result['status'] = 'error'
+                    result['error'] = f"Transaction rolled back: {e}"
+            raise BulkUpdateFailed(str(e), results)
+        finally:
+            cursor.close()
+
+    return results, applied
@@ -0,0 +1,172 @@
+import threading
+import time
+
+import numpy as np
+
+
+def _reindex(quantities, product_index, warehouse_index, products, warehouses):
+    """Reorder a stock matrix to the given products and warehouses, filling gaps with 0"""
+    result = np.zeros((len(products), len(warehouses)), dtype=np.int64)
+    p_src = np.array([product_index.get(p, -1) for p in products], dtype=np.intp)
+    w_src = np.array([warehouse_index.get(w, -1) for w in warehouses], dtype=np.intp)
+    p_ok, w_ok = p_src >= 0, w_src >= 0
+    result[np.ix_(p_ok, w_ok)] = quantities[np.ix_(p_src[p_ok], w_src[w_ok])]
+    return result
+
+
+class StockSnapshot:
+    """
+    Process-local copy of stock_levels as a dense product x warehouse matrix.
+
+    The snapshot is loaded once through `loader` (which returns
+    (warehouse, product, quantity) rows) and then kept current by the write
+    paths in this process calling set()/apply(). Writes made by other
+    processes are picked up by a periodic refresh, which also counts how many
+    cells had drifted from the database. Every change bumps `version`.
+    """
+
+    def __init__(self, loader, refresh_interval=300):
+        self._loader = loader
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self.loaded_at = None
+        self.refreshes = 0
+        self.last_drift = 0
+
+        self.products = []
+        self.warehouses = []
+        self._product_index = {}
+        self._warehouse_index = {}
+        self.quantities = np.zeros((0, 0), dtype=np.int64)
+
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._writes_during_load = None
+        self._refresher = None
+
+    def _build(self, rows):
+        products, warehouses = {}, {}
+        rows = [(str(w), str(p), int(q)) for w, p, q in rows]
+        for warehouse, product, _ in rows:
+            warehouses.setdefault(warehouse, len(warehouses))
+            products.setdefault(product, len(products))
+
+        quantities = np.zeros((len(products), len(warehouses)), dtype=np.int64)
+        if rows:
+            w_idx = np.fromiter((warehouses[w] for w, _, _ in rows), dtype=np.intp, count=len(rows))
+            p_idx = np.fromiter((products[p] for _, p, _ in rows), dtype=np.intp, count=len(rows))
+            quantities[p_idx, w_idx] = np.fromiter((q for _, _, q in rows), dtype=np.int64, count=len(rows))
+        return products, warehouses, quantities
+
+    def load(self):
+        """Reload the whole snapshot from the database; returns False if that failed"""
+        with self._load_lock:
+            with self._lock:
+                self._writes_during_load = {}
+            try:
+                rows = self._loader()
+            except Exception as e:
+                print(f"Error loading stock snapshot: {e}")
+                with self._lock:
+                    self._writes_during_load = None
+                return False
+
+            products, warehouses, quantities = self._build(rows)
+
+            with self._lock:
+                previous = None
+                if self.loaded_at is not None:
+                    previous = (self._product_index, self._warehouse_index, self.quantities)
+                self._product_index, self._warehouse_index = products, warehouses
+                self.products, self.warehouses = list(products), list(warehouses)
+                self.quantities = quantities
+
+                # Writes committed while the rows were being read may be missing from them
+                pending, self._writes_during_load = self._writes_during_load, None
+                for (warehouse, product), quantity in pending.items():
+                    self._set(warehouse, product, quantity)
+
+                if previous is not None:
+                    self.refreshes += 1
+                    self.last_drift = self._count_drift(previous)
+                self.version += 1
+                self.loaded_at = time.time()
+            return True
+
+    def ensure_loaded(self):
+        """Load the snapshot on first use and start the periodic refresher"""
+        if self.loaded_at is None:
+            self.load()
+        if self.refresh_interval and self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                    self._refresher.start()
+        return self.loaded_at is not None
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.load()
+
+    def _count_drift(self, previous):
+        """Count cells of the new matrix that differ from the previous snapshot"""
+        product_index, warehouse_index, quantities = previous
+        before = _reindex(quantities, product_index, warehouse_index, self.products, self.warehouses)
+        return int(np.count_nonzero(before != self.quantities))
+
+    def _index(self, index, names, key, axis):
+        position = index.get(key)
+        if position is None:
+            position = index[key] = len(names)
+            names.append(key)
+            pad = [(0, 0), (0, 0)]
+            pad[axis] = (0, 1)
+            self.quantities = np.pad(self.quantities, pad)
+        return position
+
+    def _set(self, warehouse, product, quantity):
+        p = self._index(self._product_index, self.products, product, 0)
+        w = self._index(self._warehouse_index, self.warehouses, warehouse, 1)
+        self.quantities[p, w] = quantity
+
+    def set(self, warehouse, product, quantity):
+        """Write-through for a single committed stock change"""
+        self.apply([(warehouse, product, quantity)])
+
+    def apply(self, updates):
+        """Write-through for committed (warehouse, product, quantity) changes"""
+        with self._lock:
+            for warehouse, product, quantity in updates:
+                if self._writes_during_load is not None:
+                    self._writes_during_load[(warehouse, product)] = int(quantity)
+                if self.loaded_at is not None:
+                    self._set(warehouse, product, int(quantity))
+            self.version += 1
+
+    def array(self, products, warehouses):
+        """Return a (len(products), len(warehouses)) copy of the stock, 0 where unknown"""
+        with self._lock:
+            return _reindex(self.quantities, self._product_index, self._warehouse_index, products, warehouses)
+
+    def to_dict(self):
+        """Return the snapshot as {warehouse: {product: quantity}}"""
+        with self._lock:
+            return {
+                warehouse: {
+                    product: int(self.quantities[p, w]) for product, p in self._product_index.items()
+                }
+                for warehouse, w in self._warehouse_index.items()
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'products': len(self.products),
+                'warehouses': len(self.warehouses),
+                'age_seconds': round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+                'refresh_interval': self.refresh_interval,
+                'refreshes': self.refreshes,
+                'last_drift': self.last_drift
+            }
@@ -0,0 +1,44 @@
+import numpy as np
+
+from distance_matrix import DistanceMatrix
+
+LOCATIONS = {'Warehouse1': '28.614,77.209', 'Warehouse2': '19.076,72.878', 'Warehouse3': '12.972,77.595'}
+
+
+class FakeRoutes:
+    """Stands in for the transportation service's route store"""
+
+    def __init__(self):
+        self.km = {}
+
+    def get_many(self, pairs):
+        return {pair: self.km[pair] for pair in pairs if pair in self.km}
+
+
+def test_adding_a_warehouse_keeps_the_other_distances(tmp_path):
+    matrix = DistanceMatrix(str(tmp_path / 'distances.npz'), routed=FakeRoutes())
+    matrix.add({name: LOCATIONS[name] for name in ('Warehouse1', 'Warehouse2')})
+    before = matrix.distance('Warehouse1', 'Warehouse2')
+
+    result = matrix.add(LOCATIONS)
+
+    assert result['added'] == ['Warehouse3'] and result['unchanged'] == ['Warehouse1', 'Warehouse2']
+    assert matrix.distance('Warehouse1', 'Warehouse2') == before
+    assert np.isinf(matrix.distances(['Warehouse1', 'Unknown'])[0, 1])
+
+
+def test_estimated_pairs_pick_up_routed_lanes_at_most_once_per_interval(tmp_path):
+    routes = FakeRoutes()
+    matrix = DistanceMatrix(str(tmp_path / 'distances.npz'), routed=routes)
+    matrix.add(LOCATIONS)
+    assert matrix.refresh_estimated(list(LOCATIONS), min_interval=60) == 0
+    assert matrix.stats()['routed'] == 0
+
+    delhi, mumbai = tuple(matrix.coords[0]), tuple(matrix.coords[1])
+    routes.km[(delhi, mumbai)] = 1415.0
+    assert matrix.refresh_estimated(list(LOCATIONS), min_interval=60) == 0
+
+    matrix.refreshed_at -= 60
+    assert matrix.refresh_estimated(list(LOCATIONS), min_interval=60) == 1
+    assert matrix.distance('Warehouse1', 'Warehouse2') == 1415.0
+    assert DistanceMatrix(matrix.path, routed=routes).distance('Warehouse1', 'Warehouse2') == 1415.0
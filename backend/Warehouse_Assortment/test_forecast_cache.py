@@ -0,0 +1,53 @@
+import functools
+import types
+
+import numpy as np
+
+from forecast_cache import ForecastCache
+from forecasting import forecast_batch, seeded_rng
+
+
+def job(warehouse, days, seed=0):
+    model = types.SimpleNamespace(predict_on_batch=functools.partial(np.mean, axis=1))
+    return {'model': model, 'features': 5, 'model_key': ('model.pkl', 1), 'days': days,
+            'rng': seeded_rng(seed, warehouse)}
+
+
+def test_cached_longer_horizon_serves_an_exact_shorter_forecast():
+    cache = ForecastCache()
+    [rollout] = forecast_batch([job('Warehouse1', 40)])
+    cache.put('Warehouse1', 'v1', 0, rollout)
+
+    [direct] = forecast_batch([job('Warehouse1', 10)])
+
+    np.testing.assert_array_equal(cache.get('Warehouse1', 10, 'v1', 0), direct)
+    assert cache.stats()['hits'] == 1
+
+
+def test_shorter_rollout_does_not_replace_a_longer_one():
+    cache = ForecastCache()
+    long_rollout, short_rollout = forecast_batch([job('Warehouse1', 40), job('Warehouse1', 20)])
+    cache.put('Warehouse1', 'v1', 0, long_rollout)
+    cache.put('Warehouse1', 'v1', 0, short_rollout)
+
+    assert len(cache.get('Warehouse1', 40, 'v1', 0)) == 40
+
+
+def test_longer_horizon_version_or_seed_is_a_miss():
+    cache = ForecastCache()
+    [rollout] = forecast_batch([job('Warehouse1', 20)])
+    cache.put('Warehouse1', 'v1', 0, rollout)
+
+    assert cache.get('Warehouse1', 30, 'v1', 0) is None
+    assert cache.get('Warehouse1', 10, 'v2', 0) is None
+    assert cache.get('Warehouse1', 10, 'v1', 1) is None
+    assert cache.stats()['misses'] == 3
+
+
+def test_expired_entries_are_misses():
+    cache = ForecastCache(ttl=-1)
+    [rollout] = forecast_batch([job('Warehouse1', 10)])
+    cache.put('Warehouse1', 'v1', 0, rollout)
+
+    assert cache.get('Warehouse1', 10, 'v1', 0) is None
+    assert cache.stats()['entries'] == 0
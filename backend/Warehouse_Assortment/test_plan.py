@@ -0,0 +1,65 @@
+import functools
+import json
+import os
+import pickle
+import tempfile
+import types
+
+import numpy as np
+
+WAREHOUSE_COUNT = 40
+QUEUE_SIZE = 4
+
+_scratch = tempfile.mkdtemp()
+os.environ.setdefault('MODEL_DIR', os.path.join(_scratch, 'models'))
+os.environ.setdefault('INFERENCE_WORKERS', '2')
+os.environ.setdefault('INFERENCE_QUEUE_SIZE', str(QUEUE_SIZE))
+os.environ.setdefault('DISTANCE_MATRIX_PATH', os.path.join(_scratch, 'warehouse_distances.npz'))
+os.environ.setdefault('WAREHOUSE_LOCATIONS_FILE', os.path.join(_scratch, 'warehouse_locations.json'))
+os.environ.setdefault('TRANSPORT_STORE_PATH', os.path.join(_scratch, 'local_cache.sqlite3'))
+
+# Spawned inference workers unpickle these models, so they are built only
+# from importable numpy callables rather than classes defined in this file
+os.makedirs(os.environ['MODEL_DIR'], exist_ok=True)
+for i in range(1, WAREHOUSE_COUNT + 1):
+    with open(os.path.join(os.environ['MODEL_DIR'], f"model{i}.pkl"), 'wb') as f:
+        pickle.dump(types.SimpleNamespace(predict_on_batch=functools.partial(np.mean, axis=1)), f)
+    with open(os.path.join(os.environ['MODEL_DIR'], f"model{i}.json"), 'w') as f:
+        json.dump({'warehouse': f"Warehouse{i}", 'model_file': f"model{i}.pkl", 'features': 5, 'version': 1}, f)
+
+import pytest  # noqa: E402
+
+import app  # noqa: E402
+from stock_snapshot import StockSnapshot  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def client():
+    app.stock_snapshot = StockSnapshot(
+        lambda: [(w, p, 100) for w in app.warehouses for p in app.products]
+    )
+    yield app.app.test_client()
+    if app._inference_pool is not None:
+        app._inference_pool.close()
+
+
+def test_plan_forecasts_more_warehouses_than_the_queue_holds(client):
+    assert len(app.warehouses) > QUEUE_SIZE
+
+    response = client.post('/plan', json={'days': 10})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    plan = json.loads(response.get_data(as_text=True))
+    assert set(plan['requiredStock'][app.products[0]]) == set(app.warehouses)
+    stats = app.get_inference_pool().stats()
+    assert stats['rejected'] == 0
+    assert stats['completed'] <= stats['workers']
+
+
+def test_pool_rollouts_match_inline_rollouts(client):
+    pooled = app.run_forecasts(app.warehouses, 10, seed=7)
+    inline = app.forecast_warehouses(app.model_registry, app.warehouses, 10, 7)
+
+    assert len(pooled) == len(app.warehouses)
+    for a, b in zip(pooled, inline):
+        np.testing.assert_allclose(a, b)
@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+
+import pytest
+from mysql.connector import Error
+
+from stock_bulk import BulkUpdateFailed, apply_bulk_update
+
+
+class FakeDatabase:
+    """stock_levels in a dict, understanding just the two statements _apply_chunk sends"""
+
+    def __init__(self, stock, fail_at=None):
+        self.stock = dict(stock)
+        self.pending = {}
+        self.statements = []
+        self.fail_at = fail_at
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.stock.update(self.pending)
+        self.pending.clear()
+
+    def rollback(self):
+        self.pending.clear()
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, params):
+        self.db.statements.append((sql.split()[0], len(params)))
+        if self.db.fail_at == len(self.db.statements):
+            raise Error(msg='Lost connection to MySQL server')
+        if sql.startswith('SELECT'):
+            self.rows = [key for key in zip(params[::2], params[1::2]) if key in self.db.stock]
+        else:
+            self.db.pending.update(((w, p), q) for w, p, q in zip(params[::3], params[1::3], params[2::3]))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+STOCK = {(f"Warehouse{w}", f"Product_{p}"): 0 for w in range(1, 3) for p in range(4)}
+
+
+def row(warehouse, product, quantity):
+    return {'warehouse': f"Warehouse{warehouse}", 'product': f"Product_{product}", 'quantity': quantity}
+
+
+def test_rows_keep_their_numbers_across_chunks():
+    db = FakeDatabase(STOCK)
+    rows = [row(1, 0, 5), row(1, 1, 6), row(1, 2, 7),
+            row(1, 3, 8), {'warehouse': 'Warehouse1'}, row(9, 0, 1),
+            row(2, 0, 9)]
+
+    results, applied = apply_bulk_update(db, rows, chunk_size=3)
+
+    assert [result['row'] for result in results] == list(range(7))
+    assert [result['status'] for result in results] == ['updated'] * 4 + ['error'] * 2 + ['updated']
+    assert 'Unknown stock entry Warehouse9/Product_0' in results[5]['error']
+    assert len(applied) == 5
+    assert db.stock[('Warehouse2', 'Product_0')] == 9
+
+
+def test_chunk_size_dividing_the_rows_sends_no_empty_chunk():
+    db = FakeDatabase(STOCK)
+    rows = [row(w, p, 1) for w in (1, 2) for p in range(3)]
+
+    apply_bulk_update(db, rows, chunk_size=3)
+
+    assert db.statements == [('SELECT', 6), ('UPDATE', 9)] * 2
+
+
+def test_later_row_wins_within_and_across_chunks():
+    db = FakeDatabase(STOCK)
+    rows = [row(1, 0, 1), row(1, 0, 2), row(1, 1, 3), row(1, 0, 4)]
+
+    apply_bulk_update(db, rows, chunk_size=3)
+
+    assert db.stock[('Warehouse1', 'Product_0')] == 4
+    assert db.stock[('Warehouse1', 'Product_1')] == 3
+
+
+def test_failure_in_a_later_chunk_rolls_back_the_earlier_ones():
+    db = FakeDatabase(STOCK, fail_at=3)
+    rows = [row(1, p, 7) for p in range(4)] + [{'warehouse': 'Warehouse1'}]
+
+    with pytest.raises(BulkUpdateFailed) as failure:
+        apply_bulk_update(db, rows, chunk_size=2)
+
+    assert db.stock == STOCK
+    assert [result['status'] for result in failure.value.results] == ['error', 'error']
+    assert all('rolled back' in result['error'] for result in failure.value.results)
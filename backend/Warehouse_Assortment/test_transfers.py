@@ -0,0 +1,100 @@
+import types
+
+import numpy as np
+import pytest
+
+import transfers
+from transfers import solve_transfers
+
+INF = np.inf
+
+
+def totals(plan, shape):
+    """(shipped out, received) per (product, warehouse) for a plan"""
+    product, source, destination, quantity = plan
+    shipped, received = np.zeros(shape), np.zeros(shape)
+    np.add.at(shipped, (product, source), quantity)
+    np.add.at(received, (product, destination), quantity)
+    return shipped, received
+
+
+def plan_cost(plan, cost):
+    _, source, destination, quantity = plan
+    return float((cost[source, destination] * quantity).sum())
+
+
+def random_problem(seed, products=6, warehouses=7):
+    rng = np.random.default_rng(seed)
+    surplus = rng.integers(-40, 40, (products, warehouses)).astype(float)
+    cost = rng.uniform(1, 20, (warehouses, warehouses))
+    np.fill_diagonal(cost, 0)
+    return surplus, cost
+
+
+@pytest.mark.parametrize('method', transfers.TRANSFER_SOLVERS)
+@pytest.mark.parametrize('seed', range(5))
+def test_plan_stays_within_supply_and_demand(method, seed):
+    surplus, cost = random_problem(seed)
+    plan = solve_transfers(surplus, cost, method)
+
+    shipped, received = totals(plan, surplus.shape)
+    assert (plan[3] > 0).all()
+    assert (plan[1] != plan[2]).all()
+    assert (shipped <= np.maximum(surplus, 0) + 1e-6).all()
+    assert (received <= np.maximum(-surplus, 0) + 1e-6).all()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_exact_moves_all_it_can_and_costs_no_more_than_greedy(seed):
+    surplus, cost = random_problem(seed)
+    exact = solve_transfers(surplus, cost, 'exact')
+    greedy = solve_transfers(surplus, cost, 'greedy')
+
+    # Every lane exists, so each product moves min(total supply, total shortfall)
+    expected = np.minimum(np.maximum(surplus, 0).sum(axis=1), np.maximum(-surplus, 0).sum(axis=1))
+    moved = np.bincount(exact[0], weights=exact[3], minlength=len(surplus))
+    np.testing.assert_allclose(moved, expected)
+    assert plan_cost(exact, cost) <= plan_cost(greedy, cost) + 1e-6
+
+
+def test_exact_finds_more_flow_than_cheapest_first_on_sparse_lanes():
+    # A's cheapest lane goes to C, which is B's only lane
+    cost = np.array([
+        [0, INF, 1, 5],
+        [INF, 0, 5, INF],
+        [INF, INF, 0, INF],
+        [INF, INF, INF, 0],
+    ])
+    surplus = np.array([[1.0, 1.0, -1.0, -1.0]])
+
+    exact = solve_transfers(surplus, cost, 'exact')
+    greedy = solve_transfers(surplus, cost, 'greedy')
+
+    assert exact[3].sum() == pytest.approx(2)
+    assert greedy[3].sum() == pytest.approx(1)
+    assert sorted(zip(exact[1].tolist(), exact[2].tolist())) == [(0, 3), (1, 2)]
+
+
+def test_blocks_hitting_the_time_limit_fall_back_to_greedy(monkeypatch):
+    surplus, cost = random_problem(0)
+    monkeypatch.setattr(transfers, 'linprog', lambda *args, **kwargs: types.SimpleNamespace(
+        status=1, message='Time limit reached'
+    ))
+
+    plan = solve_transfers(surplus, cost, 'exact', time_limit=5)
+    greedy = solve_transfers(surplus, cost, 'greedy')
+
+    for a, b in zip(plan, greedy):
+        np.testing.assert_allclose(np.sort(a), np.sort(b))
+
+
+def test_exhausted_time_limit_skips_the_solver(monkeypatch):
+    surplus, cost = random_problem(1)
+
+    def linprog(*args, **kwargs):
+        raise AssertionError('solver called after the time limit')
+
+    monkeypatch.setattr(transfers, 'linprog', linprog)
+    plan = solve_transfers(surplus, cost, 'exact', time_limit=0)
+
+    assert plan_cost(plan, cost) == pytest.approx(plan_cost(solve_transfers(surplus, cost, 'greedy'), cost))
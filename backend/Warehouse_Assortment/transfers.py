@@ -0,0 +1,171 @@
+import time
+
+import numpy as np
+from scipy.optimize import linprog
+from scipy.sparse import coo_matrix, vstack
+
+TRANSFER_SOLVERS = ('exact', 'greedy')
+
+# Quantities below this are treated as zero in solver output
+EPSILON = 1e-6
+
+
+def _routes(cost):
+    """Mask of usable (source, destination) pairs: finite cost and not a self-transfer"""
+    return np.isfinite(cost) & ~np.eye(len(cost), dtype=bool)
+
+
+def _solve_greedy(supply, demand, cost):
+    """
+    Fill the cheapest routes first for every product at once.
+
+    The cost matrix is shared by all products, so walking the routes in
+    ascending cost order and moving min(supply, demand) along each one
+    is a single vector operation per route over the whole catalog.
+    """
+    supply = supply.copy()
+    demand = demand.copy()
+    routes = _routes(cost)
+    order = [flat for flat in np.argsort(cost, axis=None) if routes.flat[flat]]
+
+    flows = []
+    for flat in order:
+        source, destination = divmod(int(flat), cost.shape[1])
+        quantity = np.minimum(supply[:, source], demand[:, destination])
+        moved = np.nonzero(quantity > EPSILON)[0]
+        if not moved.size:
+            continue
+
+        supply[moved, source] -= quantity[moved]
+        demand[moved, destination] -= quantity[moved]
+        flows.append((
+            moved,
+            np.full(moved.size, source),
+            np.full(moved.size, destination),
+            quantity[moved]
+        ))
+
+    if not flows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    return tuple(np.concatenate(parts) for parts in zip(*flows))
+
+
+def _solve_exact(supply, demand, cost, time_limit=None):
+    """
+    Solve one block of products as a single sparse transportation LP.
+
+    Products are independent, so the LP is block-diagonal and HiGHS solves
+    the whole block at once. Missing lanes (non-finite cost) get no
+    variable. Each unit shipped earns a reward larger than the cost of any
+    augmenting path (at most one lane per warehouse, each no dearer than the
+    dearest finite lane), so the solution moves as much stock as the supply
+    and demand allow and, among those plans, has the lowest total cost.
+
+    Returns None if HiGHS does not finish within `time_limit` seconds.
+    """
+    routes = _routes(cost)
+    product, source, destination = np.nonzero(
+        (supply[:, :, None] > EPSILON) & (demand[:, None, :] > EPSILON) & routes[None]
+    )
+    if not product.size:
+        return product, source, destination, np.empty(0)
+
+    n_vars = product.size
+    columns = np.arange(n_vars)
+    n_warehouses = cost.shape[0]
+
+    supply_rows, supply_row_index = np.unique(product * n_warehouses + source, return_inverse=True)
+    demand_rows, demand_row_index = np.unique(product * n_warehouses + destination, return_inverse=True)
+    ones = np.ones(n_vars)
+    a_ub = vstack([
+        coo_matrix((ones, (supply_row_index, columns)), shape=(supply_rows.size, n_vars)),
+        coo_matrix((ones, (demand_row_index, columns)), shape=(demand_rows.size, n_vars)),
+    ]).tocsr()
+    b_ub = np.concatenate([
+        supply[supply_rows // n_warehouses, supply_rows % n_warehouses],
+        demand[demand_rows // n_warehouses, demand_rows % n_warehouses],
+    ])
+
+    route_cost = cost[source, destination]
+    reward = n_warehouses * max(cost[routes].max(), 0) + 1
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    result = linprog(route_cost - reward, A_ub=a_ub, b_ub=b_ub, bounds=(0, None), method='highs', options=options)
+    if result.status == 1:
+        return None
+    if result.status != 0:
+        raise ValueError(f"Transfer solver failed: {result.message}")
+
+    moved = result.x > EPSILON
+    return product[moved], source[moved], destination[moved], result.x[moved]
+
+
+def solve_transfers(surplus, cost, method='exact', max_block_cells=400_000, time_limit=None):
+    """
+    Plan stock transfers for every product as a transportation problem.
+
+    Args:
+        surplus (np.ndarray): (products, warehouses); positive values are
+            stock that can be shipped out, negative values are shortfalls
+        cost (np.ndarray): (warehouses, warehouses) cost per unit moved,
+            np.inf where there is no route
+        method (str): 'exact' for a cost-optimal plan from a linear program,
+            'greedy' for a fast cheapest-route-first approximation
+        max_block_cells (int): bound on products x warehouses^2 per LP, so
+            large catalogs are solved in blocks of bounded size
+        time_limit (float): seconds the exact solver may spend; a block
+            HiGHS cannot finish in the time left, and any blocks after it,
+            are planned with the greedy method instead
+
+    Both methods never ship more than a warehouse's surplus and move as much
+    of the shortfall as the available surplus covers.
+
+    Returns:
+        tuple: (product, source, destination, quantity) arrays, one entry per
+            transfer, with product/source/destination as indices
+    """
+    if method not in TRANSFER_SOLVERS:
+        raise ValueError(f"Unknown transfer solver: {method}. Choose: {', '.join(TRANSFER_SOLVERS)}")
+
+    supply = np.maximum(surplus, 0).astype(float)
+    demand = np.maximum(-surplus, 0).astype(float)
+
+    # Only products with both spare stock and a shortfall need a plan
+    active = np.nonzero((supply > EPSILON).any(axis=1) & (demand > EPSILON).any(axis=1))[0]
+    if method == 'greedy':
+        product, source, destination, quantity = _solve_greedy(supply[active], demand[active], cost)
+        return active[product], source, destination, quantity
+
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    block = max(1, max_block_cells // max(1, cost.size))
+    parts = []
+    for start in range(0, active.size, block):
+        rows = active[start:start + block]
+        remaining = None if deadline is None else deadline - time.monotonic()
+        plan = None
+        if remaining is None or remaining > 0:
+            plan = _solve_exact(supply[rows], demand[rows], cost, time_limit=remaining)
+        if plan is None:
+            plan = _solve_greedy(supply[rows], demand[rows], cost)
+
+        product, source, destination, quantity = plan
+        parts.append((rows[product], source, destination, quantity))
+
+    if not parts:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    return tuple(np.concatenate(values) for values in zip(*parts))
+
+
+def transfers_to_dict(plan, cost, products, warehouses):
+    """Render a transfer plan as {product: [{'from', 'to', 'quantity', 'cost'}]}"""
+    transfers = {product: [] for product in products}
+    product, source, destination, quantity = plan
+    unit_cost = cost[source, destination]
+    for p, s, d, q, c in zip(product.tolist(), source.tolist(), destination.tolist(),
+                             quantity.tolist(), (unit_cost * quantity).tolist()):
+        transfers[products[p]].append({
+            'from': warehouses[s],
+            'to': warehouses[d],
+            'quantity': q,
+            'cost': c
+        })
+    return transfers